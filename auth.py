@@ -0,0 +1,168 @@
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Стоимость хэширования: scrypt (n, r, p) и число итераций PBKDF2, если scrypt недоступен в OpenSSL
+HASH_PRESETS = {
+    "fast": {"scrypt": (2 ** 12, 8, 1), "pbkdf2_sha256": 100_000},
+    "default": {"scrypt": (2 ** 14, 8, 1), "pbkdf2_sha256": 600_000},
+    "strong": {"scrypt": (2 ** 15, 8, 2), "pbkdf2_sha256": 1_200_000},
+}
+DEFAULT_PRESET = "default"
+SCHEME = "scrypt" if hasattr(hashlib, "scrypt") else "pbkdf2_sha256"
+SALT_SIZE = 16
+KEY_SIZE = 32
+
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r * p, dklen=KEY_SIZE)
+
+
+def _pbkdf2(password, salt, iterations):
+    return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations, KEY_SIZE)
+
+
+def _parameters(preset):
+    value = HASH_PRESETS[preset][SCHEME]
+    return value if SCHEME == "scrypt" else (value,)
+
+
+# Строка вида scrypt$n$r$p$соль$хэш или pbkdf2_sha256$итерации$соль$хэш
+def hash_password(password, preset=DEFAULT_PRESET):
+    salt = os.urandom(SALT_SIZE)
+    parameters = _parameters(preset)
+    if SCHEME == "scrypt":
+        key = _scrypt(password, salt, *parameters)
+    else:
+        key = _pbkdf2(password, salt, *parameters)
+    return "$".join([SCHEME, *map(str, parameters), salt.hex(), key.hex()])
+
+
+# Число полей хэша по схеме: схема, параметры, соль и хэш
+HASH_FIELDS = {"scrypt": 6, "pbkdf2_sha256": 4}
+# Допустимые параметры: за ними — открытый пароль, похожий на хэш, а не хэш
+SCRYPT_MAX_N = 2 ** 20
+PBKDF2_MAX_ITERATIONS = 10_000_000
+
+
+# (схема, параметры, соль, хэш) из строки hash_password или None, если строка не такой хэш
+def parse_hash(stored):
+    fields = stored.split("$")
+    if HASH_FIELDS.get(fields[0]) != len(fields):
+        return None
+    scheme, *parameters, salt, key = fields
+    try:
+        parameters = tuple(int(value) for value in parameters)
+        salt, key = bytes.fromhex(salt), bytes.fromhex(key)
+    except ValueError:
+        return None
+    if scheme == "scrypt":
+        n, r, p = parameters
+        valid = 1 < n <= SCRYPT_MAX_N and n & (n - 1) == 0 and 0 < r <= 32 and 0 < p <= 16
+    else:
+        valid = 0 < parameters[0] <= PBKDF2_MAX_ITERATIONS
+    if not valid or not salt or len(key) != KEY_SIZE:
+        return None
+    return scheme, parameters, salt, key
+
+
+def is_hashed(stored):
+    return parse_hash(stored) is not None
+
+
+def verify_password(password, stored):
+    if not stored:
+        return False
+    parsed = parse_hash(stored)
+    if parsed is None:
+        # Пароль из базы, созданной до хэширования (даже если он начинается с «scrypt$»);
+        # заменяется хэшем при входе
+        return hmac.compare_digest(stored.encode("utf-8"), password.encode("utf-8"))
+    scheme, parameters, salt, key = parsed
+    if scheme == "scrypt":
+        computed = _scrypt(password, salt, *parameters)
+    else:
+        computed = _pbkdf2(password, salt, *parameters)
+    return hmac.compare_digest(computed, key)
+
+
+# Открытый пароль или хэш с другими параметрами пересчитывается после успешного входа
+def needs_rehash(stored, preset=DEFAULT_PRESET):
+    parsed = parse_hash(stored)
+    return parsed is None or parsed[0] != SCHEME or parsed[1] != _parameters(preset)
+
+
+_dummy_hashes = {}
+
+
+# Хэш для несуществующего пользователя: проверка занимает столько же времени, сколько настоящая
+def dummy_hash(preset=DEFAULT_PRESET):
+    if preset not in _dummy_hashes:
+        _dummy_hashes[preset] = hash_password("", preset)
+    return _dummy_hashes[preset]
+
+
+# Кэш успешных проверок: повторный вход с тем же паролем не пересчитывает дорогой хэш.
+# Пароль хранится только в виде HMAC со случайным ключом процесса; смена хэша в базе меняет ключ кэша.
+class AuthCache:
+    def __init__(self, max_entries=256, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._secret = os.urandom(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, password, stored):
+        return stored, hmac.new(self._secret, password.encode("utf-8"), hashlib.sha256).digest()
+
+    def verify(self, password, stored):
+        key = self._key(password, stored)
+        now = time.monotonic()
+        with self._lock:
+            expires = self._entries.get(key)
+            if expires is not None and expires > now:
+                self._entries.move_to_end(key)
+                return True
+        if not verify_password(password, stored):
+            return False
+        with self._lock:
+            self._entries[key] = now + self.ttl
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Ограничение попыток входа: после free_attempts неудач по имени пользователя
+# каждая следующая попытка откладывается вдвое дольше, но не больше max_delay секунд.
+# Имя сравнивается точно, как в users.username. Счётчики живут в памяти процесса и
+# сбрасываются при его перезапуске: это задержка для окна входа, а не защита базы.
+class LoginThrottle:
+    def __init__(self, free_attempts=3, base_delay=1.0, max_delay=300.0):
+        self.free_attempts = free_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._failures = {}
+
+    # Сколько секунд осталось до следующей разрешённой попытки
+    def remaining(self, username):
+        failures, locked_until = self._failures.get(username, (0, 0.0))
+        return max(0.0, locked_until - time.monotonic())
+
+    def failed(self, username):
+        failures, _ = self._failures.get(username, (0, 0.0))
+        failures += 1
+        delay = 0.0
+        if failures > self.free_attempts:
+            delay = min(self.base_delay * 2 ** (failures - self.free_attempts - 1), self.max_delay)
+        self._failures[username] = (failures, time.monotonic() + delay)
+
+    def succeeded(self, username):
+        self._failures.pop(username, None)
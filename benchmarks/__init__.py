@@ -0,0 +1 @@
+# Замеры производительности; запускаются из корня проекта: python -m benchmarks.<модуль>
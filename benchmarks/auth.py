@@ -0,0 +1,42 @@
+import argparse
+import os
+import tempfile
+import time
+
+from auth import HASH_PRESETS, SCHEME
+from main import Database
+
+
+# Входов в секунду для каждого пресета стоимости: без кэша (каждый вход считает хэш) и с кэшем
+def measure(preset, logins):
+    Database.password_preset = preset
+    with tempfile.TemporaryDirectory() as directory:
+        db = Database(os.path.join(directory, "bench.db"))
+        db.register_user("bench", "secret", "Покупатель")
+        started = time.perf_counter()
+        for _ in range(logins):
+            Database.auth_cache.clear()
+            assert db.authenticate_user("bench", "secret")
+        cold = logins / (time.perf_counter() - started)
+        started = time.perf_counter()
+        for _ in range(logins):
+            db.authenticate_user("bench", "secret")
+        cached = logins / (time.perf_counter() - started)
+        db.conn.close()
+    return cold, cached
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Скорость входа при разной стоимости хэширования")
+    parser.add_argument("--logins", type=int, default=20, help="число входов на пресет")
+    parser.add_argument("--presets", nargs="*", default=list(HASH_PRESETS), choices=list(HASH_PRESETS))
+    args = parser.parse_args()
+    print(f"Схема: {SCHEME}")
+    print(f"{'пресет':<10} {'параметры':<22} {'входов/с':>10} {'мс на вход':>11} {'с кэшем/с':>11}")
+    for preset in args.presets:
+        cold, cached = measure(preset, args.logins)
+        print(f"{preset:<10} {str(HASH_PRESETS[preset][SCHEME]):<22} {cold:>10.1f} {1000 / cold:>11.1f} {cached:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.database import timed
+from benchmarks.stats import print_table, summarize
+from benchmarks.synthetic import generate, parse_size
+from columnar import CarCatalog
+from main import Database
+
+FILTERS = {"exclude_owner": 1, "price_min": 500_000, "price_max": 5_000_000, "year_min": 2005,
+           "brands": ["BMW", "Audi", "Toyota"]}
+
+
+# Память под выборку: каталог по колонкам против списка кортежей из fetchall
+def memory(db, use_numpy):
+    tracemalloc.start()
+    catalog = CarCatalog(use_numpy)
+    catalog.load(db)
+    catalog_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    tracemalloc.start()
+    rows = db.list_catalog()
+    rows_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return len(rows), catalog_bytes, rows_bytes
+
+
+def cases(db, catalog, label):
+    return [
+        (f"{label}/select_all_by_id", lambda run: catalog.select()),
+        (f"{label}/select_filtered_by_price", lambda run: catalog.select("price", True, **FILTERS)),
+        (f"{label}/select_all_by_brand", lambda run: catalog.select("brand")),
+        (f"{label}/summary", lambda run: [catalog.summary(exclude_owner=1)]),
+        (f"{label}/histogram_price", lambda run: catalog.histogram("price", 20, **FILTERS)),
+    ]
+
+
+def sql_cases(db):
+    def summary(run):
+        return [db.conn.execute("""
+            SELECT COUNT(*), MIN(price), MAX(price), MIN(year), MAX(year) FROM cars
+            WHERE status = 'available' AND owner_id != 1
+        """).fetchone()]
+
+    return [
+        ("sql/select_all_by_id", lambda run: db.list_cars(limit=10 ** 9)),
+        ("sql/select_filtered_by_price", lambda run: db.list_cars("price", True, None, 10 ** 9, **FILTERS)),
+        ("sql/select_all_by_brand", lambda run: db.list_cars("brand", False, None, 10 ** 9)),
+        ("sql/summary", summary),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Каталог в памяти по колонкам против выборок SQLite")
+    parser.add_argument("--size", type=parse_size, default="100k")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--db", help="готовая база synthetic.py; по умолчанию создаётся временная")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="cars-catalog-") as directory:
+        if args.db:
+            db = Database(args.db, init_schema=False)
+        else:
+            db = generate(os.path.join(directory, "bench.db"), args.size)
+        results = {}
+        for use_numpy in (True, False):
+            catalog = CarCatalog(use_numpy)
+            if use_numpy and catalog.np is None:
+                print("NumPy не установлен: замеряется только вариант на array")
+                continue
+            label = "numpy" if use_numpy else "array"
+            started = time.perf_counter()
+            catalog.load(db)
+            print(f"{label}: загрузка {len(catalog)} автомобилей за {time.perf_counter() - started:.2f} с")
+            for name, fn in cases(db, catalog, label):
+                samples, rows = timed(fn, args.repeat)
+                results[name] = summarize(samples, rows)
+        for name, fn in sql_cases(db):
+            samples, rows = timed(fn, args.repeat)
+            results[name] = summarize(samples, rows)
+        print_table(results)
+        rows, catalog_bytes, rows_bytes = memory(db, True)
+        print(f"Память на {rows} автомобилей: каталог {catalog_bytes / 2 ** 20:.1f} МБ "
+              f"({catalog_bytes / max(rows, 1):.0f} байт на строку), кортежи {rows_bytes / 2 ** 20:.1f} МБ "
+              f"({rows_bytes / max(rows, 1):.0f} байт на строку)")
+        db.conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,264 @@
+import os
+
+# Таблицы заполняются без окна; переменную нужно задать до создания QApplication
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import argparse
+import fnmatch
+import itertools
+import json
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+from PyQt6.QtWidgets import QApplication, QTableView
+
+from benchmarks.stats import compare_with_baseline, print_table, save_baseline, summarize
+from benchmarks.synthetic import PASSWORD, parse_size, scale, generate
+from car_table import CarTableModel
+from main import CarPager, Database, PurchaseError, SearchPager
+from photo_store import StoredPhoto
+from query_cache import CachedDatabase, QueryCache
+from workers import ImmediateRunner
+
+LISTING_COLUMNS = [("Фото", "thumbnail"), ("Марка", "brand", "brand"), ("Модель", "model"), ("Год", "year", "year"),
+                   ("Цена", "price", "price")]
+
+
+def timed(fn, repeat):
+    samples = []
+    rows = 0
+    for run in range(repeat):
+        started = time.perf_counter()
+        result = fn(run)
+        samples.append(time.perf_counter() - started)
+        rows = result if isinstance(result, int) else len(result or ())
+    return samples, rows
+
+
+# Замеры чтения: (имя, функция(run) -> строки или их число, тяжёлый ли замер)
+def read_cases(db, rng, cars):
+    sizes = scale(cars)
+    seller = 1
+    buyer = sizes["sellers"] + 1
+    car_ids = [rng.randint(1, cars) for _ in range(1000)]
+    middle = db.list_cars("price", False, None, 1, price_min=5_000_000)[0]
+    # Первый вход считает хэш, дальше замеряется проверка через кэш
+    db.authenticate_user("seller1", PASSWORD)
+    return [
+        ("get_cars", lambda run: db.get_cars(exclude_owner=seller), True),
+        ("get_user_cars", lambda run: db.get_user_cars(seller), False),
+        ("count_user_cars", lambda run: db.count_user_cars(seller), False),
+        ("list_cars/first_page", lambda run: db.list_cars(limit=256), False),
+        ("list_cars/price_desc", lambda run: db.list_cars("price", True, limit=256), False),
+        ("list_cars/deep_page", lambda run: db.list_cars("price", False, (middle[4], middle[0]), 256), False),
+        ("list_cars/filtered", lambda run: db.list_cars(
+            "year", False, None, 256, price_min=500_000, price_max=3_000_000, brands=["BMW", "Audi"]), False),
+        ("search_cars/prefix", lambda run: db.search_cars("toyo cam", 256), False),
+        ("search_cars/filtered", lambda run: db.search_cars("привод", 256, year_min=2010, sort="price"), False),
+        ("get_car_photos", lambda run: db.get_car_photos(car_ids[run % len(car_ids)]), False),
+        ("get_purchase_history", lambda run: db.get_purchase_history(buyer + run % sizes["buyers"]), False),
+        ("get_seller_stats", lambda run: [db.get_seller_stats(run % sizes["sellers"] + 1)], False),
+        ("get_seller_year_stats", lambda run: db.get_seller_year_stats(run % sizes["sellers"] + 1), False),
+        ("get_brand_stats", lambda run: db.get_brand_stats(), False),
+        ("get_user", lambda run: [db.get_user(f"buyer{run % sizes['buyers'] + 1}")], False),
+        ("authenticate_user/cached", lambda run: [db.authenticate_user("seller1", PASSWORD)], False),
+    ]
+
+
+# Проход всей выдачи страницами по полю, где у части автомобилей NULL: страницы не должны
+# обрываться на границе строк с NULL и строк со значением. NULL ставятся в копии базы, когда
+# до этих замеров доходит очередь, — остальные замеры идут по тем же данным, что и в сохранённых
+# результатах.
+def null_sort_cases(db, directory):
+    db_name = os.path.join(directory, "nulls.db")
+    target = sqlite3.connect(db_name)
+    db.conn.backup(target)
+    target.close()
+    nulls = Database(db_name, init_schema=False)
+    with nulls.conn:
+        nulls.conn.execute("UPDATE cars SET price = NULL WHERE id % 10 = 0")
+        nulls.conn.execute("UPDATE cars SET year = NULL WHERE id % 10 = 5")
+    total = nulls.conn.execute("SELECT COUNT(*) FROM cars WHERE status = 'available'").fetchone()[0]
+
+    def walk(sort, descending):
+        def run(_):
+            rows, after = 0, None
+            while True:
+                page = nulls.list_cars(sort, descending, after, 256, fields=("id", sort))
+                if not page:
+                    break
+                rows += len(page)
+                after = (getattr(page[-1], sort), page[-1].id)
+            if rows != total:
+                raise RuntimeError(f"list_cars по {sort}: пройдено {rows} автомобилей из {total}")
+            return rows
+        return run
+
+    yield "list_cars/walk_null_price", walk("price", False), True
+    yield "list_cars/walk_null_price_desc", walk("price", True), True
+    yield "list_cars/walk_null_year_desc", walk("year", True), True
+
+
+# Замеры записи: каждый прогон меняет другую строку
+def write_cases(db, rng, cars):
+    targets = rng.sample(range(1, cars + 1), min(cars, 3000))
+    photo = StoredPhoto("00/00/bench.jpg", "0" * 64, 1024, 768)
+
+    # Свои строки для обновления, удаления и покупки; на маленькой базе номера повторяются
+    def target(group, run):
+        return targets[(group * 1000 + run) % len(targets)]
+
+    # На маленькой базе автомобиль может оказаться уже проданным
+    def buy(run):
+        try:
+            db.buy_car(target(2, run), scale(cars)["sellers"] + 1)
+        except PurchaseError:
+            pass
+        return 1
+
+    def batch(run):
+        return [("Toyota", "Camry", 2020, 1_500_000.0, "импорт", []) for _ in range(1000)]
+
+    # Переоценка до 300 автомобилей продавца: одним UPDATE и по одному автомобилю, как до update_cars
+    stock = [row[0] for row in db.conn.execute(
+        "SELECT id FROM cars WHERE owner_id = 1 AND status = 'available' AND price IS NOT NULL ORDER BY id LIMIT 300")]
+
+    def reprice_one_by_one(run):
+        for car_id, price in db.conn.execute(
+                "SELECT id, price FROM cars WHERE id IN (SELECT value FROM json_each(?))", (json.dumps(stock),)
+        ).fetchall():
+            db.update_car(car_id, price=round(price * 0.99, 2))
+        return len(stock)
+
+    return [
+        ("add_car", lambda run: [db.add_car("Kia", "Rio", 2020, 900_000.0, "новый", 1)]),
+        ("update_car", lambda run: [db.update_car(target(0, run), "BMW", "X5", 2019, 4_000_000.0, "изменён")]),
+        ("update_car/price", lambda run: [db.update_car(target(0, run), price=3_900_000.0)]),
+        ("update_cars/reprice", lambda run: db.update_cars(stock, 1, 0.99)),
+        ("update_car/reprice_one_by_one", reprice_one_by_one),
+        ("add_photos", lambda run: [db.add_photos(target(0, run), [photo, photo])]),
+        ("delete_car", lambda run: [db.delete_car(target(1, run))]),
+        ("buy_car", buy),
+        ("add_cars_batches/1000", lambda run: db.add_cars_batches([batch(run)], 1)),
+    ]
+
+
+# Те же выборки через кэш (query_cache): повтор без изменений и повтор после записи
+def cache_cases(db, cache, rng, cars):
+    cached = CachedDatabase(db, cache)
+    seller = 1
+    targets = rng.sample(range(1, cars + 1), min(cars, 1000))
+
+    def after_write(run):
+        cached.update_car(targets[run % len(targets)], "BMW", "X5", 2019, 4_000_000.0, "изменён")
+        return cached.list_cars(limit=256)
+
+    return [
+        ("cache/get_user_cars", lambda run: cached.get_user_cars(seller), False),
+        ("cache/list_cars/first_page", lambda run: cached.list_cars(limit=256), False),
+        ("cache/search_cars/prefix", lambda run: cached.search_cars("toyo cam", 256), False),
+        ("cache/list_cars/after_write", after_write, False),
+    ]
+
+
+# Заполнение QTableView через CarTableModel: первая страница и прокрутка на pages страниц
+def table_cases(db, app, pages=10):
+    runner = ImmediateRunner(db)
+
+    def populate(source_factory):
+        def run(_):
+            model = CarTableModel(runner, LISTING_COLUMNS, ["Купить"])
+            view = QTableView()
+            view.setModel(model)
+            view.resize(800, 600)
+            view.show()
+            model.set_source(source_factory())
+            for _ in range(pages - 1):
+                model.fetchMore()
+            app.processEvents()
+            rows = model.rowCount()
+            view.deleteLater()
+            app.processEvents()
+            return rows
+        return run
+
+    return [
+        ("table/list_cars", populate(lambda: CarPager()), False),
+        ("table/list_cars_by_price", populate(lambda: CarPager("price", True)), False),
+        ("table/search", populate(lambda: SearchPager("toyota")), False),
+    ]
+
+
+def selected(name, only, skip):
+    if only and not any(fnmatch.fnmatch(name, pattern) for pattern in only):
+        return False
+    return not any(fnmatch.fnmatch(name, pattern) for pattern in skip)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры методов Database на синтетических данных")
+    parser.add_argument("--size", type=parse_size, default="100k",
+                        help="число автомобилей: 1k, 10k, 100k, 1m, 10m или число")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=50, help="прогонов на замер")
+    parser.add_argument("--db", help="готовая база synthetic.py; по умолчанию создаётся временная")
+    parser.add_argument("--only", nargs="*", default=[], help="шаблоны имён замеров")
+    parser.add_argument("--skip", nargs="*", default=[], help="шаблоны имён пропускаемых замеров")
+    parser.add_argument("--baseline", help="JSON с прежними результатами для сравнения")
+    parser.add_argument("--save-baseline", help="сохранить результаты в JSON")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="допустимое замедление p50, доля")
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv[:1])
+    directory = tempfile.mkdtemp(prefix="cars-bench-")
+    try:
+        db_name = os.path.join(directory, "bench.db")
+        if args.db:
+            # Замеры записи меняют базу, поэтому работают с копией
+            shutil.copyfile(args.db, db_name)
+            db = Database(db_name)
+            cars = db.conn.execute("SELECT MAX(id) FROM cars").fetchone()[0]
+        else:
+            started = time.perf_counter()
+            db = generate(db_name, args.size, args.seed)
+            cars = args.size
+            print(f"Сгенерировано {cars} автомобилей за {time.perf_counter() - started:.1f} с")
+
+        rng = random.Random(args.seed)
+        results = {}
+        heavy_repeat = max(3, args.repeat // 10)
+        cache = QueryCache()
+        cases = read_cases(db, rng, cars) + cache_cases(db, cache, rng, cars) + table_cases(db, app)
+        cases += [(name, fn, False) for name, fn in write_cases(db, rng, cars)]
+        # Последними: копия базы с NULL делается, только когда до них дошла очередь
+        for name, fn, heavy in itertools.chain(cases, null_sort_cases(db, directory)):
+            if not selected(name, args.only, args.skip):
+                continue
+            repeat = heavy_repeat if heavy else args.repeat
+            samples, rows = timed(fn, min(repeat, 1000))
+            results[name] = summarize(samples, rows)
+        print_table(results)
+        if cache.hits or cache.misses:
+            print(f"Кэш выборок: {cache.stats()}")
+
+        meta = {"size": cars, "seed": args.seed, "repeat": args.repeat,
+                "sqlite": sqlite3.sqlite_version, "python": sys.version.split()[0]}
+        if args.save_baseline:
+            save_baseline(args.save_baseline, results, meta)
+        if args.baseline:
+            print()
+            regressions = compare_with_baseline(args.baseline, results, args.tolerance)
+            if regressions:
+                print(f"\nРегрессии: {', '.join(regressions)}")
+                return 1
+        return 0
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
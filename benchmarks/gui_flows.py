@@ -0,0 +1,261 @@
+import os
+
+# Окна работают без экрана; переменную нужно задать до создания QApplication
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import argparse
+import csv
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from unittest import mock
+
+from PyQt6.QtTest import QTest
+from PyQt6.QtWidgets import QApplication, QFileDialog, QMessageBox
+
+import main as app_main
+from benchmarks.stats import compare_with_baseline, print_table, save_baseline, summarize
+from benchmarks.synthetic import BRANDS, PASSWORD, generate, parse_size
+
+# Бюджеты сценариев на базе 10k: (мс на прогон, МБ пика памяти Python). Память считает
+# tracemalloc, то есть объекты Python; память Qt и SQLite в неё не входит.
+BUDGETS = {
+    "seller_login": (1000, 5),
+    "seller_add_car": (500, 2),
+    "seller_export": (1000, 5),
+    "buyer_login": (1000, 10),
+    "buyer_search": (1000, 5),
+    "buyer_buy_car": (500, 2),
+}
+# Сколько ждать результата сценария, прежде чем признать его зависшим
+TIMEOUT = 30
+
+
+class FlowFailed(Exception):
+    pass
+
+
+def check(condition, message):
+    if not condition:
+        raise FlowFailed(message)
+
+
+# Сценарии работы с окном: вход, поиск, покупка, добавление и выгрузка. Действия вызываются
+# так же, как их вызывают кнопки, модальные окна подменяются ответами. Результат каждого
+# сценария проверяется по базе отдельным соединением.
+class Flows:
+    def __init__(self, db_name, directory):
+        self.directory = directory
+        self.window = app_main.MainWindow(db_name)
+        self.window.show()
+        self.conn = sqlite3.connect(db_name)
+        self.number = 0
+
+    def close(self):
+        self.window.close()
+        self.conn.close()
+
+    def wait(self, condition, what):
+        deadline = time.perf_counter() + TIMEOUT
+        while not condition():
+            if time.perf_counter() > deadline:
+                raise FlowFailed(f"не дождались: {what}")
+            QTest.qWait(2)
+
+    def scalar(self, sql, *params):
+        return self.conn.execute(sql, params).fetchone()[0]
+
+    def table_ids(self, model):
+        return [model.car_id(row) for row in range(model.rowCount())]
+
+    def login(self, username, role):
+        if self.window.dashboard is not None:
+            self.window.dashboard.logout()
+        login_window = self.window.login_window
+        login_window.username_input.setText(username)
+        login_window.password_input.setText(PASSWORD)
+        login_window.login()
+        self.wait(lambda: self.window.stacked_widget.currentWidget() is self.window.dashboard, "панель после входа")
+        dashboard = self.window.dashboard
+        check(dashboard.role == role, f"роль {dashboard.role!r} вместо {role!r}")
+        return dashboard
+
+    def seller_login(self):
+        dashboard = self.login("seller1", "Продавец")
+        model = dashboard.my_cars_model
+        self.wait(lambda: model.rowCount() > 0, "автомобили продавца")
+        ids = self.table_ids(model)
+        mine = self.scalar(f"SELECT COUNT(*) FROM cars WHERE id IN ({','.join('?' * len(ids))})"
+                           " AND owner_id = ? AND status = 'available'", *ids, dashboard.user_id)
+        check(mine == len(ids), f"в таблице продавца {len(ids) - mine} чужих или проданных автомобилей")
+
+    def seller_add_car(self):
+        dashboard = self.window.dashboard
+        model = dashboard.my_cars_model
+        self.number += 1
+        name = f"Сценарий {self.number}"
+
+        def fill(dialog):
+            for field, value in (("brand", "Toyota"), ("model", name), ("year", "2020"), ("price", "1500000")):
+                dialog.inputs[field].setText(value)
+            dialog.accept()
+            return dialog.result()
+
+        with mock.patch.object(app_main.CarEditorDialog, "exec", fill), \
+                mock.patch.object(QFileDialog, "exec", lambda dialog: 0):
+            dashboard.add_car()
+            car_id = None
+
+            def added():
+                nonlocal car_id
+                car_id = self.conn.execute("SELECT id FROM cars WHERE model = ?", (name,)).fetchone()
+                return car_id is not None and car_id[0] in self.table_ids(model)
+
+            self.wait(added, "новый автомобиль в таблице продавца")
+        check(self.scalar("SELECT owner_id FROM cars WHERE id = ?", car_id[0]) == dashboard.user_id,
+              "автомобиль добавлен другому продавцу")
+
+    def seller_export(self):
+        dashboard = self.window.dashboard
+        self.number += 1
+        filename = os.path.join(self.directory, f"export-{self.number}.csv")
+        messages = []
+        with mock.patch.object(QFileDialog, "getSaveFileName", lambda *args: (filename, "")), \
+                mock.patch.object(QMessageBox, "information", lambda *args: messages.append(args[2])), \
+                mock.patch.object(QMessageBox, "warning", lambda *args: messages.append(args[2])):
+            dashboard.export_cars("csv", "CSV Files (*.csv)")
+            self.wait(lambda: messages, "окончание выгрузки")
+        check(os.path.exists(filename), f"выгрузка не создана: {messages[0]}")
+        with open(filename, newline="", encoding="utf-8-sig") as f:
+            rows = sum(1 for _ in csv.reader(f, delimiter=";")) - 1
+        expected = self.scalar("SELECT COUNT(*) FROM cars WHERE owner_id = ? AND status = 'available'",
+                               dashboard.user_id)
+        check(rows == expected, f"выгружено {rows} автомобилей из {expected}")
+
+    def buyer_login(self):
+        dashboard = self.login("buyer1", "Покупатель")
+        model = dashboard.cars_model
+        self.wait(lambda: model.rowCount() > 0, "каталог покупателя")
+        ids = self.table_ids(model)
+        available = self.scalar(f"SELECT COUNT(*) FROM cars WHERE id IN ({','.join('?' * len(ids))})"
+                                " AND status = 'available'", *ids)
+        check(available == len(ids), f"в каталоге {len(ids) - available} проданных автомобилей")
+
+    def buyer_search(self):
+        dashboard = self.window.dashboard
+        model = dashboard.cars_model
+        self.number += 1
+        brand = list(BRANDS)[self.number % len(BRANDS)]
+
+        def matches():
+            ids = self.table_ids(model)
+            if dashboard.search_timer.isActive() or not ids:
+                return False
+            return self.scalar(f"SELECT COUNT(*) FROM cars WHERE id IN ({','.join('?' * len(ids))})"
+                               " AND brand = ? AND status = 'available'", *ids, brand) == len(ids)
+
+        dashboard.search_input.setText(brand)
+        self.wait(matches, f"результаты поиска «{brand}»")
+
+    def buyer_buy_car(self):
+        dashboard = self.window.dashboard
+        model = dashboard.cars_model
+        car_id = model.car_id(0)
+        with mock.patch.object(QMessageBox, "warning", lambda *args: None):
+            dashboard.buy_car(car_id)
+            self.wait(lambda: car_id not in self.table_ids(model), "проданный автомобиль ушёл из каталога")
+        check(self.scalar("SELECT status FROM cars WHERE id = ?", car_id) == "sold", "автомобиль не продан")
+        check(self.scalar("SELECT buyer_id FROM sales WHERE car_id = ?", car_id) == dashboard.user_id,
+              "продажа записана не на покупателя")
+
+
+# Сценарии по порядку: каждый продолжает с экрана, на котором закончил предыдущий
+FLOWS = ("seller_login", "seller_add_car", "seller_export", "buyer_login", "buyer_search", "buyer_buy_car")
+
+
+# Прогоны всех сценариев по кругу; последний круг — под tracemalloc, только ради пика памяти,
+# потому что слежение за памятью само замедляет Python
+def run_flows(flows, repeat):
+    samples = {name: [] for name in FLOWS}
+    for _ in range(repeat):
+        for name in FLOWS:
+            started = time.perf_counter()
+            getattr(flows, name)()
+            samples[name].append(time.perf_counter() - started)
+    peaks = {}
+    for name in FLOWS:
+        tracemalloc.start()
+        getattr(flows, name)()
+        peaks[name] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return samples, peaks
+
+
+# Сценарии, вышедшие за бюджет времени (p50) или памяти
+def over_budget(results, peaks, scale):
+    failed = []
+    for name, (budget_ms, budget_mb) in BUDGETS.items():
+        p50, peak = results[name]["p50_ms"], peaks[name] / 2 ** 20
+        marker = ""
+        if p50 > budget_ms * scale or peak > budget_mb * scale:
+            failed.append(name)
+            marker = "  ПРЕВЫШЕН"
+        print(f"{name:<34} {p50:>8.0f} / {budget_ms * scale:.0f} мс {peak:>8.1f} / {budget_mb * scale:.0f} МБ{marker}")
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сценарии работы с окном на синтетической базе: время, память, проверки")
+    parser.add_argument("--size", type=parse_size, default="10k",
+                        help="число автомобилей: 1k, 10k, 100k, 1m, 10m или число")
+    parser.add_argument("--repeat", type=int, default=5, help="кругов сценариев для замера времени")
+    parser.add_argument("--db", help="готовая база synthetic.py; по умолчанию создаётся временная")
+    parser.add_argument("--budget-scale", type=float, default=1.0,
+                        help="множитель бюджетов: для медленной машины или базы больше 10k")
+    parser.add_argument("--baseline", help="JSON с прежними результатами для сравнения")
+    parser.add_argument("--save-baseline", help="сохранить результаты в JSON")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="допустимое замедление p50, доля: сценарии с окнами шумнее замеров базы")
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv[:1])
+    directory = tempfile.mkdtemp(prefix="cars-flows-")
+    try:
+        db_name = os.path.join(directory, "cars.db")
+        if args.db:
+            # Сценарии покупают и добавляют автомобили, поэтому работают с копией
+            shutil.copyfile(args.db, db_name)
+        else:
+            generate(db_name, args.size).conn.close()
+        flows = Flows(db_name, directory)
+        try:
+            samples, peaks = run_flows(flows, args.repeat)
+        except FlowFailed as error:
+            print(f"Сценарий не прошёл: {error}", file=sys.stderr)
+            return 1
+        finally:
+            flows.close()
+
+        results = {name: summarize(samples[name]) for name in FLOWS}
+        print_table(results)
+        print()
+        failed = over_budget(results, peaks, args.budget_scale)
+        meta = {"size": args.size, "repeat": args.repeat, "python": sys.version.split()[0]}
+        if args.save_baseline:
+            save_baseline(args.save_baseline, results, meta)
+        if args.baseline:
+            print()
+            failed += compare_with_baseline(args.baseline, results, args.tolerance)
+        if failed:
+            print(f"\nВне бюджета или медленнее прежнего: {', '.join(failed)}")
+            return 1
+        return 0
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
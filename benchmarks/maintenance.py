@@ -0,0 +1,83 @@
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import maintenance
+from benchmarks.stats import print_table, summarize
+from benchmarks.synthetic import generate, parse_size
+from main import open_database
+
+
+# Длительность шагов обслуживания и задержка записей, которые идут из другого соединения
+# одновременно с ними: обслуживание в фоне не должно останавливать работу с базой
+def steps(db_name, directory):
+    db = open_database(db_name)
+    steps = [
+        ("analyze", lambda: maintenance.analyze(db.conn)),
+        ("incremental_vacuum", lambda: maintenance.incremental_vacuum(db.conn, min_pages=1)),
+        ("backup", lambda: maintenance.backup(db.conn, os.path.join(directory, "backup.db"))),
+    ]
+    results = {}
+    for name, step in steps:
+        writes = []
+        done = threading.Event()
+
+        def writer():
+            other = open_database(db_name)
+            car_ids = [row[0] for row in other.conn.execute("SELECT id FROM cars ORDER BY id LIMIT 100")]
+            number = 0
+            while not done.is_set():
+                started = time.perf_counter()
+                other.update_car(car_ids[number % len(car_ids)], "Bench", "Maintenance", 2020, float(number), "")
+                # Первая запись соединения готовит запросы и в замер не входит
+                if number:
+                    writes.append(time.perf_counter() - started)
+                number += 1
+                time.sleep(0.002)
+            other.conn.close()
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        time.sleep(0.05)
+        started = time.perf_counter()
+        step()
+        results[f"step/{name}"] = summarize([time.perf_counter() - started])
+        done.set()
+        thread.join()
+        results[f"write_during/{name}"] = summarize(writes, 1)
+    db.conn.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Обслуживание базы: длительность шагов и задержка записи во время них")
+    parser.add_argument("--size", type=parse_size, default="100k")
+    parser.add_argument("--delete", type=float, default=0.3, help="доля автомобилей, удаляемых перед сжатием")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="cars-maintenance-") as directory:
+        db = generate(os.path.join(directory, "bench.db"), args.size)
+        started = time.perf_counter()
+        maintenance.vacuum(db.conn)
+        print(f"Полная пересборка файла (VACUUM, main.py maintain --vacuum): {time.perf_counter() - started:.2f} с")
+        with db.conn:
+            # Подряд идущие id освобождают страницы целиком, а не оставляют дыры внутри страниц
+            db.conn.execute("DELETE FROM cars WHERE status = 'available' AND id <= ?", (int(args.size * args.delete),))
+        free = db.conn.execute("PRAGMA freelist_count").fetchone()[0]
+        size = os.path.getsize(db.db_name)
+        print(f"После удаления: {size / 2 ** 20:.1f} МБ, свободных страниц {free}")
+        db.conn.close()
+        print_table(steps(os.path.join(directory, "bench.db"), directory))
+        db = open_database(os.path.join(directory, "bench.db"))
+        db.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        print(f"После сжатия и контрольной точки: {os.path.getsize(db.db_name) / 2 ** 20:.1f} МБ, "
+              f"свободных страниц {db.conn.execute('PRAGMA freelist_count').fetchone()[0]}")
+        db.conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import generate, scale
+from main import Database, PurchaseError
+
+
+# Процесс-покупатель: пытается купить каждый автомобиль из общего списка в своём порядке
+def buyer_process(db_name, buyer_id, car_ids, seed, start, results):
+    db = Database(db_name, init_schema=False)
+    order = list(car_ids)
+    random.Random(seed).shuffle(order)
+    bought = rejected = failed = 0
+    start.wait()
+    started = time.perf_counter()
+    for car_id in order:
+        try:
+            db.buy_car(car_id, buyer_id)
+            bought += 1
+        except PurchaseError:
+            rejected += 1
+        except sqlite3.OperationalError:
+            failed += 1
+    results.put((buyer_id, bought, rejected, failed, time.perf_counter() - started))
+
+
+def check(db_name, car_ids):
+    conn = sqlite3.connect(db_name)
+    placeholders = ", ".join("?" * len(car_ids))
+    doubles = conn.execute(f"""
+        SELECT car_id, COUNT(*) FROM sales WHERE car_id IN ({placeholders})
+        GROUP BY car_id HAVING COUNT(*) > 1
+    """, car_ids).fetchall()
+    sold = conn.execute(f"SELECT COUNT(*) FROM cars WHERE status = 'sold' AND id IN ({placeholders})",
+                        car_ids).fetchone()[0]
+    sales = conn.execute(f"SELECT COUNT(*) FROM sales WHERE car_id IN ({placeholders})", car_ids).fetchone()[0]
+    conn.close()
+    return doubles, sold, sales
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Одновременные покупки из нескольких процессов")
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--cars", type=int, default=500, help="сколько автомобилей разыгрывается")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="cars-stress-") as directory:
+        db_name = os.path.join(directory, "stress.db")
+        db = generate(db_name, max(args.cars * 2, 1000), args.seed)
+        car_ids = [row[0] for row in db.list_cars(limit=args.cars)]
+        first_buyer = scale(max(args.cars * 2, 1000))["sellers"] + 1
+        db.conn.close()
+
+        start = multiprocessing.Event()
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=buyer_process,
+                                    args=(db_name, first_buyer + number, car_ids, args.seed + number, start, results))
+            for number in range(args.processes)
+        ]
+        for process in processes:
+            process.start()
+        started = time.perf_counter()
+        start.set()
+        totals = [results.get() for _ in processes]
+        elapsed = time.perf_counter() - started
+        for process in processes:
+            process.join()
+
+        bought = sum(result[1] for result in totals)
+        attempts = sum(result[1] + result[2] + result[3] for result in totals)
+        failed = sum(result[3] for result in totals)
+        doubles, sold, sales = check(db_name, car_ids)
+        print(f"Процессов: {args.processes}, автомобилей: {len(car_ids)}, попыток: {attempts}")
+        print(f"Куплено: {bought}, отказов «уже продан»: {attempts - bought - failed}, ошибок блокировки: {failed}")
+        print(f"Время: {elapsed:.2f} с, попыток/с: {attempts / elapsed:.0f}, покупок/с: {bought / elapsed:.0f}")
+        ok = not doubles and bought == sold == sales == len(car_ids)
+        print("Двойных продаж нет" if ok else f"ОШИБКА: двойные продажи {doubles[:10]}, "
+                                              f"куплено {bought}, продано {sold}, записей продаж {sales}")
+        return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
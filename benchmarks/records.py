@@ -0,0 +1,88 @@
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import tracemalloc
+
+from benchmarks.database import timed
+from benchmarks.stats import print_table, summarize
+from benchmarks.synthetic import generate, parse_size
+from main import Database, listing_sql
+from records import BUYER_CAR_FIELDS, CAR_FIELDS
+
+PAGE = 100
+ALL = 10 ** 9
+# Сборок текста запроса на один замер: одна занимает микросекунды
+BUILDS = 10_000
+SHAPE = (("status", None), ("exclude_owner", None))
+
+
+# Строки выборки, как их читали до записей: полный набор полей кортежами
+def tuple_rows(conn, limit):
+    return conn.execute(listing_sql(CAR_FIELDS, SHAPE[:1], "price", False, None), ["available", limit]).fetchall()
+
+
+def build_sql(build):
+    for number in range(BUILDS):
+        build(CAR_FIELDS, SHAPE, "price", False, "value")
+    return BUILDS
+
+
+def cases(db, uncached):
+    fields = BUYER_CAR_FIELDS
+    return [
+        ("page/tuples", lambda run: tuple_rows(db.conn, PAGE)),
+        ("page/records", lambda run: db.list_cars("price", limit=PAGE)),
+        ("page/records_buyer", lambda run: db.list_cars("price", limit=PAGE, fields=fields)),
+        ("page/no_statement_cache", lambda run: tuple_rows(uncached, PAGE)),
+        ("all/tuples", lambda run: tuple_rows(db.conn, ALL)),
+        ("all/records", lambda run: db.list_cars("price", limit=ALL)),
+        ("all/records_buyer", lambda run: db.list_cars("price", limit=ALL, fields=fields)),
+        ("sql_text/cached", lambda run: build_sql(listing_sql)),
+        ("sql_text/built", lambda run: build_sql(listing_sql.__wrapped__)),
+    ]
+
+
+# Память под всю выборку: кортежи, записи Car и записи без описания
+def memory(db):
+    results = {}
+    for name, fn in (("кортежи", lambda: tuple_rows(db.conn, ALL)),
+                     ("записи Car", lambda: db.list_cars("price", limit=ALL)),
+                     ("записи покупателя", lambda: db.list_cars("price", limit=ALL, fields=BUYER_CAR_FIELDS))):
+        tracemalloc.start()
+        rows = fn()
+        results[name] = (len(rows), tracemalloc.get_traced_memory()[0])
+        tracemalloc.stop()
+        del rows
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Записи с именованными полями и кэш запросов против кортежей")
+    parser.add_argument("--size", type=parse_size, default="100k")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--db", help="готовая база synthetic.py; по умолчанию создаётся временная")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="cars-records-") as directory:
+        if args.db:
+            db = Database(args.db, init_schema=False)
+        else:
+            db = generate(os.path.join(directory, "bench.db"), args.size)
+        # Соединение без кэша подготовленных запросов: каждый вызов разбирает SQL заново
+        uncached = sqlite3.connect(db.db_name, cached_statements=0)
+        results = {}
+        for name, fn in cases(db, uncached):
+            samples, rows = timed(fn, args.repeat)
+            results[name] = summarize(samples, rows)
+        print_table(results)
+        for name, (rows, size) in memory(db).items():
+            print(f"{name}: {rows} строк, {size / 2 ** 20:.1f} МБ ({size / max(rows, 1):.0f} байт на строку)")
+        uncached.close()
+        db.conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
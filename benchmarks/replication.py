@@ -0,0 +1,122 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.stats import print_table, summarize
+from benchmarks.synthetic import generate, parse_size
+from main import open_database
+from replication import FilePeer, HttpPeer, Replica
+from server import StorageServer
+
+
+# Первая синхронизация: пустая реплика получает всю базу другой, через файл или сервер
+def initial_sync(source, directory, name, serve):
+    target_name = os.path.join(directory, f"{name}.db")
+    replica = Replica(source.conn)
+    server = None
+    if serve:
+        server = StorageServer(("127.0.0.1", 0), lambda: open_database(target_name))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        peer = HttpPeer(f"http://127.0.0.1:{server.server_port}")
+    else:
+        peer = FilePeer(target_name, open_database)
+    try:
+        stats = replica.sync(peer)
+    finally:
+        peer.close()
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+    return stats, peer
+
+
+# Задержка: на реплике A автомобили меняются с заданной частотой, реплика B в своём потоке
+# забирает изменения с интервалом; задержка — от записи в A до применения в B
+def lag(source_name, target_name, updates, rate, interval):
+    written = {}
+    lags = []
+    done = threading.Event()
+
+    def writer():
+        source = open_database(source_name)
+        try:
+            car_ids = [row[0] for row in source.conn.execute("SELECT id FROM cars ORDER BY id LIMIT 100")]
+            for number in range(updates):
+                written[number] = time.perf_counter()
+                source.update_car(car_ids[number % len(car_ids)], "Bench", "Replica", 2020, float(number), "lag")
+                time.sleep(1 / rate)
+        finally:
+            done.set()
+            source.conn.close()
+
+    def syncer():
+        target = open_database(target_name)
+
+        # Цена изменённого автомобиля — номер записи в writer
+        def applied(change):
+            now = time.perf_counter()
+            for car_id in change.car_ids:
+                price = target.conn.execute("SELECT price FROM cars WHERE id = ?", (car_id,)).fetchone()[0]
+                if int(price) in written:
+                    lags.append(now - written.pop(int(price)))
+
+        replica = Replica(target.conn, target.notify)
+        target.listeners.append(applied)
+        peer = FilePeer(source_name, open_database)
+        while True:
+            finished = done.is_set()
+            replica.sync(peer)
+            if finished:
+                break
+            time.sleep(interval)
+        target.conn.close()
+
+    threads = [threading.Thread(target=writer), threading.Thread(target=syncer)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return lags, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Синхронизация двух реплик: пропускная способность и задержка")
+    parser.add_argument("--size", type=parse_size, default="10k")
+    parser.add_argument("--updates", type=int, default=1000, help="изменений на реплике A при замере задержки")
+    parser.add_argument("--rate", type=float, default=200.0, help="изменений в секунду")
+    parser.add_argument("--interval", type=float, default=0.1, help="пауза между обменами реплики B, с")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="cars-replication-") as directory:
+        source = generate(os.path.join(directory, "a.db"), args.size)
+        started = time.perf_counter()
+        Replica(source.conn)
+        entries = source.conn.execute("SELECT COUNT(*) FROM replica_log").fetchone()[0]
+        print(f"Журнал реплики A: {entries} записей за {time.perf_counter() - started:.2f} с")
+
+        results = {}
+        for name, serve in (("file", False), ("http", True)):
+            stats, peer = initial_sync(source, directory, name, serve)
+            results[f"initial/{name}"] = summarize([stats["seconds"]], stats["sent"])
+            if serve:
+                raw = sum(len(json.dumps(list(row), ensure_ascii=False)) for row in
+                          source.conn.execute("SELECT seq, site, clock, tbl, op, row_site, row_id, data FROM replica_log"))
+                print(f"По HTTP отправлено {peer.bytes_sent / 2 ** 20:.1f} МБ сжатыми "
+                      f"(записи в JSON — {raw / 2 ** 20:.1f} МБ), {stats['batches']} пачек")
+
+        lags, seconds = lag(source.db_name, os.path.join(directory, "file.db"), args.updates, args.rate, args.interval)
+        results["lag/file"] = summarize(lags)
+        print_table(results)
+        print(f"Задержка: {len(lags)} изменений за {seconds:.1f} с ({args.rate:.0f}/с), обмен каждые "
+              f"{args.interval * 1000:.0f} мс; p50/p95/p99 в таблице — от записи в A до применения в B")
+        source.conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
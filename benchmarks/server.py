@@ -0,0 +1,105 @@
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.database import timed
+from benchmarks.stats import print_table, summarize
+from benchmarks.synthetic import generate, parse_size, scale
+from main import open_database
+from server import StorageServer
+from storage import RemoteDatabase
+
+
+# Одинаковые запросы к локальной базе и к серверу: цена обращения по HTTP,
+# условных запросов (ETag -> 304) и пакетов вместо отдельных вызовов
+def cases(local, remote, cars):
+    seller = 1
+    sizes = scale(cars)
+    buyer = sizes["sellers"] + 1
+    calls = [("count_user_cars", (seller,), {}), ("get_seller_stats", (seller,), {}),
+             ("get_purchase_history", (buyer,), {"limit": 20}), ("list_cars", (), {"limit": 50})]
+
+    # Запрос без сохранённых ETag: сервер каждый раз выполняет его и отдаёт строки
+    def uncached(fn):
+        def run(number):
+            remote._cached.clear()
+            return fn(number)
+
+        return run
+
+    return [
+        ("local/list_cars", lambda run: local.list_cars(limit=256)),
+        ("remote/list_cars", uncached(lambda run: remote.list_cars(limit=256))),
+        ("remote/list_cars_304", lambda run: remote.list_cars(limit=256)),
+        ("local/4_calls", lambda run: [getattr(local, name)(*args, **kwargs) for name, args, kwargs in calls]),
+        ("remote/4_calls", uncached(lambda run: [remote.call(name, *args, **kwargs)
+                                                 for name, args, kwargs in calls])),
+        ("remote/batch_4_calls", uncached(lambda run: remote.batch(calls))),
+        ("remote/batch_4_calls_304", lambda run: remote.batch(calls)),
+    ]
+
+
+# Несколько клиентов одновременно читают первую страницу и изменяют автомобили
+def concurrent(url, clients, seconds, first_car):
+    counts = [0] * clients
+    stop = threading.Event()
+
+    def client(number):
+        db = RemoteDatabase(url)
+        car_id = first_car + number
+        while not stop.is_set():
+            db.list_cars("price", True, None, 100)
+            if counts[number] % 10 == 0:
+                db.update_car(car_id, "Bench", "Client", 2020, float(counts[number]), "обновлено")
+            counts[number] += 1
+        db.close()
+
+    threads = [threading.Thread(target=client, args=(number,)) for number in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сервер хранилища на localhost против локальной базы")
+    parser.add_argument("--size", type=parse_size, default="10k")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--pool", type=int, default=4, help="соединений с базой на сервере")
+    parser.add_argument("--clients", type=int, default=8, help="одновременных клиентов")
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="cars-server-") as directory:
+        db_name = os.path.join(directory, "bench.db")
+        local = generate(db_name, args.size)
+        server = StorageServer(("127.0.0.1", 0), lambda: open_database(db_name), args.pool)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}"
+        remote = RemoteDatabase(url)
+        try:
+            results = {}
+            for name, fn in cases(local, remote, args.size):
+                samples, rows = timed(fn, args.repeat)
+                results[name] = summarize(samples, rows)
+            print_table(results)
+            rate = concurrent(url, args.clients, args.seconds, first_car=1)
+            print(f"{args.clients} клиентов, {args.pool} соединений: {rate:.0f} запросов/с "
+                  f"(страница из 100 строк, каждый десятый — изменение автомобиля)")
+        finally:
+            remote.close()
+            server.shutdown()
+            server.server_close()
+            local.conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
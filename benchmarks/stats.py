@@ -0,0 +1,56 @@
+import json
+import statistics
+
+
+def percentile(sorted_samples, fraction):
+    if len(sorted_samples) == 1:
+        return sorted_samples[0]
+    position = (len(sorted_samples) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_samples) - 1)
+    return sorted_samples[lower] + (sorted_samples[upper] - sorted_samples[lower]) * (position - lower)
+
+
+# samples — длительности в секундах, rows — строк на один вызов
+def summarize(samples, rows=0):
+    ordered = sorted(samples)
+    mean = statistics.fmean(ordered)
+    return {
+        "runs": len(ordered),
+        "p50_ms": percentile(ordered, 0.50) * 1000,
+        "p95_ms": percentile(ordered, 0.95) * 1000,
+        "p99_ms": percentile(ordered, 0.99) * 1000,
+        "rows": rows,
+        "rows_per_s": rows / mean if rows and mean else 0.0,
+    }
+
+
+def print_table(results):
+    print(f"{'замер':<34} {'p50, мс':>10} {'p95, мс':>10} {'p99, мс':>10} {'строк':>9} {'строк/с':>12}")
+    for name, result in results.items():
+        print(f"{name:<34} {result['p50_ms']:>10.2f} {result['p95_ms']:>10.2f} {result['p99_ms']:>10.2f}"
+              f" {result['rows']:>9} {result['rows_per_s']:>12.0f}")
+
+
+def save_baseline(path, results, meta):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "results": results}, f, ensure_ascii=False, indent=2)
+
+
+# Замедление p50 больше чем на tolerance (доля) считается регрессией.
+# Замеры короче min_ms не сравниваются: их разброс больше самого времени.
+def compare_with_baseline(path, results, tolerance=0.25, min_ms=0.05):
+    with open(path, encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None or max(before["p50_ms"], result["p50_ms"]) < min_ms:
+            continue
+        ratio = result["p50_ms"] / before["p50_ms"] if before["p50_ms"] else float("inf")
+        marker = ""
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            marker = "  РЕГРЕССИЯ"
+        print(f"{name:<34} {before['p50_ms']:>10.2f} -> {result['p50_ms']:>10.2f} мс ({ratio:.2f}x){marker}")
+    return regressions
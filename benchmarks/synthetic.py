@@ -0,0 +1,129 @@
+import argparse
+import os
+import random
+import time
+
+from auth import hash_password
+from main import Database
+
+BRANDS = {
+    "Toyota": ["Camry", "Corolla", "RAV4", "Land Cruiser"],
+    "BMW": ["X5", "X3", "320i", "530d"],
+    "Audi": ["A4", "A6", "Q5", "Q7"],
+    "Лада": ["Веста", "Гранта", "Нива", "Приора"],
+    "Kia": ["Rio", "Sportage", "Ceed"],
+    "Hyundai": ["Solaris", "Creta", "Tucson"],
+    "Mercedes-Benz": ["C200", "E200", "GLE"],
+    "Volkswagen": ["Polo", "Tiguan", "Passat"],
+}
+WORDS = ["один владелец", "не бит", "не крашен", "полный привод", "зимняя резина", "сервисная книжка",
+         "автомат", "механика", "кожаный салон", "климат-контроль", "парктроник", "камера"]
+SIZES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+BATCH_SIZE = 50_000
+# Пароль всех сгенерированных пользователей
+PASSWORD = "password"
+
+
+def parse_size(value):
+    return SIZES[value.lower()] if value.lower() in SIZES else int(value)
+
+
+# Объём остальных таблиц по числу автомобилей
+def scale(cars):
+    return {
+        "sellers": max(1, cars // 200),
+        "buyers": max(1, cars // 100),
+        "photos_per_car": 2,
+        "sales": max(1, cars // 10),
+    }
+
+
+def car_rows(rng, count, sellers):
+    brands = list(BRANDS)
+    for _ in range(count):
+        brand = rng.choice(brands)
+        yield (
+            brand,
+            rng.choice(BRANDS[brand]),
+            rng.randint(1990, 2025),
+            float(rng.randrange(100_000, 10_000_000, 1000)),
+            ", ".join(rng.sample(WORDS, 3)),
+            rng.randint(1, sellers),
+        )
+
+
+def batched(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# Заполняет базу воспроизводимыми данными: продавцы (id 1..sellers), покупатели, автомобили,
+# фотографии и продажи. Проданные автомобили помечаются так же, как после buy_car.
+def generate(db_name, cars, seed=0, progress=None):
+    rng = random.Random(seed)
+    sizes = scale(cars)
+    db = Database(db_name)
+    password_hash = hash_password(PASSWORD)
+    with db.conn:
+        db.conn.executemany(
+            "INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
+            [(f"seller{number}", password_hash, "Продавец") for number in range(1, sizes["sellers"] + 1)]
+            + [(f"buyer{number}", password_hash, "Покупатель") for number in range(1, sizes["buyers"] + 1)]
+        )
+        if db.fts_enabled:
+            db.conn.execute("UPDATE cars_fts_state SET bulk = 1")
+        done = 0
+        for batch in batched(car_rows(rng, cars, sizes["sellers"])):
+            db.conn.executemany(
+                "INSERT INTO cars (brand, model, year, price, description, owner_id) VALUES (?, ?, ?, ?, ?, ?)",
+                batch
+            )
+            last_id = db.conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+            db.conn.executemany(
+                "INSERT INTO photos (car_id, filepath, digest, width, height) VALUES (?, ?, ?, ?, ?)",
+                [(car_id, f"{digest[:2]}/{digest[2:4]}/{digest}.jpg", digest, 1024, 768)
+                 for car_id in range(last_id - len(batch) + 1, last_id + 1)
+                 for digest in (f"{rng.getrandbits(256):064x}" for _ in range(sizes["photos_per_car"]))]
+            )
+            done += len(batch)
+            if progress is not None:
+                progress(done, cars)
+        first_buyer = sizes["sellers"] + 1
+        sold = sorted(rng.sample(range(1, cars + 1), min(cars, sizes["sales"])))
+        db.conn.executemany("UPDATE cars SET status = 'sold', sold_at = datetime('now') WHERE id = ?",
+                            ((car_id,) for car_id in sold))
+        db.conn.executemany(
+            """
+            INSERT INTO sales (car_id, buyer_id, seller_id, price, sold_at, brand, model, year)
+            SELECT id, ?, owner_id, price, sold_at, brand, model, year FROM cars WHERE id = ?
+            """,
+            ((rng.randint(first_buyer, first_buyer + sizes["buyers"] - 1), car_id) for car_id in sold)
+        )
+        if db.fts_enabled:
+            db.conn.execute("UPDATE cars_fts_state SET bulk = 0")
+            db.conn.execute("INSERT INTO cars_fts (cars_fts) VALUES ('rebuild')")
+    db.conn.execute("ANALYZE")
+    return db
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Генерация тестовой базы автомобилей")
+    parser.add_argument("db", help="файл создаваемой базы")
+    parser.add_argument("--size", type=parse_size, default="100k", help="число автомобилей: 1k, 10k, 100k, 1m, 10m или число")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if os.path.exists(args.db):
+        parser.error(f"файл {args.db} уже существует")
+    started = time.perf_counter()
+    generate(args.db, args.size, args.seed, progress=lambda done, total: print(f"\r{done}/{total}", end="", flush=True))
+    print(f"\nГотово за {time.perf_counter() - started:.1f} с")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import os
+
+# Окно строится без экрана; переменную нужно задать до создания QApplication
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import argparse
+import sys
+import tempfile
+import time
+
+from PyQt6.QtWidgets import QApplication, QLabel, QLineEdit, QPushButton, QTableView, QVBoxLayout, QWidget
+
+import themes
+from benchmarks.stats import print_table, summarize
+from benchmarks.synthetic import generate, parse_size
+from car_table import ButtonDelegate, CarTableModel
+from main import CarPager, Database
+from workers import ImmediateRunner
+
+COLUMNS = [("Марка", "brand", "brand"), ("Модель", "model"), ("Год", "year", "year"), ("Цена", "price", "price"),
+           ("Описание", "description")]
+ACTIONS = ["Фотографии", "Изменить", "Удалить"]
+# Прежняя тёмная тема: одна строка стилей поверх стилей панели
+LEGACY_DARK = "QWidget { background-color: #121212; color: #ffffff; }"
+
+
+# Панель продавца в миниатюре: кнопки, поле ввода и таблица, загруженная целиком.
+# С widgets кнопки действий — отдельные QPushButton в каждой строке, как до делегатов.
+def build_window(db, rows, widgets):
+    window = QWidget()
+    layout = QVBoxLayout(window)
+    layout.addWidget(QLabel("Добро пожаловать!"))
+    layout.addWidget(QLineEdit())
+    for text in ("Сменить тему", "Выйти", "Добавить автомобиль"):
+        layout.addWidget(QPushButton(text))
+    model = CarTableModel(ImmediateRunner(db), COLUMNS, ACTIONS, parent=window)
+    view = QTableView()
+    view.setModel(model)
+    layout.addWidget(view)
+    model.set_source(CarPager())
+    while model.rowCount() < rows and model.canFetchMore():
+        model.fetchMore()
+    first = len(COLUMNS)
+    if widgets:
+        for row in range(model.rowCount()):
+            for column, text in enumerate(ACTIONS, first):
+                view.setIndexWidget(model.index(row, column), QPushButton(text))
+    else:
+        for column, text in enumerate(ACTIONS, first):
+            view.setItemDelegateForColumn(column, ButtonDelegate(text, parent=view))
+    window.resize(1024, 768)
+    window.show()
+    return window, model.rowCount()
+
+
+# Смена темы до первого кадра после неё; switch(number) ставит очередную тему
+def measure(app, window, switch, repeat):
+    samples = []
+    for number in range(repeat):
+        started = time.perf_counter()
+        switch(number)
+        app.processEvents()
+        window.repaint()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def cases(app):
+    def legacy(window):
+        # Стили панели из файла на уровне окна, тёмная тема — строкой на всё приложение
+        window.setStyleSheet(themes.stylesheet("light"))
+        return lambda number: app.setStyleSheet("" if number % 2 else LEGACY_DARK)
+
+    def engine(window):
+        themes.apply_theme(app, "light")
+        return lambda number: themes.apply_theme(app, themes.THEMES[(number + 1) % len(themes.THEMES)])
+
+    return [
+        ("legacy/delegates", legacy, False),
+        ("themes/delegates", engine, False),
+        ("legacy/row_widgets", legacy, True),
+        ("themes/row_widgets", engine, True),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время смены темы при большой загруженной таблице")
+    parser.add_argument("--size", type=parse_size, default="10k")
+    parser.add_argument("--rows", type=int, default=5000, help="строк, загружаемых в таблицу")
+    parser.add_argument("--widget-rows", type=int, default=1000,
+                        help="строк для замеров с кнопками-виджетами в каждой строке")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--db", help="готовая база synthetic.py; по умолчанию создаётся временная")
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv[:1])
+    with tempfile.TemporaryDirectory(prefix="cars-themes-") as directory:
+        if args.db:
+            db = Database(args.db, init_schema=False)
+        else:
+            db = generate(os.path.join(directory, "bench.db"), args.size)
+        results = {}
+        for name, prepare, widgets in cases(app):
+            window, rows = build_window(db, args.widget_rows if widgets else args.rows, widgets)
+            switch = prepare(window)
+            app.processEvents()
+            results[name] = summarize(measure(app, window, switch, args.repeat), rows)
+            window.close()
+            window.deleteLater()
+            app.setStyleSheet("")
+            app.setPalette(app.style().standardPalette())
+            app.processEvents()
+        print_table(results)
+        db.conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,297 @@
+from operator import attrgetter
+
+from PyQt6.QtCore import Qt, QAbstractTableModel, QModelIndex, QEvent, QRectF, QSize, pyqtSignal
+from PyQt6.QtGui import QColor, QPainter
+from PyQt6.QtWidgets import QStyledItemDelegate, QStyle
+
+from photos import THUMBNAIL_SIZE
+from workers import report_error
+
+# Вставку большего числа строк (импорт) проще показать перезагрузкой таблицы
+BULK_CHANGE_LIMIT = 500
+
+
+# Модель таблицы автомобилей: строки подгружаются порциями в фоновом потоке.
+# Источник строк (CarPager, SearchPager) выдаёт очередную порцию методом fetch(db, size, position)
+# в потоке пула и сам при этом не меняется: fetch возвращает строки и сдвиг позиции, а модель
+# применяет его методом advance в потоке интерфейса, где позицию меняют и точечные изменения.
+# Изменения базы (CarChange) применяются точечно через apply_change, без перезагрузки.
+class CarTableModel(QAbstractTableModel):
+    sort_requested = pyqtSignal()
+    busy_changed = pyqtSignal(bool)
+
+    def __init__(self, pool, columns, actions=(), batch_size=256, photo_cache=None, thumbnail_column=None,
+                 parent=None):
+        super().__init__(parent)
+        self.pool = pool
+        # В колонке thumbnail_column вместо текста показывается миниатюра файла из этого поля
+        self.photo_cache = photo_cache
+        self.thumbnail_column = thumbnail_column
+        if photo_cache is not None:
+            photo_cache.ready.connect(self._thumbnail_ready)
+        # columns: (заголовок, поле записи выборки[, ключ сортировки для Database.list_cars])
+        self.columns = list(columns)
+        self._fields = [attrgetter(spec[1]) for spec in self.columns]
+        self.actions = list(actions)
+        self.batch_size = batch_size
+        self.sort_key = "id"
+        self.descending = False
+        self._rows = []
+        # Позиции строк по id — для поиска строки и отсева повторов. Вставка и удаление сдвигают
+        # позиции после себя, поэтому верными считаются только позиции меньше _valid,
+        # остальные пересчитываются при первом обращении к ним
+        self._positions = {}
+        self._valid = 0
+        # id строк, ждущих миниатюру, по пути файла
+        self._waiting = {}
+        self._query = None
+        self._source = None
+        self._generation = 0
+        self._future = None
+
+    def set_source(self, source):
+        # Незапущенный запрос прежнего источника отменяется, а результаты уже выполняющегося отбрасываются
+        if self._future is not None:
+            self._future.cancel()
+            self._future = None
+            self.busy_changed.emit(False)
+        self.beginResetModel()
+        self._generation += 1
+        self._query = source
+        self._source = source
+        self._rows = []
+        self._positions = {}
+        self._valid = 0
+        self._waiting = {}
+        self.endResetModel()
+        self.fetchMore()
+
+    # Модель больше не нужна (панель перестроена при новом входе): ответы пула на её запросы
+    # отбрасываются по поколению, миниатюры ей больше не приходят, объект Qt удаляется
+    def dispose(self):
+        if self._future is not None:
+            self._future.cancel()
+            self._future = None
+        self._generation += 1
+        self._query = None
+        self._source = None
+        if self.photo_cache is not None:
+            self.photo_cache.ready.disconnect(self._thumbnail_ready)
+        self.deleteLater()
+
+    def car_id(self, row):
+        return self._rows[row].id
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.columns) + len(self.actions)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole or orientation != Qt.Orientation.Horizontal:
+            return None
+        if section < len(self.columns):
+            return self.columns[section][0]
+        return self.actions[section - len(self.columns)]
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        column = index.column()
+        if column >= len(self.columns):
+            return None
+        row = self._rows[index.row()]
+        value = self._fields[column](row)
+        if column == self.thumbnail_column:
+            if role == Qt.ItemDataRole.DecorationRole and value:
+                pixmap = self.photo_cache.request(value, THUMBNAIL_SIZE)
+                if pixmap is None:
+                    self._waiting.setdefault(value, set()).add(row.id)
+                return pixmap
+            return None
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        return "" if value is None else str(value)
+
+    # Миниатюра готова (или не получилась): перерисовываются только ячейки строк, которые её ждали
+    def _thumbnail_ready(self, path, size):
+        if size != THUMBNAIL_SIZE:
+            return
+        for car_id in self._waiting.pop(path, ()):
+            position = self._position(car_id)
+            if position is not None:
+                index = self.index(position, self.thumbnail_column)
+                self.dataChanged.emit(index, index, [Qt.ItemDataRole.DecorationRole])
+
+    # Сортировка выполняется в базе: модель запоминает ключ и просит перезагрузить данные
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        spec = self.columns[column] if 0 <= column < len(self.columns) else ()
+        self.sort_key = spec[2] if len(spec) > 2 else "id"
+        self.descending = order == Qt.SortOrder.DescendingOrder
+        self.sort_requested.emit()
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._source is not None and self._future is None
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        generation = self._generation
+        self.busy_changed.emit(True)
+        self._future = self.pool.run(
+            self._source.fetch, self.batch_size, self._source.position,
+            on_result=lambda result: self._append(generation, *result),
+            on_error=lambda error: self._failed(generation, error),
+        )
+
+    def _append(self, generation, batch, step):
+        if generation != self._generation:
+            return
+        self._future = None
+        self.busy_changed.emit(False)
+        self._source.advance(step)
+        if len(batch) < self.batch_size:
+            self._source = None
+        # Строка, уже вставленная по событию изменения, могла попасть и в очередную порцию
+        batch = [row for row in batch if row.id not in self._positions]
+        if batch:
+            start = len(self._rows)
+            self.beginInsertRows(QModelIndex(), start, start + len(batch) - 1)
+            self._rows.extend(batch)
+            self._positions.update((row.id, position) for position, row in enumerate(batch, start))
+            if self._valid == start:
+                self._valid = len(self._rows)
+            self.endInsertRows()
+
+    def apply_change(self, change):
+        if self._query is None:
+            return
+        if change.kind in ("deleted", "sold"):
+            for car_id in change.car_ids:
+                self._remove(car_id)
+            return
+        if change.kind == "reset" or len(change.car_ids) > BULK_CHANGE_LIMIT:
+            self.set_source(self._query.fresh())
+            return
+        # Новые значения строк читаются с фильтрами текущей выборки: строка могла в неё войти или выйти
+        generation = self._generation
+        self.pool.run(
+            self._query.fetch_ids, change.car_ids,
+            on_result=lambda rows: self._merge(generation, change.car_ids, rows),
+        )
+
+    def _merge(self, generation, car_ids, rows):
+        if generation != self._generation:
+            return
+        found = {row.id: row for row in rows}
+        for car_id in car_ids:
+            row = found.get(car_id)
+            position = self._position(car_id)
+            if position is None:
+                if row is not None:
+                    self._insert(row)
+            elif row is None:
+                self._remove(car_id)
+            elif self._query.sort_key(row) == self._query.sort_key(self._rows[position]):
+                self._rows[position] = row
+                self.dataChanged.emit(self.index(position, 0), self.index(position, len(self.columns) - 1))
+            else:
+                # Изменился ключ сортировки: строка переезжает на новое место
+                self._take(position)
+                self._query.row_removed()
+                self._insert(row)
+
+    def _position(self, car_id):
+        position = self._positions.get(car_id)
+        if position is None or position < self._valid:
+            return position
+        for position in range(self._valid, len(self._rows)):
+            self._positions[self._rows[position].id] = position
+        self._valid = len(self._rows)
+        return self._positions[car_id]
+
+    def _insert(self, row):
+        position = self._insert_position(row)
+        # Строка после последней загруженной придёт со следующей порцией
+        if position == len(self._rows) and self._source is not None:
+            return
+        self.beginInsertRows(QModelIndex(), position, position)
+        self._rows.insert(position, row)
+        self._positions[row.id] = position
+        self._valid = min(self._valid, position)
+        self.endInsertRows()
+        self._query.row_inserted()
+
+    # Двоичный поиск места по ключу сортировки источника; без ключа строка идёт в конец
+    def _insert_position(self, row):
+        key = self._query.sort_key(row)
+        low, high = 0, len(self._rows)
+        if key is None:
+            return high
+        while low < high:
+            middle = (low + high) // 2
+            other = self._query.sort_key(self._rows[middle])
+            if (other > key) if self._query.descending else (other < key):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _remove(self, car_id):
+        position = self._position(car_id)
+        if position is not None:
+            self._take(position)
+            self._query.row_removed()
+
+    def _take(self, position):
+        self.beginRemoveRows(QModelIndex(), position, position)
+        del self._positions[self._rows.pop(position).id]
+        self._valid = min(self._valid, position)
+        self.endRemoveRows()
+
+    def _failed(self, generation, error):
+        if generation != self._generation:
+            return
+        self._future = None
+        self._source = None
+        self.busy_changed.emit(False)
+        report_error(error)
+
+
+# Кнопка в ячейке таблицы, нарисованная делегатом вместо настоящего QPushButton
+class ButtonDelegate(QStyledItemDelegate):
+    clicked = pyqtSignal(int)
+
+    def __init__(self, text, color="#4CAF50", hover_color="#45a049", parent=None):
+        super().__init__(parent)
+        self.text = text
+        self.color = QColor(color)
+        self.hover_color = QColor(hover_color)
+        self.text_color = QColor("white")
+
+    def paint(self, painter, option, index):
+        painter.save()
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        rect = option.rect.adjusted(2, 2, -2, -2)
+        hovered = option.state & QStyle.StateFlag.State_MouseOver
+        painter.setPen(Qt.PenStyle.NoPen)
+        painter.setBrush(self.hover_color if hovered else self.color)
+        painter.drawRoundedRect(QRectF(rect), 5, 5)
+        painter.setPen(self.text_color)
+        painter.drawText(rect, Qt.AlignmentFlag.AlignCenter, self.text)
+        painter.restore()
+
+    def sizeHint(self, option, index):
+        metrics = option.fontMetrics
+        return QSize(metrics.horizontalAdvance(self.text) + 16, metrics.height() + 12)
+
+    def editorEvent(self, event, model, option, index):
+        if (event.type() == QEvent.Type.MouseButtonRelease
+                and event.button() == Qt.MouseButton.LeftButton
+                and option.rect.contains(event.position().toPoint())):
+            self.clicked.emit(index.row())
+            return True
+        return False
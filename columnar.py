@@ -0,0 +1,308 @@
+import bisect
+import functools
+import threading
+from array import array
+
+from records import Car
+
+# Выборка для загрузки каталога из базы, строк за запрос
+LOAD_CHUNK = 20_000
+# Удалённые строки только помечаются; когда их становится больше этой доли, массивы сжимаются
+COMPACT_RATIO = 0.25
+
+
+# NumPy необязателен: без него те же выборки считаются циклами по array, заметно медленнее
+@functools.lru_cache(maxsize=None)
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+# Ключ сортировки, ставящий NULL первым, как SQLite: цена NULL хранится как NaN, а NaN
+# ни с чем не сравнивается. Год NULL хранится как 0 и первым встаёт сам.
+def _null_first(value):
+    return (False, 0.0) if value != value else (True, value)
+
+
+# Каталог доступных автомобилей в памяти по колонкам: числа лежат в массивах array,
+# марки и модели — кодами словаря. Строка каталога занимает ~40 байт вместо сотен у кортежа,
+# а фильтры, сортировка и сводки считаются по целым колонкам (через NumPy, если он установлен).
+# Строки упорядочены по id; изменения базы применяются точечно через apply_change.
+class CarCatalog:
+    def __init__(self, use_numpy=True):
+        self.np = _numpy() if use_numpy else None
+        self.loaded = False
+        self._lock = threading.RLock()
+        self._clear()
+
+    def _clear(self):
+        self.ids = array("q")
+        self.years = array("i")
+        self.prices = array("d")
+        self.owners = array("q")
+        self.brand_codes = array("i")
+        self.model_codes = array("i")
+        self.alive = array("b")
+        self.dead = 0
+        self.brands = []
+        self.models = []
+        self._brand_codes = {}
+        self._model_codes = {}
+
+    def __len__(self):
+        return len(self.ids) - self.dead
+
+    @staticmethod
+    def _code(values, codes, value):
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(values)
+            values.append(value)
+        return code
+
+    # Полная загрузка; вызывается в потоке DatabasePool: catalog.load(db)
+    def load(self, db):
+        with self._lock:
+            self._clear()
+            after = 0
+            while True:
+                rows = db.list_catalog(after, LOAD_CHUNK)
+                self._extend(rows)
+                if len(rows) < LOAD_CHUNK:
+                    break
+                after = rows[-1][0]
+            self.loaded = True
+        return len(self)
+
+    # Строки list_catalog: (id, марка, модель, год, цена, владелец); дописываются колонками целиком
+    def _extend(self, rows):
+        brand_code = functools.partial(self._code, self.brands, self._brand_codes)
+        model_code = functools.partial(self._code, self.models, self._model_codes)
+        self.ids.extend([row[0] for row in rows])
+        self.years.extend([row[3] or 0 for row in rows])
+        self.prices.extend([float("nan") if row[4] is None else row[4] for row in rows])
+        self.owners.extend([row[5] or 0 for row in rows])
+        self.brand_codes.extend([brand_code(row[1]) for row in rows])
+        self.model_codes.extend([model_code(row[2]) for row in rows])
+        self.alive.extend(array("b", [1]) * len(rows))
+
+    def _set(self, position, row):
+        car_id, brand, model, year, price, owner_id = row
+        self.years[position] = year or 0
+        self.prices[position] = float("nan") if price is None else price
+        self.owners[position] = owner_id or 0
+        self.brand_codes[position] = self._code(self.brands, self._brand_codes, brand)
+        self.model_codes[position] = self._code(self.models, self._model_codes, model)
+        self.alive[position] = 1
+
+    def _insert(self, position, row):
+        self.ids.insert(position, row[0])
+        for column in (self.years, self.prices, self.owners, self.brand_codes, self.model_codes, self.alive):
+            column.insert(position, 0)
+        self._set(position, row)
+
+    def _position(self, car_id):
+        position = bisect.bisect_left(self.ids, car_id)
+        if position < len(self.ids) and self.ids[position] == car_id:
+            return position
+        return None
+
+    def _kill(self, car_id):
+        position = self._position(car_id)
+        if position is not None and self.alive[position]:
+            self.alive[position] = 0
+            self.dead += 1
+
+    # Применяет CarChange; вызывается в потоке DatabasePool: catalog.apply_change(db, change)
+    # Загрузка держит блокировку целиком, так что изменение во время неё применится после
+    def apply_change(self, db, change):
+        with self._lock:
+            if not self.loaded:
+                return
+            if change.kind == "reset":
+                self.load(db)
+                return
+            if change.kind in ("deleted", "sold"):
+                for car_id in change.car_ids:
+                    self._kill(car_id)
+            else:
+                # Автомобиль, которого нет среди доступных (продан, удалён), из каталога убирается
+                rows = {row[0]: row for row in db.list_catalog(ids=list(change.car_ids))}
+                for car_id in change.car_ids:
+                    row = rows.get(car_id)
+                    if row is None:
+                        self._kill(car_id)
+                        continue
+                    position = self._position(car_id)
+                    if position is None:
+                        if not self.ids or car_id > self.ids[-1]:
+                            self._extend([row])
+                        else:
+                            self._insert(bisect.bisect_left(self.ids, car_id), row)
+                    else:
+                        if not self.alive[position]:
+                            self.dead -= 1
+                        self._set(position, row)
+            if self.dead > len(self.ids) * COMPACT_RATIO:
+                self._compact()
+
+    def _compact(self):
+        keep = [position for position in range(len(self.ids)) if self.alive[position]]
+        for name in ("ids", "years", "prices", "owners", "brand_codes", "model_codes", "alive"):
+            column = getattr(self, name)
+            setattr(self, name, array(column.typecode, (column[position] for position in keep)))
+        self.dead = 0
+
+    # Позиции строк под фильтрами в порядке сортировки; фильтры — как у Database.list_cars
+    def _positions(self, sort="id", descending=False, owner_id=None, exclude_owner=None, price_min=None,
+                   price_max=None, year_min=None, year_max=None, brands=None):
+        wanted = None
+        if brands:
+            wanted = [self._brand_codes[brand] for brand in brands if brand in self._brand_codes]
+        if self.np is not None:
+            positions = self._positions_numpy(sort, owner_id, exclude_owner, price_min, price_max,
+                                              year_min, year_max, wanted)
+        else:
+            positions = self._positions_python(sort, owner_id, exclude_owner, price_min, price_max,
+                                               year_min, year_max, wanted)
+        return positions[::-1] if descending else positions
+
+    def _view(self, column):
+        return self.np.frombuffer(column, dtype=column.typecode) if len(column) else self.np.array([], column.typecode)
+
+    def _positions_numpy(self, sort, owner_id, exclude_owner, price_min, price_max, year_min, year_max, wanted):
+        np = self.np
+        mask = self._view(self.alive).astype(bool)
+        conditions = (
+            (owner_id, self.owners, np.equal),
+            (exclude_owner, self.owners, np.not_equal),
+            (price_min, self.prices, np.greater_equal),
+            (price_max, self.prices, np.less_equal),
+            (year_min, self.years, np.greater_equal),
+            # Год NULL хранится как 0; в SQL year <= ? его не пропускает
+            (year_max, self.years, lambda years, limit: (years <= limit) & (years != 0)),
+        )
+        for value, column, compare in conditions:
+            if value is not None:
+                mask &= compare(self._view(column), value)
+        if wanted is not None:
+            mask &= np.isin(self._view(self.brand_codes), wanted)
+        positions = np.flatnonzero(mask)
+        if sort == "id":
+            return positions
+        if sort == "brand":
+            keys = self._brand_ranks(np.array)[self._view(self.brand_codes)[positions]]
+        else:
+            keys = self._view(self.prices if sort == "price" else self.years)[positions]
+            # argsort ставит NaN в конец, а NULL в SQL идёт первым
+            keys = np.where(np.isnan(keys), -np.inf, keys) if sort == "price" else keys
+        # Позиции уже идут по возрастанию id, поэтому устойчивая сортировка по ключу даёт порядок (ключ, id)
+        return positions[np.argsort(keys, kind="stable")]
+
+    def _positions_python(self, sort, owner_id, exclude_owner, price_min, price_max, year_min, year_max, wanted):
+        positions = [position for position in range(len(self.ids)) if self.alive[position]]
+        conditions = (
+            (owner_id, self.owners, lambda value, limit: value == limit),
+            (exclude_owner, self.owners, lambda value, limit: value != limit),
+            (price_min, self.prices, lambda value, limit: value >= limit),
+            (price_max, self.prices, lambda value, limit: value <= limit),
+            (year_min, self.years, lambda value, limit: value >= limit),
+            (year_max, self.years, lambda value, limit: value != 0 and value <= limit),
+        )
+        for limit, column, passes in conditions:
+            if limit is not None:
+                positions = [position for position in positions if passes(column[position], limit)]
+        if wanted is not None:
+            wanted = set(wanted)
+            positions = [position for position in positions if self.brand_codes[position] in wanted]
+        if sort == "brand":
+            ranks = self._brand_ranks(list)
+            positions.sort(key=lambda position: (ranks[self.brand_codes[position]], self.ids[position]))
+        elif sort != "id":
+            column = self.prices if sort == "price" else self.years
+            positions.sort(key=lambda position: (*_null_first(column[position]), self.ids[position]))
+        return positions
+
+    # Место каждой марки в алфавитном порядке по её коду
+    def _brand_ranks(self, make):
+        order = sorted(range(len(self.brands)), key=lambda code: (self.brands[code] is not None, self.brands[code]))
+        ranks = [0] * len(order)
+        for rank, code in enumerate(order):
+            ranks[code] = rank
+        return make(ranks)
+
+    # id автомобилей под фильтрами в порядке сортировки
+    def select(self, sort="id", descending=False, **filters):
+        with self._lock:
+            positions = self._positions(sort, descending, **filters)
+            if self.np is not None:
+                return self._view(self.ids)[positions].tolist()
+            return [self.ids[position] for position in positions]
+
+    # Записи Car в формате list_cars без описания и фотографии
+    def rows(self, car_ids):
+        with self._lock:
+            rows = []
+            for car_id in car_ids:
+                position = self._position(car_id)
+                if position is None or not self.alive[position]:
+                    continue
+                price = self.prices[position]
+                rows.append(Car(
+                    car_id, self.brands[self.brand_codes[position]], self.models[self.model_codes[position]],
+                    self.years[position] or None, None if price != price else price, None,
+                    self.owners[position] or None, None,
+                ))
+            return rows
+
+    # Сводка по выборке: число автомобилей, диапазоны цены и года
+    def summary(self, **filters):
+        with self._lock:
+            positions = self._positions(**filters)
+            if not len(positions):
+                return {"count": 0}
+            # Диапазоны — по известным значениям; если у всех автомобилей выборки значение NULL — None
+            if self.np is not None:
+                prices = self._view(self.prices)[positions]
+                prices = prices[~self.np.isnan(prices)]
+                years = self._view(self.years)[positions]
+                years = years[years != 0]
+                return {"count": len(positions),
+                        "price_min": float(prices.min()) if len(prices) else None,
+                        "price_max": float(prices.max()) if len(prices) else None,
+                        "year_min": int(years.min()) if len(years) else None,
+                        "year_max": int(years.max()) if len(years) else None}
+            prices = [self.prices[position] for position in positions]
+            prices = [price for price in prices if price == price]
+            years = [self.years[position] for position in positions if self.years[position]]
+            return {"count": len(positions),
+                    "price_min": min(prices, default=None), "price_max": max(prices, default=None),
+                    "year_min": min(years, default=None), "year_max": max(years, default=None)}
+
+    # Гистограмма колонки "price" или "year" по выборке: [(от, до, число автомобилей)]
+    def histogram(self, column="price", bins=10, **filters):
+        with self._lock:
+            positions = self._positions(**filters)
+            source = self.prices if column == "price" else self.years
+            if self.np is not None:
+                values = self._view(source)[positions]
+                # NULL (NaN у цены, 0 у года) в гистограмму не входит
+                values = values[~self.np.isnan(values)] if column == "price" else values[values != 0]
+                if not len(values):
+                    return []
+                counts, edges = self.np.histogram(values, bins=bins)
+                return [(float(edges[number]), float(edges[number + 1]), int(count))
+                        for number, count in enumerate(counts)]
+            values = [source[position] for position in positions]
+            values = [value for value in values if value == value and (column == "price" or value)]
+            if not values:
+                return []
+            low, high = min(values), max(values)
+            width = (high - low) / bins or 1
+            counts = [0] * bins
+            for value in values:
+                counts[min(int((value - low) / width), bins - 1)] += 1
+            return [(low + width * number, low + width * (number + 1), count) for number, count in enumerate(counts)]
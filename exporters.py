@@ -0,0 +1,166 @@
+import csv
+import io
+import os
+from html import escape
+from operator import attrgetter
+
+# openpyxl, python-docx и reportlab импортируются внутри функций выгрузки:
+# они нужны только при экспорте и заметно замедляют запуск приложения
+
+EXPORT_HEADERS = ["Марка", "Модель", "Год", "Цена", "Описание"]
+EXPORT_TITLE = "Список автомобилей"
+CHUNK_SIZE = 1000
+
+# Шрифты с кириллицей: стандартные шрифты PDF её не содержат
+PDF_FONT_CANDIDATES = [
+    "C:/Windows/Fonts/arial.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+    "/Library/Fonts/Arial Unicode.ttf",
+    "/System/Library/Fonts/Supplemental/Arial.ttf",
+]
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+# Колонки выгрузки из записи records.Car
+export_row = attrgetter("brand", "model", "year", "price", "description")
+
+
+def car_text(car):
+    return f"Марка: {car.brand}, Модель: {car.model}, Год: {car.year}, Цена: {car.price}, Описание: {car.description}"
+
+
+# Читает курсор порциями, проверяя отмену и сообщая о ходе выгрузки
+def iter_chunks(cursor, total, progress=None, cancelled=None):
+    done = 0
+    while True:
+        if cancelled is not None and cancelled.is_set():
+            raise ExportCancelled()
+        rows = cursor.fetchmany(CHUNK_SIZE)
+        if not rows:
+            break
+        yield rows
+        done += len(rows)
+        if progress is not None:
+            progress(done, total)
+
+
+def export_csv(file, chunks):
+    with open(file, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f, delimiter=";")
+        writer.writerow(EXPORT_HEADERS)
+        for rows in chunks:
+            writer.writerows(export_row(row) for row in rows)
+
+
+def export_xlsx(file, chunks):
+    from openpyxl import Workbook
+
+    # В режиме write_only строки сразу пишутся во временный файл, а не хранятся в памяти
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Автомобили")
+    ws.append(EXPORT_HEADERS)
+    for rows in chunks:
+        for row in rows:
+            ws.append(export_row(row))
+    wb.save(file)
+
+
+def export_docx(file, chunks):
+    import zipfile
+
+    from docx import Document
+
+    # Стили и служебные части берутся из пустого документа python-docx,
+    # а тело word/document.xml дописывается в архив по мере чтения строк
+    template = Document()
+    template.add_heading(EXPORT_TITLE, level=1)
+    buffer = io.BytesIO()
+    template.save(buffer)
+    with zipfile.ZipFile(buffer) as source, zipfile.ZipFile(file, "w", zipfile.ZIP_DEFLATED) as target:
+        for item in source.infolist():
+            if item.filename != "word/document.xml":
+                target.writestr(item, source.read(item.filename))
+        body = source.read("word/document.xml").decode("utf-8")
+        head, section = body.rsplit("<w:sectPr", 1)
+        with target.open("word/document.xml", "w") as document:
+            document.write(head.encode("utf-8"))
+            for rows in chunks:
+                document.write("".join(
+                    f'<w:p><w:r><w:t xml:space="preserve">{escape(car_text(row), quote=False)}</w:t></w:r></w:p>'
+                    for row in rows
+                ).encode("utf-8"))
+            document.write(("<w:sectPr" + section).encode("utf-8"))
+
+
+def pdf_font():
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    if "ExportFont" in pdfmetrics.getRegisteredFontNames():
+        return "ExportFont"
+    for path in PDF_FONT_CANDIDATES:
+        if os.path.exists(path):
+            pdfmetrics.registerFont(TTFont("ExportFont", path))
+            return "ExportFont"
+    return "Times-Roman"
+
+
+def export_pdf(file, chunks):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.utils import simpleSplit
+    from reportlab.pdfgen import canvas
+
+    font = pdf_font()
+    width, height = A4
+    margin = 50
+    line_height = 16
+    c = canvas.Canvas(file, pagesize=A4)
+    page = 1
+
+    def start_page():
+        c.setFont(font, 14)
+        c.drawString(margin, height - margin, EXPORT_TITLE)
+        c.setFont(font, 9)
+        c.drawRightString(width - margin, margin / 2, f"Страница {page}")
+        c.setFont(font, 11)
+        return height - margin - 2 * line_height
+
+    y = start_page()
+    for rows in chunks:
+        for row in rows:
+            for line in simpleSplit(car_text(row), font, 11, width - 2 * margin):
+                if y < margin:
+                    c.showPage()
+                    page += 1
+                    y = start_page()
+                c.drawString(margin, y, line)
+                y -= line_height
+            y -= line_height / 2
+    c.save()
+
+
+EXPORTERS = {
+    "csv": export_csv,
+    "xlsx": export_xlsx,
+    "docx": export_docx,
+    "pdf": export_pdf,
+}
+
+
+# Задача для DatabasePool: выгрузить автомобили продавца прямо из курсора.
+# Файл пишется во временный и переименовывается только после успешного завершения.
+def export_user_cars(db, file_format, file, owner_id, cancelled=None, progress=None):
+    total = db.count_user_cars(owner_id)
+    chunks = iter_chunks(db.iter_user_cars(owner_id), total, progress, cancelled)
+    temp_file = file + ".part"
+    try:
+        EXPORTERS[file_format](temp_file, chunks)
+        os.replace(temp_file, file)
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+    return file
@@ -0,0 +1,154 @@
+import csv
+import datetime
+import math
+import os
+from collections import namedtuple
+
+BATCH_SIZE = 5000
+
+# Заголовки колонок файла: совпадают с выгрузкой (exporters.EXPORT_HEADERS) и английскими названиями полей
+IMPORT_COLUMNS = {
+    "brand": ("brand", "марка"),
+    "model": ("model", "модель"),
+    "year": ("year", "год"),
+    "price": ("price", "цена"),
+    "description": ("description", "описание"),
+    "photos": ("photos", "фотографии", "фото"),
+}
+
+ImportResult = namedtuple("ImportResult", "imported errors")
+
+
+class ImportCancelled(Exception):
+    pass
+
+
+def header_mapping(header):
+    mapping = {}
+    for position, title in enumerate(header):
+        title = str(title or "").strip().lower()
+        for field, aliases in IMPORT_COLUMNS.items():
+            if title in aliases:
+                mapping[field] = position
+    missing = [field for field in ("brand", "model", "year", "price") if field not in mapping]
+    if missing:
+        raise ValueError(f"В файле нет обязательных колонок: {', '.join(missing)}")
+    return mapping
+
+
+def read_csv(path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        sample = f.read(4096)
+        f.seek(0)
+        delimiter = ";" if sample.count(";") >= sample.count(",") else ","
+        yield from csv.reader(f, delimiter=delimiter)
+
+
+def read_xlsx(path):
+    # openpyxl нужен только для XLSX, поэтому не замедляет запуск приложения
+    from openpyxl import load_workbook
+
+    # read_only читает лист потоково, не загружая книгу целиком
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield from wb.active.iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def read_records(path):
+    if os.path.splitext(path)[1].lower() == ".xlsx":
+        return read_xlsx(path)
+    return read_csv(path)
+
+
+# Число из ячейки; бесконечность и NaN отвергаются так же, как нечисловой текст
+def parse_number(text):
+    value = float(text)
+    if not math.isfinite(value):
+        raise ValueError(text)
+    return value
+
+
+# Проверяет строку файла и возвращает (марка, модель, год, цена, описание, пути фотографий)
+def parse_record(record, mapping, base_dir, max_year):
+    def cell(field):
+        position = mapping.get(field)
+        if position is None or position >= len(record) or record[position] is None:
+            return ""
+        return str(record[position]).strip()
+
+    brand, model = cell("brand"), cell("model")
+    if not brand or not model:
+        raise ValueError("не указаны марка или модель")
+    try:
+        year = int(parse_number(cell("year")))
+    except ValueError:
+        raise ValueError(f"неверный год: {cell('year')!r}") from None
+    if not 1886 <= year <= max_year:
+        raise ValueError(f"год вне допустимого диапазона: {year}")
+    try:
+        price = parse_number(cell("price").replace(" ", "").replace(",", "."))
+    except ValueError:
+        raise ValueError(f"неверная цена: {cell('price')!r}") from None
+    if price < 0:
+        raise ValueError("цена не может быть отрицательной")
+    # Относительные пути к фотографиям считаются от папки импортируемого файла
+    photos = [
+        os.path.normpath(os.path.join(base_dir, path.strip()))
+        for path in cell("photos").split(";") if path.strip()
+    ]
+    return brand, model, year, price, cell("description"), photos
+
+
+# Фотографии пачки сохраняются в хранилище (PhotoStore), как при добавлении вручную: каждый файл
+# копируется один раз, у автомобиля остаются StoredPhoto без повторов по содержимому. Файл, который
+# не удалось прочитать, пропускается с ошибкой строки, а автомобиль импортируется без него.
+def store_batch_photos(store, batch, lines, errors):
+    stored, failed = store.ingest_paths([path for car in batch for path in car[5]])
+    failed = dict(failed)
+    result = []
+    for line, (brand, model, year, price, description, paths) in zip(lines, batch):
+        photos = {}
+        for path in paths:
+            if path in stored:
+                photos.setdefault(stored[path].digest, stored[path])
+            else:
+                errors.append((line, f"фотография {path}: {failed[path]}"))
+        result.append((brand, model, year, price, description, list(photos.values())))
+    return result
+
+
+# Задача для DatabasePool: потоково читает CSV/XLSX, проверяет строки, сохраняет фотографии
+# в store и вставляет автомобили пачками по BATCH_SIZE в одной транзакции
+def import_cars(db, store, path, owner_id, cancelled=None, progress=None):
+    errors = []
+    base_dir = os.path.dirname(os.path.abspath(path))
+    max_year = datetime.date.today().year + 1
+    records = iter(read_records(path))
+    mapping = header_mapping(next(records, ()))
+
+    def batches():
+        batch = []
+        lines = []
+        for line, record in enumerate(records, 2):
+            if not any(value not in (None, "") for value in record):
+                continue
+            try:
+                batch.append(parse_record(record, mapping, base_dir, max_year))
+                lines.append(line)
+            except ValueError as error:
+                errors.append((line, str(error)))
+            if len(batch) >= BATCH_SIZE:
+                if cancelled is not None and cancelled.is_set():
+                    raise ImportCancelled()
+                yield store_batch_photos(store, batch, lines, errors)
+                if progress is not None:
+                    progress(line - 1, 0)
+                batch = []
+                lines = []
+        if batch:
+            yield store_batch_photos(store, batch, lines, errors)
+
+    imported = db.add_cars_batches(batches(), owner_id)
+    return ImportResult(imported, errors)
@@ -0,0 +1,261 @@
+import functools
+import json
+import logging
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from PyQt6.QtCore import Qt, QObject, QTimer
+from PyQt6.QtWidgets import (
+    QDialog, QHBoxLayout, QHeaderView, QLabel, QPlainTextEdit, QPushButton, QTableWidget, QTableWidgetItem,
+    QVBoxLayout
+)
+
+# Замеры включаются параметром --instrument; выключенные стоят одну проверку флага
+enabled = False
+slow_ms = 50.0
+logger = logging.getLogger("sells_auto.perf")
+
+SAMPLES_PER_METRIC = 1000
+_lock = threading.Lock()
+_metrics = {}
+slow_queries = deque(maxlen=100)
+stalls = deque(maxlen=100)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {"time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"), "event": record.getMessage()}
+        entry.update(getattr(record, "fields", {}))
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def enable(log_path="performance.log", slow_query_ms=50.0):
+    global enabled, slow_ms
+    enabled = True
+    slow_ms = slow_query_ms
+    if log_path and not logger.handlers:
+        from logging.handlers import RotatingFileHandler
+
+        handler = RotatingFileHandler(log_path, maxBytes=5 * 1024 * 1024, backupCount=3, encoding="utf-8")
+        handler.setFormatter(JsonFormatter())
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+
+def log(event, **fields):
+    logger.info(event, extra={"fields": fields})
+
+
+class Metric:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.samples = deque(maxlen=SAMPLES_PER_METRIC)
+
+    def percentile(self, fraction):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def record(name, seconds, rows=None):
+    with _lock:
+        metric = _metrics.get(name)
+        if metric is None:
+            metric = _metrics[name] = Metric()
+        metric.count += 1
+        metric.total += seconds
+        metric.max = max(metric.max, seconds)
+        metric.samples.append(seconds)
+        if rows is not None:
+            metric.rows += rows
+    if seconds * 1000 >= slow_ms:
+        log("slow_call", name=name, ms=round(seconds * 1000, 2), rows=rows,
+            thread=threading.current_thread().name)
+
+
+# Копия метрик для окна статистики: имя -> (вызовов, всего с, p95 с, макс с, строк)
+def snapshot():
+    with _lock:
+        return {name: (metric.count, metric.total, metric.percentile(0.95), metric.max, metric.rows)
+                for name, metric in _metrics.items()}
+
+
+def reset():
+    with _lock:
+        _metrics.clear()
+        slow_queries.clear()
+        stalls.clear()
+
+
+def timed(name, fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        result = None
+        try:
+            result = fn(*args, **kwargs)
+            return result
+        finally:
+            # Вызов, завершившийся ошибкой, тоже попадает в статистику
+            record(name, time.perf_counter() - started, len(result) if isinstance(result, list) else None)
+    return wrapper
+
+
+# Оборачивает замером методы класса; без names — все открытые функции самого класса
+def instrument_methods(cls, names=None, prefix=""):
+    if names is None:
+        names = [name for name, value in vars(cls).items()
+                 if not name.startswith("_") and callable(value) and not isinstance(value, (staticmethod, type))]
+    for name in names:
+        setattr(cls, name, timed(prefix + name, getattr(cls, name)))
+
+
+# Время задачи DatabasePool: ожидание в очереди и выполнение
+def record_task(name, wait, duration):
+    record("pool.wait", wait)
+    record("pool." + name, duration)
+
+
+# Соединение, замеряющее каждый запрос; для медленных SELECT сохраняется план выполнения
+class InstrumentedConnection(sqlite3.Connection):
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        cursor = super().execute(sql, parameters)
+        elapsed = time.perf_counter() - started
+        record("sql.execute", elapsed)
+        if elapsed * 1000 >= slow_ms:
+            self._slow_query(sql, parameters, elapsed)
+        return cursor
+
+    def executemany(self, sql, parameters):
+        parameters = list(parameters)
+        started = time.perf_counter()
+        cursor = super().executemany(sql, parameters)
+        elapsed = time.perf_counter() - started
+        record("sql.executemany", elapsed, len(parameters))
+        if elapsed * 1000 >= slow_ms:
+            self._slow_query(sql, None, elapsed)
+        return cursor
+
+    def _slow_query(self, sql, parameters, elapsed):
+        plan = []
+        if parameters is not None and sql.lstrip().upper().startswith(("SELECT", "WITH")):
+            try:
+                plan = [row[3] for row in super().execute("EXPLAIN QUERY PLAN " + sql, parameters)]
+            except sqlite3.Error:
+                pass
+        entry = {"sql": " ".join(sql.split()), "ms": round(elapsed * 1000, 2), "plan": plan}
+        slow_queries.append(entry)
+        log("slow_query", **entry)
+
+
+def connection_factory():
+    return InstrumentedConnection if enabled else sqlite3.Connection
+
+
+# Сторож цикла событий: таймер в потоке интерфейса отмечает «пульс», фоновый поток
+# при задержке пульса дольше stall_ms снимает стек потока интерфейса
+class Watchdog(QObject):
+    def __init__(self, stall_ms=200, parent=None):
+        super().__init__(parent)
+        self.stall = stall_ms / 1000
+        self._gui_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped = threading.Event()
+        self._timer = QTimer(self)
+        self._timer.setInterval(20)
+        self._timer.timeout.connect(self._heartbeat)
+        self._thread = threading.Thread(target=self._watch, name="gui-watchdog", daemon=True)
+
+    def start(self):
+        self._beat = time.monotonic()
+        self._timer.start()
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._timer.stop()
+
+    def _heartbeat(self):
+        self._beat = time.monotonic()
+
+    def _watch(self):
+        stall = None
+        while not self._stopped.wait(self.stall / 2):
+            beat = self._beat
+            blocked = time.monotonic() - beat
+            if blocked < self.stall:
+                if stall is not None:
+                    stall["ms"] = round((beat - stall["started"]) * 1000, 1)
+                    log("gui_stall", ms=stall["ms"], stacks=stall["stacks"])
+                    stall = None
+                continue
+            if stall is None or stall["started"] != beat:
+                stall = {"started": beat, "ms": round(blocked * 1000, 1), "stacks": []}
+                stalls.append(stall)
+            stall["ms"] = round(blocked * 1000, 1)
+            frame = sys._current_frames().get(self._gui_thread)
+            if frame is not None and len(stall["stacks"]) < 10:
+                stall["stacks"].append("".join(traceback.format_stack(frame)))
+
+
+# Окно со сводкой замеров, медленными запросами и зависаниями интерфейса
+class StatsDialog(QDialog):
+    HEADERS = ["Замер", "Вызовов", "Всего, мс", "Среднее, мс", "p95, мс", "Макс, мс", "Строк"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Статистика производительности")
+        self.resize(900, 600)
+        layout = QVBoxLayout()
+        self.table = QTableWidget(0, len(self.HEADERS))
+        self.table.setHorizontalHeaderLabels(self.HEADERS)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.table.setSortingEnabled(True)
+        layout.addWidget(self.table)
+        layout.addWidget(QLabel("Медленные запросы и зависания интерфейса"))
+        self.details = QPlainTextEdit()
+        self.details.setReadOnly(True)
+        layout.addWidget(self.details)
+
+        buttons = QHBoxLayout()
+        refresh_button = QPushButton("Обновить")
+        refresh_button.clicked.connect(self.refresh)
+        reset_button = QPushButton("Сбросить")
+        reset_button.clicked.connect(lambda: (reset(), self.refresh()))
+        buttons.addWidget(refresh_button)
+        buttons.addWidget(reset_button)
+        layout.addLayout(buttons)
+        self.setLayout(layout)
+        self.refresh()
+
+    def refresh(self):
+        metrics = snapshot()
+        self.table.setSortingEnabled(False)
+        self.table.setRowCount(len(metrics))
+        for row, (name, (count, total, p95, longest, rows)) in enumerate(sorted(metrics.items())):
+            values = [name, count, total * 1000, total * 1000 / count, p95 * 1000, longest * 1000, rows]
+            for column, value in enumerate(values):
+                item = QTableWidgetItem()
+                item.setData(Qt.ItemDataRole.DisplayRole, round(value, 2) if isinstance(value, float) else value)
+                self.table.setItem(row, column, item)
+        self.table.setSortingEnabled(True)
+
+        lines = []
+        for query in list(slow_queries):
+            lines.append(f"{query['ms']} мс: {query['sql']}")
+            lines.extend(f"    {step}" for step in query["plan"])
+        for stall in list(stalls):
+            lines.append(f"Интерфейс не отвечал {stall['ms']} мс:")
+            if stall["stacks"]:
+                lines.append(stall["stacks"][0])
+        self.details.setPlainText("\n".join(lines) or "Нет записей")
@@ -1,168 +1,1266 @@
+# Первым: отсчёт времени запуска для --profile-startup
+import startup
+import argparse
+import functools
+import json
+import os
+import random
+import re
 import sys
+import threading
+import time
 #ИЗМЕНЕНИЯ
 #ИЗМЕНЕНИЯ
 #ИЗМЕНЕНИЯ
-from PyQt6.QtGui import QPixmap
+from PyQt6.QtGui import QDoubleValidator, QIntValidator, QKeySequence, QShortcut
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QPushButton, QLabel,
-    QLineEdit, QComboBox, QStackedWidget, QMessageBox, QTableWidget, QTableWidgetItem, QHBoxLayout, QInputDialog,
-    QFileDialog, QDialog, QAbstractScrollArea, QHeaderView
+    QLineEdit, QComboBox, QStackedWidget, QMessageBox, QTableView, QHBoxLayout,
+    QFileDialog, QAbstractScrollArea, QHeaderView, QProgressDialog, QDialog, QTableWidget, QTableWidgetItem,
+    QFormLayout, QDialogButtonBox, QAbstractItemView
 )
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QTimer
 import sqlite3
 
-from openpyxl import Workbook
-from docx import Document
-from reportlab.pdfgen import canvas
+from auth import DEFAULT_PRESET, HASH_PRESETS, AuthCache, LoginThrottle, dummy_hash, hash_password, needs_rehash
+import instrumentation
+import photos
+import themes
+from car_table import CarTableModel, ButtonDelegate
+from columnar import CarCatalog
+from exporters import ExportCancelled, export_user_cars
+from importer import ImportCancelled, import_cars
+from photo_store import PhotoStore, store_car_photos
+from photos import PhotoCache, PhotoViewer
+from query_cache import CachedDatabase, QueryCache, writing_task
+from records import BUYER_CAR_FIELDS, CAR_FIELDS, Car, Photo, Sale, User, records
+from storage import CarChange, PurchaseError, RemoteDatabase, StorageError
+from workers import DatabasePool, report_error
+
+startup.mark("Импорт модулей")
+
+
+# Поля, по которым возможна постраничная сортировка (они же поля записи Car)
+CAR_SORT_COLUMNS = {"id": "id", "brand": "brand", "year": "year", "price": "price"}
+
+# Выражение каждого поля записи Car в выборках list_cars и search_cars
+CAR_FIELD_COLUMNS = {
+    "id": "cars.id", "brand": "cars.brand", "model": "cars.model", "year": "cars.year", "price": "cars.price",
+    "description": "cars.description", "owner_id": "cars.owner_id",
+    "thumbnail": "(SELECT photos.filepath FROM photos WHERE photos.car_id = cars.id ORDER BY photos.id LIMIT 1)",
+}
+
+# Поля автомобиля, которые меняет продавец (update_car, update_cars, CarEditorDialog)
+CAR_EDIT_FIELDS = ("brand", "model", "year", "price", "description")
+
+# Условия фильтров выборок автомобилей по порядку; {} — место списка параметров IN
+CAR_FILTER_CONDITIONS = (
+    ("status", "cars.status = ?"),
+    ("ids", "cars.id IN ({})"),
+    ("owner_id", "cars.owner_id = ?"),
+    ("exclude_owner", "cars.owner_id != ?"),
+    ("price_min", "cars.price >= ?"),
+    ("price_max", "cars.price <= ?"),
+    ("year_min", "cars.year >= ?"),
+    ("year_max", "cars.year <= ?"),
+    ("brands", "cars.brand IN ({})"),
+)
+
+# Подготовленных запросов в кэше каждого соединения sqlite3 (по умолчанию 128)
+STATEMENT_CACHE_SIZE = 256
+
+# Настройки каждого соединения. WAL позволяет читать из фоновых потоков во время записи;
+# synchronous = NORMAL в режиме WAL не ждёт fsync при каждой фиксации и не портит базу при сбое
+# (теряются только последние транзакции). Кэш страниц и mmap — на соединение, в пуле их несколько.
+# auto_vacuum действует только на новую базу (до первой таблицы): её свободные страницы возвращаются
+# по частям (maintenance.incremental_vacuum); существующую переводит main.py maintain --vacuum.
+CONNECTION_PRAGMAS = (
+    ("auto_vacuum", "INCREMENTAL"),
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("busy_timeout", 5000),
+    ("foreign_keys", "ON"),
+    ("cache_size", -16384),
+    ("mmap_size", 256 * 1024 * 1024),
+    ("temp_store", "MEMORY"),
+)
+
+# Миграции схемы: база с PRAGMA user_version = N проходит методы Database из SCHEMA_MIGRATIONS[N:],
+# каждый в своей транзакции вместе с новым номером версии. Новые миграции добавляются только в конец.
+SCHEMA_MIGRATIONS = (
+    "migrate_base_schema",
+    "migrate_foreign_keys",
+    "migrate_owner_status_index",
+)
 
-def load_stylesheet():
-    with open('style.css', 'r', encoding='utf-8') as f:
-        return f.read()
+# Определения таблиц с внешними ключами; {name} — имя, под которым таблица создаётся
+PHOTOS_TABLE = """
+    CREATE TABLE IF NOT EXISTS {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        car_id INTEGER,
+        filepath TEXT,
+        digest TEXT,
+        width INTEGER,
+        height INTEGER,
+        FOREIGN KEY (car_id) REFERENCES cars(id) ON DELETE CASCADE
+    )
+"""
+# Продажа хранит снимок автомобиля и остаётся в истории после удаления объявления
+SALES_TABLE = """
+    CREATE TABLE IF NOT EXISTS {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        car_id INTEGER,
+        buyer_id INTEGER,
+        seller_id INTEGER,
+        price REAL,
+        sold_at TEXT,
+        brand TEXT,
+        model TEXT,
+        year INTEGER,
+        FOREIGN KEY (car_id) REFERENCES cars(id) ON DELETE SET NULL,
+        FOREIGN KEY (buyer_id) REFERENCES users(id)
+    )
+"""
+
+# Повторы покупки, если база занята другим клиентом: пауза растёт вдвое от PURCHASE_BACKOFF
+PURCHASE_RETRIES = 8
+PURCHASE_BACKOFF = 0.02
+
+# Как часто клиент сервера хранилища спрашивает об изменениях с других рабочих мест, мс
+CHANGE_POLL_MS = 2000
+# Как часто реплика обменивается изменениями с узлом (--sync), мс
+SYNC_MS = 5000
+# Обслуживание локального файла базы (maintenance.py): через минуту после запуска, чтобы не
+# отнимать у входа соединение пула, и затем раз в час, мс
+MAINTENANCE_DELAY_MS = 60 * 1000
+MAINTENANCE_MS = 60 * 60 * 1000
 
 
 # База данных
 class Database:
-    def __init__(self, db_name="cars.db"):
-        self.conn = sqlite3.connect(db_name)
-        self.create_tables()
+    # Стоимость хэширования паролей (auth.HASH_PRESETS) и общий для всех соединений кэш проверок
+    password_preset = DEFAULT_PRESET
+    auth_cache = AuthCache()
+
+    def __init__(self, db_name="cars.db", init_schema=True):
+        self.db_name = db_name
+        self.conn = sqlite3.connect(db_name, factory=instrumentation.connection_factory(),
+                                    cached_statements=STATEMENT_CACHE_SIZE)
+        # Подписчики на изменения автомобилей: вызываются с CarChange после фиксации транзакции
+        self.listeners = []
+        for name, value in CONNECTION_PRAGMAS:
+            self.conn.execute(f"PRAGMA {name} = {value}")
+        if init_schema:
+            self.create_tables()
+        else:
+            self.fts_enabled = self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'cars_fts'"
+            ).fetchone() is not None
 
     def create_tables(self):
-        with self.conn:
+        self.migrate()
+        self.fts_enabled = self.create_search_index()
+
+    def schema_version(self):
+        return self.conn.execute("PRAGMA user_version").fetchone()[0]
+
+    # Внешние ключи на время миграций выключены: при пересоздании таблиц старая и новая
+    # копии существуют одновременно. Другой процесс мог обновить базу, пока эта ждала
+    # блокировку записи, поэтому версия перечитывается внутри транзакции.
+    def migrate(self):
+        if self.schema_version() >= len(SCHEMA_MIGRATIONS):
+            return
+        self.conn.execute("PRAGMA foreign_keys = OFF")
+        try:
+            for version, name in enumerate(SCHEMA_MIGRATIONS, 1):
+                if self.schema_version() >= version:
+                    continue
+                self.conn.execute("BEGIN IMMEDIATE")
+                try:
+                    if self.schema_version() < version:
+                        getattr(self, name)()
+                        self.conn.execute(f"PRAGMA user_version = {version}")
+                    self.conn.commit()
+                except BaseException:
+                    self.conn.rollback()
+                    raise
+        finally:
+            self.conn.execute("PRAGMA foreign_keys = ON")
+
+    # Версия 1: схема, которую раньше создавал create_tables, вместе с дополнением баз
+    # из версий программы без учёта версий схемы
+    def migrate_base_schema(self):
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE,
+                password TEXT,
+                role TEXT
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS cars (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                brand TEXT,
+                model TEXT,
+                year INTEGER,
+                price REAL,
+                description TEXT,
+                owner_id INTEGER,
+                status TEXT NOT NULL DEFAULT 'available',
+                sold_at TEXT,
+                FOREIGN KEY (owner_id) REFERENCES users(id)
+            )
+        """)
+        self.conn.execute(PHOTOS_TABLE.format(name="photos"))
+        self.conn.execute(SALES_TABLE.format(name="sales"))
+        # Индексы для фильтра по владельцу, постраничной выборки с сортировкой и фотографий
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_cars_owner ON cars (owner_id)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_cars_price ON cars (price, id)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_cars_year ON cars (year, id)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_cars_brand ON cars (brand, id)")
+        # Проданный автомобиль остаётся в базе с пометкой, а продажа хранит снимок автомобиля
+        # на момент покупки: история не зависит от последующих изменений и удаления объявления
+        self.add_missing_columns("cars", {"status": "TEXT NOT NULL DEFAULT 'available'", "sold_at": "TEXT"})
+        if self.add_missing_columns("sales", {"seller_id": "INTEGER", "price": "REAL", "sold_at": "TEXT",
+                                              "brand": "TEXT", "model": "TEXT", "year": "INTEGER"}):
             self.conn.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT UNIQUE,
-                    password TEXT,
-                    role TEXT
-                )
+                UPDATE sales SET
+                    seller_id = COALESCE(seller_id, (SELECT owner_id FROM cars WHERE cars.id = sales.car_id)),
+                    price = COALESCE(price, (SELECT price FROM cars WHERE cars.id = sales.car_id)),
+                    brand = (SELECT brand FROM cars WHERE cars.id = sales.car_id),
+                    model = (SELECT model FROM cars WHERE cars.id = sales.car_id),
+                    year = (SELECT year FROM cars WHERE cars.id = sales.car_id)
+                WHERE brand IS NULL
             """)
-            self.conn.execute("""
-                CREATE TABLE IF NOT EXISTS cars (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    brand TEXT,
-                    model TEXT,
-                    year INTEGER,
-                    price REAL,
-                    description TEXT,
-                    owner_id INTEGER,
-                    FOREIGN KEY (owner_id) REFERENCES users(id)
-                )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_sales_buyer ON sales (buyer_id, id)")
+        self.create_sales_summary()
+        # Базы, созданные до хранилища фотографий, получают колонки хэша и размеров
+        self.add_missing_columns("photos", {"digest": "TEXT", "width": "INTEGER", "height": "INTEGER"})
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_photos_car ON photos (car_id)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_photos_digest ON photos (digest)")
+
+    # Версия 2: фотографии удаляются вместе с автомобилем, продажа теряет ссылку на удалённый
+    # автомобиль. Внешний ключ не меняется через ALTER TABLE, поэтому старые таблицы
+    # пересоздаются; строки без автомобиля или покупателя при этом очищаются.
+    def migrate_foreign_keys(self):
+        if not self.has_cascade("photos", "car_id", "CASCADE"):
+            self.rebuild_table("photos", PHOTOS_TABLE, """
+                SELECT id, car_id, filepath, digest, width, height FROM photos
+                WHERE car_id IS NULL OR car_id IN (SELECT id FROM cars)
             """)
-            self.conn.execute("""
-                CREATE TABLE IF NOT EXISTS photos (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    car_id INTEGER,
-                    filepath TEXT,
-                    FOREIGN KEY (car_id) REFERENCES cars(id)
-                )
+        if not self.has_cascade("sales", "car_id", "SET NULL"):
+            self.rebuild_table("sales", SALES_TABLE, """
+                SELECT id,
+                       CASE WHEN car_id IN (SELECT id FROM cars) THEN car_id END,
+                       CASE WHEN buyer_id IN (SELECT id FROM users) THEN buyer_id END,
+                       seller_id, price, sold_at, brand, model, year
+                FROM sales
             """)
-            self.conn.execute("""
-                CREATE TABLE IF NOT EXISTS sales (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    car_id INTEGER,
-                    buyer_id INTEGER,
-                    FOREIGN KEY (car_id) REFERENCES cars(id),
-                    FOREIGN KEY (buyer_id) REFERENCES users(id)
+        # Без индекса удаление автомобиля просматривало бы все продажи в поисках ссылок
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_sales_car ON sales (car_id)")
+        violations = self.conn.execute("PRAGMA foreign_key_check").fetchall()
+        if violations:
+            raise sqlite3.IntegrityError(f"Нарушены внешние ключи после миграции: {violations[:5]}")
+
+    # Версия 3: автомобили продавца выбираются по владельцу и статусу одним поиском по индексу,
+    # без проверки статуса у каждой строки (проданные остаются в таблице)
+    def migrate_owner_status_index(self):
+        self.conn.execute("DROP INDEX IF EXISTS idx_cars_owner")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_cars_owner_status ON cars (owner_id, status, id)")
+
+    def has_cascade(self, table, column, action):
+        return any(row[3] == column and row[6] == action
+                   for row in self.conn.execute(f"PRAGMA foreign_key_list({table})"))
+
+    # Пересоздание таблицы по definition (шаблон с {name}) со строками из select. Индексы и триггеры
+    # таблицы (итоги продаж, журнал реплики) создаются заново, счётчик AUTOINCREMENT сохраняется,
+    # чтобы id удалённых строк не выдавались повторно.
+    def rebuild_table(self, table, definition, select):
+        saved = [sql for sql, in self.conn.execute(
+            "SELECT sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+            (table,)
+        )]
+        sequence = self.conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+        self.conn.execute(f"DROP TABLE IF EXISTS {table}_new")
+        self.conn.execute(definition.format(name=f"{table}_new"))
+        self.conn.execute(f"INSERT INTO {table}_new {select}")
+        self.conn.execute(f"DROP TABLE {table}")
+        self.conn.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+        for sql in saved:
+            self.conn.execute(sql)
+        if sequence is not None and not self.conn.execute(
+                "UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (sequence[0], table)).rowcount:
+            self.conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, sequence[0]))
+
+    # Возвращает имена добавленных колонок
+    def add_missing_columns(self, table, columns):
+        existing = {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+        added = []
+        for name, column_type in columns.items():
+            if name not in existing:
+                self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+                added.append(name)
+        return added
+
+    # Итоги продаж по продавцам, маркам и годам выпуска. Триггеры на sales обновляют их
+    # при каждой продаже, поэтому статистика читается одной строкой без просмотра sales.
+    def create_sales_summary(self):
+        exists = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'seller_stats'"
+        ).fetchone()
+        summaries = {
+            "seller_stats": ("seller_id INTEGER", ("seller_id",)),
+            "brand_stats": ("brand TEXT", ("brand",)),
+            "seller_year_stats": ("seller_id INTEGER, year INTEGER", ("seller_id", "year")),
+        }
+        for table, (key_columns, keys) in summaries.items():
+            self.conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    {key_columns},
+                    sales_count INTEGER NOT NULL,
+                    revenue REAL NOT NULL,
+                    PRIMARY KEY ({', '.join(keys)})
                 )
             """)
+            new_keys = ", ".join(f"new.{key}" for key in keys)
+            old_keys = " AND ".join(f"{key} = old.{key}" for key in keys)
+            # Продажи старых баз без продавца или марки в итоги не попадают
+            not_null = " AND ".join(f"{key} IS NOT NULL" for key in keys)
+            self.conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_insert AFTER INSERT ON sales
+                WHEN {' AND '.join(f'new.{key} IS NOT NULL' for key in keys)} BEGIN
+                    INSERT INTO {table} ({', '.join(keys)}, sales_count, revenue)
+                    VALUES ({new_keys}, 1, COALESCE(new.price, 0))
+                    ON CONFLICT ({', '.join(keys)}) DO UPDATE SET
+                        sales_count = sales_count + 1, revenue = revenue + excluded.revenue;
+                END
+            """)
+            self.conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_delete AFTER DELETE ON sales BEGIN
+                    UPDATE {table} SET sales_count = sales_count - 1, revenue = revenue - COALESCE(old.price, 0)
+                    WHERE {old_keys};
+                END
+            """)
+            if not exists:
+                self.conn.execute(f"""
+                    INSERT OR REPLACE INTO {table} ({', '.join(keys)}, sales_count, revenue)
+                    SELECT {', '.join(keys)}, COUNT(*), SUM(COALESCE(price, 0)) FROM sales
+                    WHERE {not_null} GROUP BY {', '.join(keys)}
+                """)
 
+    # Полнотекстовый индекс FTS5 по марке, модели и описанию, синхронизируется триггерами
+    def create_search_index(self):
+        exists = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'cars_fts'"
+        ).fetchone()
+        try:
+            with self.conn:
+                self.conn.execute("""
+                    CREATE VIRTUAL TABLE IF NOT EXISTS cars_fts USING fts5(
+                        brand, model, description,
+                        content='cars', content_rowid='id',
+                        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+                    )
+                """)
+                # При пакетной вставке (add_cars_batches) индекс заполняется одним запросом после пачки
+                self.conn.execute("CREATE TABLE IF NOT EXISTS cars_fts_state (bulk INTEGER NOT NULL)")
+                self.conn.execute("""
+                    INSERT INTO cars_fts_state (bulk) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM cars_fts_state)
+                """)
+                self.conn.execute("""
+                    CREATE TRIGGER IF NOT EXISTS cars_fts_insert AFTER INSERT ON cars
+                    WHEN (SELECT bulk FROM cars_fts_state) = 0 BEGIN
+                        INSERT INTO cars_fts (rowid, brand, model, description)
+                        VALUES (new.id, new.brand, new.model, new.description);
+                    END
+                """)
+                self.conn.execute("""
+                    CREATE TRIGGER IF NOT EXISTS cars_fts_delete AFTER DELETE ON cars BEGIN
+                        INSERT INTO cars_fts (cars_fts, rowid, brand, model, description)
+                        VALUES ('delete', old.id, old.brand, old.model, old.description);
+                    END
+                """)
+                self.conn.execute("""
+                    CREATE TRIGGER IF NOT EXISTS cars_fts_update AFTER UPDATE OF brand, model, description ON cars BEGIN
+                        INSERT INTO cars_fts (cars_fts, rowid, brand, model, description)
+                        VALUES ('delete', old.id, old.brand, old.model, old.description);
+                        INSERT INTO cars_fts (rowid, brand, model, description)
+                        VALUES (new.id, new.brand, new.model, new.description);
+                    END
+                """)
+                if not exists:
+                    self.conn.execute("INSERT INTO cars_fts (cars_fts) VALUES ('rebuild')")
+        except sqlite3.OperationalError:
+            # SQLite собран без FTS5: поиск работает через LIKE
+            return False
+        return True
+
+    def notify(self, kind, car_ids):
+        change = CarChange(kind, tuple(car_ids))
+        for listener in self.listeners:
+            listener(change)
+
+    # Хэширование занимает заметное время, поэтому вызывается через DatabasePool
     def register_user(self, username, password, role):
+        password_hash = hash_password(password, self.password_preset)
         try:
             with self.conn:
                 self.conn.execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
-                                  (username, password, role))
+                                  (username, password_hash, role))
             return True
         except sqlite3.IntegrityError:
             return False
 
+    def get_user(self, username):
+        return records(self.conn.execute("SELECT id, role FROM users WHERE username = ?", (username,)), User).fetchone()
+
     def authenticate_user(self, username, password):
-        return self.conn.execute("SELECT id, role FROM users WHERE username = ? AND password = ?", (username, password)).fetchone()
+        user = self.conn.execute("SELECT id, role, password FROM users WHERE username = ?", (username,)).fetchone()
+        if user is None:
+            # Хэш считается и для неизвестного имени, чтобы время ответа не выдавало, есть ли пользователь
+            self.auth_cache.verify(password, dummy_hash(self.password_preset))
+            return None
+        user_id, role, stored = user
+        if not self.auth_cache.verify(password, stored or ""):
+            return None
+        # Открытые пароли старых баз и хэши с прежней стоимостью заменяются при входе
+        if needs_rehash(stored, self.password_preset):
+            with self.conn:
+                self.conn.execute("UPDATE users SET password = ? WHERE id = ? AND password = ?",
+                                  (hash_password(password, self.password_preset), user_id, stored))
+        return User(user_id, role)
 
     def add_car(self, brand, model, year, price, description, owner_id):
         with self.conn:
             cursor = self.conn.execute("INSERT INTO cars (brand, model, year, price, description, owner_id) VALUES (?, ?, ?, ?, ?, ?)", (brand, model, year, price, description, owner_id))
-            return cursor.lastrowid
+        self.notify("inserted", [cursor.lastrowid])
+        return cursor.lastrowid
 
     def add_photo(self, car_id, filepath):
         with self.conn:
             self.conn.execute("INSERT INTO photos (car_id, filepath) VALUES (?, ?)", (car_id, filepath))
 
+    # photos — записи StoredPhoto из хранилища, добавляются одной пакетной вставкой
+    def add_photos(self, car_id, photos):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO photos (car_id, filepath, digest, width, height) VALUES (?, ?, ?, ?, ?)",
+                [(car_id, photo.filepath, photo.digest, photo.width, photo.height) for photo in photos]
+            )
+        # Первая фотография показывается миниатюрой в строке автомобиля
+        if photos:
+            self.notify("updated", [car_id])
+
+    # Пакетная вставка в одной транзакции; batches — итератор списков
+    # (марка, модель, год, цена, описание, фотографии StoredPhoto из хранилища)
+    def add_cars_batches(self, batches, owner_id):
+        imported = 0
+        car_ids = []
+        with self.conn:
+            if self.fts_enabled:
+                self.conn.execute("UPDATE cars_fts_state SET bulk = 1")
+            for batch in batches:
+                self.conn.executemany(
+                    "INSERT INTO cars (brand, model, year, price, description, owner_id) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(brand, model, year, price, description, owner_id)
+                     for brand, model, year, price, description, photos in batch]
+                )
+                # Внутри транзакции идентификаторы пачки идут подряд и заканчиваются last_insert_rowid()
+                first_id = self.conn.execute("SELECT last_insert_rowid()").fetchone()[0] - len(batch) + 1
+                self.conn.executemany(
+                    "INSERT INTO photos (car_id, filepath, digest, width, height) VALUES (?, ?, ?, ?, ?)",
+                    [(first_id + offset, *photo) for offset, car in enumerate(batch) for photo in car[5]]
+                )
+                if self.fts_enabled:
+                    self.conn.execute("""
+                        INSERT INTO cars_fts (rowid, brand, model, description)
+                        SELECT id, brand, model, description FROM cars WHERE id BETWEEN ? AND ?
+                    """, (first_id, first_id + len(batch) - 1))
+                imported += len(batch)
+                car_ids.extend(range(first_id, first_id + len(batch)))
+            if self.fts_enabled:
+                self.conn.execute("UPDATE cars_fts_state SET bulk = 0")
+        if car_ids:
+            self.notify("inserted", car_ids)
+        return imported
+
     def get_cars(self, exclude_owner=None):
-        query = "SELECT id, brand, model, year, price, description, owner_id FROM cars"
+        return self.iter_cars(exclude_owner).fetchall()
+
+    def iter_cars(self, exclude_owner=None):
+        query = ("SELECT id, brand, model, year, price, description, owner_id, NULL FROM cars"
+                 " WHERE status = 'available'")
         params = ()
         if exclude_owner is not None:
-            query += " WHERE owner_id != ?"
+            query += " AND owner_id != ?"
             params = (exclude_owner,)
-        return self.conn.execute(query, params).fetchall()
+        return records(self.conn.execute(query, params), Car)
+
+    # Форма фильтров — (имя, число значений списка или None) заданных фильтров — и их параметры
+    def _car_filters(self, owner_id=None, exclude_owner=None, price_min=None, price_max=None,
+                     year_min=None, year_max=None, brands=None, ids=None, status="available"):
+        values = {"status": status, "ids": ids, "owner_id": owner_id, "exclude_owner": exclude_owner,
+                  "price_min": price_min, "price_max": price_max, "year_min": year_min, "year_max": year_max,
+                  "brands": brands or None}
+        shape = []
+        params = []
+        for name, condition in CAR_FILTER_CONDITIONS:
+            value = values[name]
+            if value is None:
+                continue
+            if "{}" in condition:
+                shape.append((name, len(value)))
+                params += list(value)
+            else:
+                shape.append((name, None))
+                params.append(value)
+        return tuple(shape), params
+
+    # Постраничная выборка по ключу (keyset): after — ключ последней строки предыдущей страницы.
+    # fields — поля Car, которые нужны экрану (records.BUYER_CAR_FIELDS и т. п.), остальные — None.
+    # Сравнение ключей с NULL ложно, поэтому строки с NULL в поле сортировки (в SQLite они идут
+    # первыми по возрастанию и последними по убыванию) выбираются своей частью запроса: страница,
+    # дошедшая до границы частей, дополняется из следующей, и каждая часть читается по индексу.
+    def list_cars(self, sort="id", descending=False, after=None, limit=100, fields=CAR_FIELDS, **filters):
+        shape, params = self._car_filters(**filters)
+        if after is None or sort == "id":
+            parts = [(None if after is None else "value", list(after or ()))]
+        elif after[0] is None:
+            parts = [("null", [after[1]])] + ([] if descending else [("values", [])])
+        else:
+            parts = [("value", list(after))] + ([("nulls", [])] if descending else [])
+        rows = []
+        for keyset, cursor in parts:
+            sql = listing_sql(tuple(fields), shape, sort, descending, keyset)
+            rows += records(self.conn.execute(sql, params + cursor + [limit - len(rows)]), Car).fetchall()
+            if len(rows) >= limit:
+                break
+        return rows
+
+    def search_cars(self, query, limit=100, offset=0, sort=None, descending=False, fields=CAR_FIELDS, **filters):
+        terms = re.findall(r"\w+", query)
+        shape, params = self._car_filters(**filters)
+        if terms and self.fts_enabled:
+            # Каждое слово запроса ищется как префикс
+            mode = "fts"
+            params.insert(0, " ".join(f'"{term}"*' for term in terms))
+        elif terms:
+            mode = "like"
+            for term in terms:
+                params += [f"%{term}%"] * 2
+        else:
+            mode = None
+        sql = search_sql(tuple(fields), shape, sort, descending, mode, len(terms))
+        return records(self.conn.execute(sql, params + [limit, offset]), Car).fetchall()
+
+    # Строки каталога в памяти (columnar.CarCatalog) по возрастанию id: после after или только ids
+    def list_catalog(self, after=0, limit=None, ids=None):
+        shape, params = self._car_filters(ids=ids)
+        conditions = list(car_filter_conditions(shape))
+        conditions.append("cars.id > ?")
+        params.append(after)
+        sql = f"SELECT id, brand, model, year, price, owner_id FROM cars WHERE {' AND '.join(conditions)} ORDER BY id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return self.conn.execute(sql, params).fetchall()
+
+    # Путь к первой фотографии каждого автомобиля для строк, собранных из каталога
+    def get_thumbnails(self, car_ids):
+        return self.conn.execute(f"""
+            SELECT cars.id,
+                   (SELECT photos.filepath FROM photos WHERE photos.car_id = cars.id ORDER BY photos.id LIMIT 1)
+            FROM cars WHERE cars.id IN ({', '.join('?' * len(car_ids))})
+        """, list(car_ids)).fetchall()
 
     def get_user_cars(self, owner_id):
-        return self.conn.execute("SELECT id, brand, model, year, price, description FROM cars WHERE owner_id = ?",
-                                 (owner_id,)).fetchall()
+        return self.iter_user_cars(owner_id).fetchall()
+
+    def iter_user_cars(self, owner_id):
+        return records(self.conn.execute("SELECT id, brand, model, year, price, description, owner_id, NULL FROM cars"
+                                         " WHERE owner_id = ? AND status = 'available' ORDER BY id", (owner_id,)), Car)
+
+    def count_user_cars(self, owner_id):
+        return self.conn.execute("SELECT COUNT(*) FROM cars WHERE owner_id = ? AND status = 'available'",
+                                 (owner_id,)).fetchone()[0]
 
     def get_car_photos(self, car_id):
-        return self.conn.execute("SELECT filepath FROM photos WHERE car_id = ?", (car_id,)).fetchall()
+        return records(self.conn.execute("SELECT filepath FROM photos WHERE car_id = ?", (car_id,)), Photo).fetchall()
 
+    # Фотографии удаляются по внешнему ключу ON DELETE CASCADE
     def delete_car(self, car_id):
         with self.conn:
-            self.conn.execute("DELETE FROM photos WHERE car_id = ?", (car_id,))
             self.conn.execute("DELETE FROM cars WHERE id = ?", (car_id,))
-
-    def update_car(self, car_id, brand, model, year, price, description):
+        self.notify("deleted", [car_id])
+
+    def get_car(self, car_id):
+        return records(self.conn.execute(
+            "SELECT id, brand, model, year, price, description, owner_id, NULL FROM cars"
+            " WHERE id = ? AND status = 'available'", (car_id,)
+        ), Car).fetchone()
+
+    # Записываются только переданные поля: values — по порядку CAR_EDIT_FIELDS, changes — по именам.
+    # Изменение одной цены не трогает полнотекстовый индекс: его триггер следит за текстовыми полями.
+    def update_car(self, car_id, *values, **changes):
+        changes = dict(zip(CAR_EDIT_FIELDS, values), **changes)
+        check_car_fields(changes)
+        if not changes:
+            return
+        fields = tuple(sorted(changes))
         with self.conn:
+            self.conn.execute(car_update_sql(fields, False, False), [changes[field] for field in fields] + [car_id])
+        self.notify("updated", [car_id])
+
+    # Пакетное изменение автомобилей продавца одним UPDATE в одной транзакции: changes — новые
+    # значения полей для всех, price_factor — множитель цены (0.95 — скидка 5 %). Проданные и
+    # чужие автомобили пропускаются. Возвращает id изменённых; таблицы получают одно событие.
+    def update_cars(self, car_ids, owner_id, price_factor=None, **changes):
+        check_car_fields(changes)
+        if "price" in changes and price_factor is not None:
+            raise ValueError("Цена задаётся либо значением, либо множителем")
+        fields = tuple(sorted(changes))
+        if not car_ids or not fields and price_factor is None:
+            return []
+        params = [changes[field] for field in fields]
+        if price_factor is not None:
+            params.append(price_factor)
+        with self.conn:
+            updated = [row[0] for row in self.conn.execute(
+                car_update_sql(fields, price_factor is not None, True),
+                params + [json.dumps(list(car_ids)), owner_id]
+            )]
+        if updated:
+            self.notify("updated", updated)
+        return updated
+
+    # Покупка в транзакции BEGIN IMMEDIATE: блокировка записи берётся до проверки статуса,
+    # поэтому два покупателя не могут купить один автомобиль. Занятая база — повтор с паузой.
+    def buy_car(self, car_id, buyer_id):
+        for attempt in range(PURCHASE_RETRIES + 1):
+            try:
+                self._buy_car(car_id, buyer_id)
+                break
+            except sqlite3.OperationalError as error:
+                if "locked" not in str(error) or attempt == PURCHASE_RETRIES:
+                    raise
+                time.sleep(PURCHASE_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5))
+        self.notify("sold", [car_id])
+
+    def _buy_car(self, car_id, buyer_id):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            car = self.conn.execute("SELECT owner_id, status FROM cars WHERE id = ?", (car_id,)).fetchone()
+            if car is None:
+                raise PurchaseError("Автомобиль снят с продажи")
+            if car[1] != "available":
+                raise PurchaseError("Автомобиль уже продан")
+            if car[0] == buyer_id:
+                raise PurchaseError("Нельзя купить собственный автомобиль")
+            self.conn.execute("UPDATE cars SET status = 'sold', sold_at = datetime('now') WHERE id = ?", (car_id,))
             self.conn.execute("""
-                   UPDATE cars SET brand = ?, model = ?, year = ?, price = ?, description = ?
-                   WHERE id = ?
-               """, (brand, model, year, price, description, car_id))
+                INSERT INTO sales (car_id, buyer_id, seller_id, price, sold_at, brand, model, year)
+                SELECT id, ?, owner_id, price, sold_at, brand, model, year FROM cars WHERE id = ?
+            """, (buyer_id, car_id))
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+
+    # Покупки от новых к старым по снимку в sales; after — id последней продажи предыдущей страницы
+    def get_purchase_history(self, buyer_id, after=None, limit=100):
+        sql = "SELECT id, brand, model, year, price, sold_at, car_id FROM sales WHERE buyer_id = ?"
+        params = [buyer_id]
+        if after is not None:
+            sql += " AND id < ?"
+            params.append(after)
+        sql += " ORDER BY id DESC LIMIT ?"
+        return records(self.conn.execute(sql, params + [limit]), Sale).fetchall()
+
+    def count_purchases(self, buyer_id):
+        return self.conn.execute("SELECT COUNT(*) FROM sales WHERE buyer_id = ?", (buyer_id,)).fetchone()[0]
+
+    # (число продаж, выручка, средняя цена) продавца из seller_stats
+    def get_seller_stats(self, seller_id):
+        row = self.conn.execute("SELECT sales_count, revenue FROM seller_stats WHERE seller_id = ?",
+                                (seller_id,)).fetchone()
+        count, revenue = row if row else (0, 0.0)
+        return count, revenue, revenue / count if count else 0.0
+
+    # Строки (год выпуска, число продаж, выручка, средняя цена)
+    def get_seller_year_stats(self, seller_id):
+        return self.conn.execute("""
+            SELECT year, sales_count, revenue, revenue / sales_count FROM seller_year_stats
+            WHERE seller_id = ? AND sales_count > 0 ORDER BY year
+        """, (seller_id,)).fetchall()
+
+    # Строки (марка, число продаж, выручка, средняя цена) по убыванию числа продаж
+    def get_brand_stats(self, limit=20):
+        return self.conn.execute("""
+            SELECT brand, sales_count, revenue, revenue / sales_count FROM brand_stats
+            WHERE sales_count > 0 ORDER BY sales_count DESC, brand LIMIT ?
+        """, (limit,)).fetchall()
+
+# Текст запросов строится по форме вызова и запоминается: та же форма даёт ту же строку SQL,
+# и sqlite3 берёт подготовленный запрос из кэша соединения, а не разбирает его заново
+@functools.lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def car_columns(fields):
+    return ", ".join(CAR_FIELD_COLUMNS[field] if field in fields else "NULL" for field in Car._fields)
+
+
+@functools.lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def car_filter_conditions(shape):
+    conditions = []
+    for name, count in shape:
+        condition = dict(CAR_FILTER_CONDITIONS)[name]
+        conditions.append(condition if count is None else condition.format(", ".join("?" * count)))
+    return tuple(conditions)
+
+
+def car_order(column, descending):
+    direction = "DESC" if descending else "ASC"
+    if column == "id":
+        return f" ORDER BY cars.id {direction}"
+    return f" ORDER BY cars.{column} {direction}, cars.id {direction}"
+
+
+@functools.lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def listing_sql(fields, shape, sort, descending, keyset):
+    column = CAR_SORT_COLUMNS[sort]
+    conditions = list(car_filter_conditions(shape))
+    # keyset — часть выдачи после ключа (list_cars): "value" — после ключа со значением,
+    # "null" — строки с NULL после id, "nulls" и "values" — все строки с NULL или со значением
+    operator = "<" if descending else ">"
+    if keyset == "value" and column == "id":
+        conditions.append(f"cars.id {operator} ?")
+    elif keyset == "value":
+        conditions.append(f"(cars.{column}, cars.id) {operator} (?, ?)")
+    elif keyset == "null":
+        conditions.append(f"cars.{column} IS NULL AND cars.id {operator} ?")
+    elif keyset == "nulls":
+        conditions.append(f"cars.{column} IS NULL")
+    elif keyset == "values":
+        conditions.append(f"cars.{column} IS NOT NULL")
+    sql = f"SELECT {car_columns(fields)} FROM cars"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    return sql + car_order(column, descending) + " LIMIT ?"
+
+
+# mode — "fts" (MATCH по индексу), "like" (terms слов по марке и модели) или None
+@functools.lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def search_sql(fields, shape, sort, descending, mode, terms):
+    conditions = list(car_filter_conditions(shape))
+    sql = f"SELECT {car_columns(fields)} FROM cars"
+    if mode == "fts":
+        sql += " JOIN cars_fts ON cars_fts.rowid = cars.id"
+        conditions.insert(0, "cars_fts MATCH ?")
+    elif mode == "like":
+        conditions += ["(cars.brand LIKE ? OR cars.model LIKE ?)"] * terms
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    if sort is not None:
+        sql += car_order(CAR_SORT_COLUMNS[sort], descending)
+    elif mode == "fts":
+        # Совпадения в марке и модели весят больше, чем в описании
+        sql += " ORDER BY bm25(cars_fts, 10.0, 10.0, 1.0)"
+    else:
+        sql += " ORDER BY cars.id"
+    return sql + " LIMIT ? OFFSET ?"
+
+
+def check_car_fields(changes):
+    unknown = changes.keys() - set(CAR_EDIT_FIELDS)
+    if unknown:
+        raise ValueError(f"Нельзя изменить поля автомобиля: {', '.join(sorted(unknown))}")
+
+
+# Пакетное изменение выбирает автомобили продавца из JSON-массива id: один запрос на любое
+# число автомобилей без предела числа параметров SQLite
+@functools.lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def car_update_sql(fields, price_factor, bulk):
+    assignments = [f"{field} = ?" for field in fields]
+    if price_factor:
+        assignments.append("price = ROUND(price * ?, 2)")
+    sql = f"UPDATE cars SET {', '.join(assignments)}"
+    if not bulk:
+        return sql + " WHERE id = ?"
+    return sql + " WHERE id IN (SELECT value FROM json_each(?)) AND owner_id = ? AND status = 'available' RETURNING id"
+
+
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+
+# Соединение для потока DatabasePool: схему создаёт и обновляет первое соединение к файлу,
+# остальные потоки ждут его, а не проверяют таблицы повторно
+def open_database(db_name):
+    with _schema_lock:
+        if db_name not in _schema_ready:
+            db = Database(db_name)
+            _schema_ready.add(db_name)
+            return db
+    return Database(db_name, init_schema=False)
+
+
+# Ключ порядка строки в выдаче list_cars: NULL в SQLite идёт раньше любых значений
+def car_sort_key(sort, row):
+    if sort == "id":
+        return (row.id,)
+    value = getattr(row, sort)
+    return (value is not None, value, row.id)
+
+
+# Постраничный источник строк для CarTableModel поверх list_cars.
+# fetch_ids и sort_key нужны модели для точечного применения изменений (CarChange).
+class CarPager:
+    def __init__(self, sort="id", descending=False, fields=CAR_FIELDS, **filters):
+        self.sort = sort
+        self.descending = descending
+        self.fields = fields
+        self.filters = filters
+        # Ключ последней загруженной строки
+        self.position = None
+
+    def fresh(self):
+        return CarPager(self.sort, self.descending, self.fields, **self.filters)
+
+    def fetch(self, db, size, after):
+        rows = db.list_cars(self.sort, self.descending, after, size, self.fields, **self.filters)
+        if not rows:
+            return rows, after
+        last = rows[-1]
+        return rows, (last.id,) if self.sort == "id" else (getattr(last, self.sort), last.id)
+
+    def advance(self, after):
+        self.position = after
+
+    # Строки из ids, подходящие под фильтры выборки
+    def fetch_ids(self, db, ids):
+        return db.list_cars(self.sort, self.descending, None, len(ids), self.fields, ids=ids, **self.filters)
+
+    def sort_key(self, row):
+        return car_sort_key(self.sort, row)
+
+    def row_inserted(self):
+        pass
+
+    def row_removed(self):
+        pass
+
+
+# Постраничный источник строк для CarTableModel поверх search_cars
+class SearchPager:
+    def __init__(self, query, sort=None, descending=False, fields=CAR_FIELDS, **filters):
+        self.query = query
+        self.sort = sort
+        self.descending = descending
+        self.fields = fields
+        self.filters = filters
+        # Смещение следующей страницы
+        self.position = 0
+
+    def fresh(self):
+        return SearchPager(self.query, self.sort, self.descending, self.fields, **self.filters)
+
+    def fetch(self, db, size, offset):
+        rows = db.search_cars(self.query, size, offset, self.sort, self.descending, self.fields, **self.filters)
+        return rows, len(rows)
+
+    # Смещение сдвигается на число прочитанных строк, а не ставится заново: пока порция читалась,
+    # его могли сдвинуть вставленные и удалённые строки
+    def advance(self, count):
+        self.position += count
+
+    def fetch_ids(self, db, ids):
+        return db.search_cars(self.query, len(ids), 0, self.sort, self.descending, self.fields, ids=ids,
+                              **self.filters)
+
+    # При сортировке по релевантности место новой строки неизвестно
+    def sort_key(self, row):
+        return None if self.sort is None else car_sort_key(self.sort, row)
+
+    # Смещение следующей страницы сдвигается вместе с загруженными строками
+    def row_inserted(self):
+        self.position += 1
+
+    def row_removed(self):
+        self.position = max(0, self.position - 1)
+
+
+# Постраничный источник строк для CarTableModel поверх каталога в памяти (columnar.CarCatalog):
+# фильтры и сортировка считаются по колонкам каталога один раз, из базы читаются только
+# миниатюры страницы. Порядок строк фиксируется при первой порции.
+class CatalogPager:
+    def __init__(self, catalog, sort="id", descending=False, **filters):
+        self.catalog = catalog
+        self.sort = sort
+        self.descending = descending
+        self.filters = filters
+        # Порядок строк (позиции в каталоге) и смещение в нём
+        self.position = (None, 0)
+
+    def fresh(self):
+        return CatalogPager(self.catalog, self.sort, self.descending, **self.filters)
+
+    def fetch(self, db, size, position):
+        order, offset = position
+        if order is None:
+            order = self.catalog.select(self.sort, self.descending, **self.filters)
+        # Проданные после выборки автомобили пропускаются, порция добирается следующими
+        rows = []
+        while len(rows) < size and offset < len(order):
+            page = order[offset:offset + size - len(rows)]
+            offset += len(page)
+            rows += self.catalog.rows(page)
+        if rows:
+            thumbnails = dict(db.get_thumbnails([row.id for row in rows]))
+            rows = [Car(*row[:7], thumbnails.get(row.id)) for row in rows]
+        return rows, (order, offset)
+
+    def advance(self, position):
+        self.position = position
+
+    # Строки каталога без описания, как и выборка покупателя
+    def fetch_ids(self, db, ids):
+        return db.list_cars(self.sort, self.descending, None, len(ids), BUYER_CAR_FIELDS, ids=ids, **self.filters)
+
+    def sort_key(self, row):
+        return car_sort_key(self.sort, row)
+
+    # Строки, вставленные и удалённые по событиям, не сдвигают зафиксированный порядок
+    def row_inserted(self):
+        pass
+
+    def row_removed(self):
+        pass
+
+
+# Сумма с разделением разрядов пробелами: 1 500 000
+def format_money(value):
+    return f"{value:,.0f}".replace(",", " ")
+
+
+# Постраничный источник покупок для CarTableModel
+class HistoryPager:
+    def __init__(self, buyer_id):
+        self.buyer_id = buyer_id
+        # id последней загруженной покупки
+        self.position = None
+
+    def fetch(self, db, size, after):
+        rows = db.get_purchase_history(self.buyer_id, after, size)
+        return rows, rows[-1].id if rows else after
+
+    def advance(self, after):
+        self.position = after
+
+
+# История покупок: строки подгружаются по мере прокрутки
+class PurchaseHistoryDialog(QDialog):
+    def __init__(self, db_pool, buyer_id, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("История покупок")
+        self.resize(700, 500)
+        layout = QVBoxLayout()
+        self.total_label = QLabel("Всего покупок: ...")
+        layout.addWidget(self.total_label)
+        self.model = CarTableModel(
+            db_pool, [("Марка", "brand"), ("Модель", "model"), ("Год", "year"), ("Цена", "price"),
+                      ("Дата покупки", "sold_at")], parent=self
+        )
+        table = QTableView()
+        table.setModel(self.model)
+        table.verticalHeader().hide()
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        layout.addWidget(table)
+        self.setLayout(layout)
+        self.model.set_source(HistoryPager(buyer_id))
+        db_pool.run("count_purchases", buyer_id,
+                    on_result=lambda total: self.total_label.setText(f"Всего покупок: {total}"))
 
-    def buy_car(self, car_id, buyer_id):
-        with self.conn:
-            self.conn.execute("INSERT INTO sales (car_id, buyer_id) VALUES (?, ?)", (car_id, buyer_id))
-            self.conn.execute("DELETE FROM cars WHERE id = ?", (car_id,))
 
-    # def get_purchase_history(self, buyer_id):
-    #     return self.conn.execute("""
-    #         SELECT cars.name, cars.price FROM sales
-    #         JOIN cars ON sales.car_id = cars.id
-    #         WHERE sales.buyer_id = ?
-    #     """, (buyer_id,)).fetchall()
+# Статистика продаж продавца по годам выпуска и общая по маркам
+class SalesStatsDialog(QDialog):
+    def __init__(self, db_pool, seller_id, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Статистика продаж")
+        self.resize(700, 500)
+        layout = QVBoxLayout()
+        layout.addWidget(QLabel("Ваши продажи по годам выпуска"))
+        self.year_table = self.create_table(["Год", "Продано", "Выручка", "Средняя цена"])
+        layout.addWidget(self.year_table)
+        layout.addWidget(QLabel("Самые продаваемые марки"))
+        self.brand_table = self.create_table(["Марка", "Продано", "Выручка", "Средняя цена"])
+        layout.addWidget(self.brand_table)
+        self.setLayout(layout)
+        db_pool.run("get_seller_year_stats", seller_id,
+                    on_result=lambda rows: self.fill_table(self.year_table, rows))
+        db_pool.run("get_brand_stats", on_result=lambda rows: self.fill_table(self.brand_table, rows))
+
+    @staticmethod
+    def create_table(headers):
+        table = QTableWidget(0, len(headers))
+        table.setHorizontalHeaderLabels(headers)
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        return table
+
+    @staticmethod
+    def fill_table(table, rows):
+        table.setRowCount(len(rows))
+        for row, values in enumerate(rows):
+            for column, value in enumerate(values):
+                text = format_money(value) if isinstance(value, float) else str(value)
+                table.setItem(row, column, QTableWidgetItem(text))
+
+
+# Форма автомобиля. С car — изменение: поля заполнены текущими значениями, в changes попадают
+# только изменённые. С count — пакетное изменение выбранных: пустое поле не меняется, цена
+# меняется на процент. Без того и другого — добавление. Для одного автомобиля обязательны все
+# поля, кроме описания.
+class CarEditorDialog(QDialog):
+    def __init__(self, title, car=None, count=0, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(title)
+        self.car = car
+        self.count = count
+        self.changes = {}
+        self.price_factor = None
+        layout = QFormLayout()
+        if count:
+            layout.addRow(QLabel(f"Выбрано автомобилей: {count}. Пустые поля не изменяются."))
+        self.inputs = {}
+        for name, label, validator in (
+            ("brand", "Марка", None),
+            ("model", "Модель", None),
+            ("year", "Год выпуска", QIntValidator(1800, 3000)),
+            ("price", "Цена", QDoubleValidator(0, 1e12, 2)),
+            ("description", "Описание", None),
+        ):
+            field = QLineEdit()
+            if validator is not None:
+                field.setValidator(validator)
+            if car is not None and getattr(car, name) is not None:
+                value = getattr(car, name)
+                field.setText(f"{value:.2f}".rstrip("0").rstrip(".") if name == "price" else str(value))
+            layout.addRow(label, field)
+            self.inputs[name] = field
+        self.percent_input = None
+        if count:
+            self.percent_input = QLineEdit()
+            self.percent_input.setValidator(QDoubleValidator(-99, 1000, 2))
+            self.percent_input.setPlaceholderText("-5 — скидка 5 %")
+            layout.addRow("Изменить цену, %", self.percent_input)
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addRow(buttons)
+        self.setLayout(layout)
+
+    # Значения заполненных полей
+    def values(self):
+        values = {}
+        for name, field in self.inputs.items():
+            text = field.text().strip()
+            if not text:
+                continue
+            if name == "year":
+                values[name] = int(text)
+            elif name == "price":
+                values[name] = float(text.replace(",", "."))
+            else:
+                values[name] = text
+        return values
+
+    def accept(self):
+        try:
+            values = self.values()
+            percent = self.percent_input.text().strip().replace(",", ".") if self.percent_input else ""
+            self.price_factor = 1 + float(percent) / 100 if percent else None
+        except ValueError:
+            QMessageBox.warning(self, "Ошибка", "Год и цена должны быть числами.")
+            return
+        if self.count:
+            if "price" in values and self.price_factor is not None:
+                QMessageBox.warning(self, "Ошибка", "Укажите либо новую цену, либо процент изменения.")
+                return
+            self.changes = values
+        else:
+            if any(name not in values for name in ("brand", "model", "year", "price")):
+                QMessageBox.warning(self, "Ошибка", "Заполните марку, модель, год выпуска и цену.")
+                return
+            values.setdefault("description", "")
+            self.changes = values
+            if self.car is not None:
+                # Пустое поле описания показывает и NULL, и "": такое описание не считается изменённым
+                car = self.car._replace(description=self.car.description or "")
+                self.changes = {name: value for name, value in values.items() if value != getattr(car, name)}
+        super().accept()
+
 
 # Главное окно
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, db_name="cars.db", server=None, cache_mb=64, sync=None):
         super().__init__()
         self.setWindowTitle("Продажа автомобилей")
         self.setGeometry(300, 200, 800, 600)
 
-        self.db = Database()
+        self.db_name = db_name
+        # Все запросы интерфейса выполняются в фоновых потоках со своими соединениями;
+        # база открывается и проверяется в фоне первым же запросом, а не при запуске.
+        # С адресом сервера (main.py serve) база общая для нескольких рабочих мест.
+        def open_storage():
+            if server is None:
+                return open_database(self.db_name)
+            return RemoteDatabase(server)
+
+        # Повторные выборки (поиск, возврат к таблице, выгрузка) отдаются из общего кэша, пока
+        # их таблицы не изменились
+        self.query_cache = QueryCache(cache_mb * 1024 * 1024) if cache_mb else None
+        if self.query_cache is None:
+            self.db_pool = DatabasePool(open_storage)
+        else:
+            self.db_pool = DatabasePool(lambda: CachedDatabase(open_storage(), self.query_cache))
+        self.photo_store = PhotoStore.for_database(self.db_name)
+        self.photo_cache = PhotoCache(resolve_path=self.photo_store.resolve)
         self.stacked_widget = QStackedWidget()
         self.setCentralWidget(self.stacked_widget)
+        startup.mark("Пул базы и кэш фотографий")
 
-        self.login_window = LoginWindow(self.db, self)
-        self.registration_window = RegistrationWindow(self.db, self)
-        self.dashboard = Dashboard(self.db, self)
+        # Тема ставится на всё приложение до создания окон, чтобы каждый виджет оформлялся один раз;
+        # хранится здесь, а не в панели, и переживает выход из учётной записи
+        self.theme = themes.THEMES[0]
+        themes.apply_theme(QApplication.instance(), self.theme)
 
+        # Регистрация и панель управления создаются при первом переходе на них
+        self.login_window = LoginWindow(self)
+        self.registration_window = None
+        self.dashboard = None
         self.stacked_widget.addWidget(self.login_window)
-        self.stacked_widget.addWidget(self.registration_window)
-        self.stacked_widget.addWidget(self.dashboard)
+        startup.mark("Окно входа")
+
+        # Изменения с других рабочих мест приходят опросом журнала сервера
+        self.change_seq = None
+        self.change_polling = False
+        if server is not None:
+            self.change_timer = QTimer(self)
+            self.change_timer.setInterval(CHANGE_POLL_MS)
+            self.change_timer.timeout.connect(self.poll_changes)
+            self.change_timer.start()
+            self.poll_changes()
+
+        # Реплика: все чтения идут из своего файла, а изменения с узлом (файл или сервер) —
+        # фоном; без связи с узлом работа продолжается, обмен догонит при следующей попытке
+        self.sync_peer = None
+        self.syncing = False
+        if sync is not None:
+            from replication import connect_peer
+
+            self.sync_peer = connect_peer(sync, open_database)
+            self.sync_timer = QTimer(self)
+            self.sync_timer.setInterval(SYNC_MS)
+            self.sync_timer.timeout.connect(self.sync_now)
+            self.sync_timer.start()
+            self.sync_now()
+
+        # Статистика, свободные страницы и резервная копия — в фоне; базу сервера обслуживает сервер
+        self.maintaining = False
+        if server is None:
+            self.maintenance_timer = QTimer(self)
+            self.maintenance_timer.setInterval(MAINTENANCE_MS)
+            self.maintenance_timer.timeout.connect(self.maintain)
+            self.maintenance_timer.start()
+            QTimer.singleShot(MAINTENANCE_DELAY_MS, self.maintain)
+
+        if instrumentation.enabled:
+            stats_shortcut = QShortcut(QKeySequence("Ctrl+Shift+P"), self)
+            stats_shortcut.activated.connect(lambda: instrumentation.StatsDialog(self).show())
 
         self.show_login()
 
+    def set_theme(self, name):
+        self.theme = name
+        themes.apply_theme(QApplication.instance(), name)
+
     def show_login(self):
         self.stacked_widget.setCurrentWidget(self.login_window)
 
     def show_registration(self):
+        if self.registration_window is None:
+            self.registration_window = RegistrationWindow(self)
+            self.stacked_widget.addWidget(self.registration_window)
         self.stacked_widget.setCurrentWidget(self.registration_window)
 
     def show_dashboard(self, user_id, role):
+        if self.dashboard is None:
+            self.dashboard = Dashboard(self)
+            self.stacked_widget.addWidget(self.dashboard)
         self.dashboard.set_user(user_id, role)
         self.stacked_widget.setCurrentWidget(self.dashboard)
 
+    def poll_changes(self):
+        if self.change_polling:
+            return
+        self.change_polling = True
+        self.db_pool.run("changes_since", self.change_seq,
+                         on_result=self.changes_polled, on_error=lambda error: self.changes_polled(self.change_seq))
+
+    def changes_polled(self, seq):
+        self.change_seq = seq
+        self.change_polling = False
+
+    def sync_now(self):
+        from replication import sync_replica
+
+        if self.syncing:
+            return
+        self.syncing = True
+        self.db_pool.run(writing_task(sync_replica), self.sync_peer, on_result=self.synced,
+                         on_error=self.sync_failed)
+
+    def synced(self, stats):
+        self.syncing = False
+        self.statusBar().showMessage(
+            f"Синхронизация {time.strftime('%H:%M:%S')}: получено {stats['applied']}, отправлено {stats['sent']}"
+            + (f", отменено продаж при слиянии: {stats['conflicts']}" if stats["conflicts"] else "")
+        )
+
+    def sync_failed(self, error):
+        self.syncing = False
+        self.statusBar().showMessage(f"Нет связи с узлом синхронизации: {error}")
+
+    def maintain(self):
+        from maintenance import run_maintenance
+
+        if self.maintaining:
+            return
+        self.maintaining = True
+        self.db_pool.run(writing_task(run_maintenance), on_result=self.maintained, on_error=self.maintenance_failed)
+
+    def maintained(self, result):
+        self.maintaining = False
+        if result["backup"]:
+            self.statusBar().showMessage(f"Резервная копия базы: {result['backup']}")
+
+    def maintenance_failed(self, error):
+        self.maintaining = False
+        report_error(error)
+
+    def closeEvent(self, event):
+        self.db_pool.shutdown()
+        if self.sync_peer is not None:
+            self.sync_peer.close()
+        self.photo_cache.shutdown()
+        super().closeEvent(event)
+
 # Окно авторизации
 class LoginWindow(QWidget):
-    def __init__(self, db, main_window):
+    def __init__(self, main_window):
         super().__init__()
-        self.db = db
+        self.db_pool = main_window.db_pool
         self.main_window = main_window
+        self.throttle = LoginThrottle()
 
         layout = QVBoxLayout()
 
@@ -191,23 +1289,6 @@ class LoginWindow(QWidget):
         layout.addWidget(self.register_button)
 
         self.setLayout(layout)
-        self.setStyleSheet("""
-                    QLineEdit#Username_input, QLineEdit#Password_input {
-                        border: 2px solid blue;
-                        border-radius: 5px;
-                        padding: 5px;
-                    }
-                    QPushButton#register_button, QPushButton#Login_button{
-                        background-color: blue;
-                        color: white;
-                        border: none;
-                        border-radius: 5px;
-                        padding: 10px;
-                    }
-                    QPushButton#Login_button:hover {
-                        background-color: blue;
-                    }
-                """)
 
     def login(self):
         username = self.username_input.text()
@@ -215,20 +1296,34 @@ class LoginWindow(QWidget):
         if not username or not password:
             QMessageBox.warning(self, "Ошибка", "Пожалуйста, заполните все поля")
             return
-        user = self.db.authenticate_user(username, password)
+        remaining = self.throttle.remaining(username)
+        if remaining > 0:
+            QMessageBox.warning(self, "Ошибка", f"Слишком много неудачных попыток. Повторите через {remaining:.0f} с.")
+            return
+        self.login_button.setEnabled(False)
+        self.db_pool.run("authenticate_user", username, password,
+                         on_result=lambda user: self.on_authenticated(username, user), on_error=self.on_login_error)
 
+    def on_authenticated(self, username, user):
+        self.login_button.setEnabled(True)
         if user:
-            user_id, role = user
-            self.main_window.show_dashboard(user_id, role)
+            self.throttle.succeeded(username)
+            self.password_input.clear()
+            self.main_window.show_dashboard(user.id, user.role)
         else:
+            self.throttle.failed(username)
             QMessageBox.warning(self, "Ошибка", "Неверное имя пользователя или пароль")
 
+    def on_login_error(self, error):
+        self.login_button.setEnabled(True)
+        QMessageBox.critical(self, "Ошибка", f"Не удалось выполнить вход: {error}")
+
 
 # Окно регистрации
 class RegistrationWindow(QWidget):
-    def __init__(self, db, main_window):
+    def __init__(self, main_window):
         super().__init__()
-        self.db = db
+        self.db_pool = main_window.db_pool
         self.main_window = main_window
 
 
@@ -258,23 +1353,6 @@ class RegistrationWindow(QWidget):
         layout.addWidget(self.register_button)
 
         self.setLayout(layout)
-        self.setStyleSheet("""
-            QLineEdit#usernameInput, QLineEdit#passwordInput {
-                border: 2px solid blue;
-                border-radius: 5px;
-                padding: 5px;
-            }
-            QPushButton#registerButton {
-                background-color: blue;
-                color: white;
-                border: none;
-                border-radius: 5px;
-                padding: 10px;
-            }
-            QPushButton#registerButton:hover {
-                background-color: blue;
-            }
-        """)
 
     def register(self):
         username = self.username_input.text()
@@ -284,7 +1362,12 @@ class RegistrationWindow(QWidget):
             QMessageBox.warning(self, "Ошибка", "Пожалуйста, заполните все поля")
             return
 
-        if self.db.register_user(username, password, role):
+        self.register_button.setEnabled(False)
+        self.db_pool.run("register_user", username, password, role, on_result=self.on_registered)
+
+    def on_registered(self, registered):
+        self.register_button.setEnabled(True)
+        if registered:
             QMessageBox.information(self, "Успех", "Регистрация прошла успешно")
             self.main_window.show_login()
         else:
@@ -292,16 +1375,25 @@ class RegistrationWindow(QWidget):
 
 # Панель управления
 class Dashboard(QWidget):
-    def __init__(self, db, main_window):
+    def __init__(self, main_window):
         super().__init__()
-        self.db = db
+        self.db_pool = main_window.db_pool
+        self.photo_store = main_window.photo_store
+        self.photo_cache = main_window.photo_cache
         self.main_window = main_window
         self.user_id = None
         self.role = None
-        self.theme = "light"
+        # Каталог доступных автомобилей в памяти; загружается при первом входе покупателя
+        self.catalog = None
+        # Таблицы и таймер поиска текущей роли; при новом входе создаются заново
+        self.my_cars_model = None
+        self.cars_model = None
+        self.search_timer = None
 
         self.layout = QVBoxLayout()
-        self.setStyleSheet(load_stylesheet())  # Применяем стили
+
+        # Таблицы обновляются точечно по событиям базы, а не перезапросом всей выборки
+        self.db_pool.events.car_changed.connect(self.apply_car_change)
 
         self.user_label = QLabel("Добро пожаловать!")
         self.logout_button = QPushButton("Выйти")
@@ -320,11 +1412,37 @@ class Dashboard(QWidget):
         self.user_label.setText(f"Добро пожаловать! Роль: {role}")
         self.update_dashboard()
 
+    def apply_car_change(self, change):
+        if self.catalog is not None:
+            self.db_pool.run(self.catalog.apply_change, change)
+        if self.role == "Продавец":
+            self.my_cars_model.apply_change(change)
+            if change.kind in ("sold", "reset"):
+                self.update_sales_stats()
+        elif self.role == "Покупатель":
+            self.cars_model.apply_change(change)
+
     def update_dashboard(self):
-        for i in reversed(range(self.layout.count())):
-            widget = self.layout.itemAt(i).widget()
-            if widget:
-                widget.deleteLater()
+        # Удаляем виджеты предыдущей роли, постоянные элементы панели сохраняем
+        persistent = (self.user_label, self.theme_button, self.logout_button)
+        while self.layout.count():
+            item = self.layout.takeAt(0)
+            if item.layout() is not None:
+                while item.layout().count():
+                    child = item.layout().takeAt(0).widget()
+                    if child:
+                        child.deleteLater()
+            elif item.widget() and item.widget() not in persistent:
+                item.widget().deleteLater()
+        # Ответы пула на запросы прежних таблиц и срабатывание прежнего таймера поиска
+        # не должны попасть в удалённые виджеты
+        for model in (self.my_cars_model, self.cars_model):
+            if model is not None:
+                model.dispose()
+        if self.search_timer is not None:
+            self.search_timer.stop()
+            self.search_timer.deleteLater()
+        self.my_cars_model = self.cars_model = self.search_timer = None
 
         self.layout.addWidget(self.user_label)
         self.layout.addWidget(self.theme_button)
@@ -335,24 +1453,61 @@ class Dashboard(QWidget):
         elif self.role == "Покупатель":
             self.add_buyer_dashboard()
 
-    def add_seller_dashboard(self):
-        add_car_button = QPushButton("Добавить автомобиль")
-        add_car_button.clicked.connect(self.add_car)
-        self.layout.addWidget(add_car_button)
-
-        self.my_cars_table = QTableWidget()
-        self.update_my_cars_table()
-        self.layout.addWidget(self.my_cars_table)
-
     def add_buyer_dashboard(self):
         # Поле поиска
         self.search_input = QLineEdit()
         self.search_input.setPlaceholderText("Введите марку или модель для поиска...")
-        self.search_input.textChanged.connect(self.update_available_cars_table)
+        # Запрос выполняется после паузы в наборе, а не на каждое нажатие клавиши
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(250)
+        self.search_timer.timeout.connect(self.update_available_cars_table)
+        self.search_input.textChanged.connect(self.search_timer.start)
         self.layout.addWidget(self.search_input)
 
+        # Фильтры по цене, году и маркам
+        filter_panel = QWidget()
+        filter_layout = QHBoxLayout(filter_panel)
+        filter_layout.setContentsMargins(0, 0, 0, 0)
+        self.filter_inputs = {}
+        for name, placeholder, validator in (
+            ("price_min", "Цена от", QDoubleValidator(0, 1e12, 2)),
+            ("price_max", "Цена до", QDoubleValidator(0, 1e12, 2)),
+            ("year_min", "Год от", QIntValidator(1800, 3000)),
+            ("year_max", "Год до", QIntValidator(1800, 3000)),
+            ("brands", "Марки через запятую", None),
+        ):
+            field = QLineEdit()
+            field.setPlaceholderText(placeholder)
+            if validator is not None:
+                field.setValidator(validator)
+            field.textChanged.connect(self.search_timer.start)
+            filter_layout.addWidget(field)
+            self.filter_inputs[name] = field
+        self.layout.addWidget(filter_panel)
+        self.catalog_label = QLabel()
+        self.layout.addWidget(self.catalog_label)
+
+        # Пока каталог загружается, таблица читает базу постранично
+        if self.catalog is None:
+            self.catalog = CarCatalog()
+            self.db_pool.run(self.catalog.load, on_result=lambda count: self.catalog_loaded())
+
         # Таблица доступных автомобилей
-        self.cars_table = QTableWidget()
+        self.cars_model = CarTableModel(
+            self.db_pool, [("Фото", "thumbnail"), ("Марка", "brand", "brand"), ("Модель", "model"),
+                           ("Цена", "price", "price")], ["Купить"],
+            photo_cache=self.photo_cache, thumbnail_column=0, parent=self
+        )
+        self.cars_table = self.create_table_view(self.cars_model, self.update_available_cars_table)
+        buy_delegate = ButtonDelegate("Купить", parent=self.cars_table)
+        buy_delegate.clicked.connect(lambda row: self.buy_car(self.cars_model.car_id(row)))
+        self.cars_table.setItemDelegateForColumn(4, buy_delegate)
+        header = self.cars_table.horizontalHeader()
+        header.setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        header.setSectionResizeMode(0, QHeaderView.ResizeMode.Fixed)
+        header.resizeSection(0, 64)
+        header.setSectionResizeMode(4, QHeaderView.ResizeMode.ResizeToContents)
         self.update_available_cars_table()
         self.layout.addWidget(self.cars_table)
 
@@ -361,259 +1516,502 @@ class Dashboard(QWidget):
         view_history_button.clicked.connect(self.view_purchase_history)
         self.layout.addWidget(view_history_button)
 
-    def update_my_cars_table(self):
-        cars = self.db.get_user_cars(self.user_id)
-        self.my_cars_table.setRowCount(len(cars))
-        self.my_cars_table.setColumnCount(8)
-        header = self.my_cars_table.horizontalHeader()
-        header.setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
-        header.setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)
-        header.setSectionResizeMode(2, QHeaderView.ResizeMode.Stretch)
-        header.setSectionResizeMode(3, QHeaderView.ResizeMode.Stretch)
-        header.setSectionResizeMode(4, QHeaderView.ResizeMode.Stretch)
-        header.setSectionResizeMode(5, QHeaderView.ResizeMode.ResizeToContents)
-        header.setSectionResizeMode(6, QHeaderView.ResizeMode.ResizeToContents)
-        header.setSectionResizeMode(7, QHeaderView.ResizeMode.ResizeToContents)
-
-        self.my_cars_table.setHorizontalHeaderLabels(
-            ["Марка", "Модель", "Год", "Цена", "Описание", "Фотографии", "Добавление", "Удаление"]
+    def create_table_view(self, model, on_sort):
+        table = QTableView()
+        # Модель удаляется вместе с таблицей при смене роли
+        model.setParent(table)
+        table.setModel(model)
+        table.setMouseTracking(True)
+        table.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        table.verticalHeader().setDefaultSectionSize(36)
+        # Щелчок по заголовку меняет сортировку в запросе к базе
+        table.horizontalHeader().setSortIndicator(-1, Qt.SortOrder.AscendingOrder)
+        table.setSortingEnabled(True)
+        model.sort_requested.connect(on_sort)
+        model.busy_changed.connect(
+            lambda busy: table.viewport().setCursor(Qt.CursorShape.BusyCursor) if busy else table.viewport().unsetCursor()
         )
+        return table
 
-        for row, (car_id, brand, model, year, price, description) in enumerate(cars):
-            self.my_cars_table.setItem(row, 0, QTableWidgetItem(brand))
-            self.my_cars_table.setItem(row, 1, QTableWidgetItem(model))
-            self.my_cars_table.setItem(row, 2, QTableWidgetItem(str(year)))
-            self.my_cars_table.setItem(row, 3, QTableWidgetItem(str(price)))
-            self.my_cars_table.setItem(row, 4, QTableWidgetItem(description))
-
-            # Фотографии: добавляем кнопку для просмотра
-            photos_button = QPushButton("Просмотреть")
-            photos_button.clicked.connect(lambda checked, car_id=car_id: self.view_photos(car_id))
-
-            # Действия: кнопки редактирования и удаления
-
-            edit_button = QPushButton("Изменить")
-            edit_button.setObjectName("editButton")
-            edit_button.clicked.connect(lambda checked, car_id=car_id: self.edit_car(car_id))
-
-
-            delete_button = QPushButton("Удалить")
-            delete_button.setObjectName("deleteButton")
-            delete_button.clicked.connect(lambda checked, car_id=car_id: self.delete_car(car_id))
+    def create_progress_dialog(self, text, total):
+        progress_dialog = QProgressDialog(text, None, 0, total, self)
+        progress_dialog.setWindowModality(Qt.WindowModality.WindowModal)
+        progress_dialog.setMinimumDuration(300)
+        return progress_dialog
 
-            self.my_cars_table.setCellWidget(row, 5, photos_button)  # Фото
-            self.my_cars_table.setCellWidget(row, 6, edit_button)  # Действия
-            self.my_cars_table.setCellWidget(row, 7, delete_button)
-
-        self.my_cars_table.resizeColumnsToContents()
+    def update_my_cars_table(self):
+        model = self.my_cars_model
+        model.set_source(CarPager(model.sort_key, model.descending, owner_id=self.user_id))
+
+    def car_filters(self):
+        filters = {"exclude_owner": self.user_id}
+        for name in ("price_min", "price_max"):
+            text = self.filter_inputs[name].text().replace(",", ".")
+            if text:
+                filters[name] = float(text)
+        for name in ("year_min", "year_max"):
+            text = self.filter_inputs[name].text()
+            if text:
+                filters[name] = int(text)
+        brands = [brand.strip() for brand in self.filter_inputs["brands"].text().split(",") if brand.strip()]
+        if brands:
+            filters["brands"] = brands
+        return filters
 
     def view_photos(self, car_id):
-        photos = self.db.get_car_photos(car_id)
+        self.db_pool.run("get_car_photos", car_id, on_result=self.show_photos)
+
+    def show_photos(self, photos):
         if not photos:
             QMessageBox.information(self, "Нет фотографий", "У этого автомобиля нет фотографий.")
             return
-
-        current_index = 0
-
-        def show_photo(index):
-            pixmap = QPixmap(photos[index][0])
-            photo_label.setPixmap(pixmap.scaled(400, 400, Qt.AspectRatioMode.KeepAspectRatio))
-
-        photo_dialog = QDialog(self)
-        photo_layout = QVBoxLayout()
-        photo_label = QLabel()
-        photo_layout.addWidget(photo_label)
-
-        prev_button = QPushButton("Назад")
-        next_button = QPushButton("Вперед")
-
-        def prev_photo():
-            nonlocal current_index
-            current_index = (current_index - 1) % len(photos)
-            show_photo(current_index)
-
-        def next_photo():
-            nonlocal current_index
-            current_index = (current_index + 1) % len(photos)
-            show_photo(current_index)
-
-        prev_button.clicked.connect(prev_photo)
-        next_button.clicked.connect(next_photo)
-
-        button_layout = QHBoxLayout()
-        button_layout.addWidget(prev_button)
-        button_layout.addWidget(next_button)
-
-        photo_layout.addLayout(button_layout)
-        photo_dialog.setLayout(photo_layout)
-        photo_dialog.setWindowTitle("Фотографии автомобиля")
-        show_photo(current_index)
-        photo_dialog.exec()
+        PhotoViewer(self.photo_cache, [photo.filepath for photo in photos], self).exec()
 
     def update_available_cars_table(self):
-        # Получение автомобилей из базы
-        cars = self.db.get_cars(exclude_owner=self.user_id)
-
-        # Фильтрация по поисковому запросу
-        search_text = self.search_input.text().lower() if hasattr(self, 'search_input') else ""
+        # Поиск выполняется по индексу FTS5, строки подгружаются по мере прокрутки.
+        # Новый запрос отменяет предыдущий, устаревшие результаты отбрасываются моделью.
+        search_text = self.search_input.text().strip()
+        model = self.cars_model
+        filters = self.car_filters()
         if search_text:
-            cars = [car for car in cars if search_text in car[1].lower() or search_text in car[2].lower()]
-
-        self.cars_table.setRowCount(len(cars))
-        self.cars_table.setColumnCount(4)
-        self.cars_table.setHorizontalHeaderLabels(["Марка", "Модель", "Цена", "Купить"])
-
-        for row, (car_id, brand, model, year, price, description, owner_id) in enumerate(cars):
-            self.cars_table.setItem(row, 0, QTableWidgetItem(brand))
-            self.cars_table.setItem(row, 1, QTableWidgetItem(model))
-            self.cars_table.setItem(row, 2, QTableWidgetItem(str(price)))
-
-            buy_button = QPushButton("Купить")
-            buy_button.clicked.connect(lambda checked, car_id=car_id: self.buy_car(car_id))
-            self.cars_table.setCellWidget(row, 3, buy_button)
+            sort = None if model.sort_key == "id" else model.sort_key
+            model.set_source(SearchPager(search_text, sort, model.descending, BUYER_CAR_FIELDS, **filters))
+        elif self.catalog.loaded:
+            model.set_source(CatalogPager(self.catalog, model.sort_key, model.descending, **filters))
+        else:
+            model.set_source(CarPager(model.sort_key, model.descending, BUYER_CAR_FIELDS, **filters))
+        self.update_catalog_summary(filters)
+
+    def catalog_loaded(self):
+        if self.role == "Покупатель" and not self.search_input.text().strip():
+            self.update_available_cars_table()
+
+    # Сводка по фильтрам без учёта строки поиска: сколько автомобилей и в каких пределах цены и года
+    def update_catalog_summary(self, filters):
+        def show(summary):
+            if self.role != "Покупатель":
+                return
+            if not summary["count"]:
+                self.catalog_label.setText("Подходящих автомобилей нет")
+                return
+            parts = [f"Подходит автомобилей: {format_money(summary['count'])}"]
+            if summary["price_min"] is not None:
+                parts.append(f"цена {format_money(summary['price_min'])} – {format_money(summary['price_max'])}")
+            if summary["year_min"] is not None:
+                parts.append(f"годы {summary['year_min']} – {summary['year_max']}")
+            self.catalog_label.setText(", ".join(parts))
+
+        if self.catalog.loaded:
+            self.db_pool.run(lambda db: self.catalog.summary(**filters), on_result=show)
+        else:
+            self.catalog_label.setText("")
 
     def add_car(self):
-        brand, ok = QInputDialog.getText(self, "Добавить автомобиль", "Введите марку автомобиля:")
-        if ok and brand:
-            model, ok = QInputDialog.getText(self, "Добавить автомобиль", "Введите модель автомобиля:")
-            if ok and model:
-                year, ok = QInputDialog.getInt(self, "Добавить автомобиль", "Введите год выпуска:")
-                if ok:
-                    price, ok = QInputDialog.getDouble(self, "Добавить автомобиль", "Введите цену:")
-                    if ok:
-                        description, ok = QInputDialog.getText(self, "Добавить автомобиль", "Введите описание:")
-                        if ok:
-                            car_id = self.db.add_car(brand, model, year, price, description, self.user_id)
-                            self.add_car_photos(car_id)
-                            self.update_my_cars_table()
+        dialog = CarEditorDialog("Добавить автомобиль", parent=self)
+        if dialog.exec():
+            car = dialog.changes
+            self.db_pool.run("add_car", car["brand"], car["model"], car["year"], car["price"], car["description"],
+                             self.user_id, on_result=self.add_car_photos)
 
     def add_car_photos(self, car_id):
         file_dialog = QFileDialog(self)
         file_dialog.setFileMode(QFileDialog.FileMode.ExistingFiles)
         file_dialog.setNameFilter("Изображения (*.png *.jpg *.jpeg)")
-        if file_dialog.exec():
-            file_paths = file_dialog.selectedFiles()
-            for file_path in file_paths:
-                self.db.add_photo(car_id, file_path)
+        if not file_dialog.exec():
+            return
+        file_paths = file_dialog.selectedFiles()
+        progress_dialog = self.create_progress_dialog("Сохранение фотографий...", len(file_paths))
 
+        def finished(errors):
+            progress_dialog.close()
+            if errors:
+                QMessageBox.warning(self, "Ошибка", "Не удалось добавить фотографии:\n" + "\n".join(
+                    f"{path}: {error}" for path, error in errors
+                ))
+
+        self.db_pool.run(store_car_photos, self.photo_store, car_id, file_paths,
+                         on_progress=lambda done, total: progress_dialog.setValue(done), on_result=finished)
+
+    # Форма открывается с текущими значениями из базы, записываются только изменённые поля
     def edit_car(self, car_id):
-        brand, ok = QInputDialog.getText(self, "Изменить автомобиль", "Введите новую марку:")
-        if ok and brand:
-            model, ok = QInputDialog.getText(self, "Изменить автомобиль", "Введите новую модель:")
-            if ok and model:
-                year, ok = QInputDialog.getInt(self, "Изменить автомобиль", "Введите новый год выпуска:")
-                if ok:
-                    price, ok = QInputDialog.getDouble(self, "Изменить автомобиль", "Введите новую цену:")
-                    if ok:
-                        description, ok = QInputDialog.getText(self, "Изменить автомобиль", "Введите новое описание:")
-                        if ok:
-                            self.db.update_car(car_id, brand, model, year, price, description)
-                            self.update_my_cars_table()
-
-    def export_to_excel(self, cars):
-        wb = Workbook()
-        ws = wb.active
-        ws.append(["Марка", "Модель", "Год", "Цена", "Описание"])
-        for car in cars:
-            ws.append(car[1:6])  # Игнорируем ID и владелец
-        filename, _ = QFileDialog.getSaveFileName(None, "Сохранить как", "", "Excel Files (*.xlsx)")
-        if filename:
-            wb.save(filename)
-            QMessageBox.information(None, "Успех", f"Данные экспортированы в {filename}.")
+        self.db_pool.run("get_car", car_id, on_result=self.show_car_editor)
 
-    def export_to_word(self, cars):
-        doc = Document()
-        doc.add_heading("Список автомобилей", level=1)
-        for car in cars:
-            doc.add_paragraph(f"Марка: {car[1]}, Модель: {car[2]}, Год: {car[3]}, Цена: {car[4]}, Описание: {car[5]}")
-        filename, _ = QFileDialog.getSaveFileName(None, "Сохранить как", "", "Word Files (*.docx)")
-        if filename:
-            doc.save(filename)
+    def show_car_editor(self, car):
+        if car is None:
+            QMessageBox.information(self, "Автомобиль недоступен", "Автомобиль уже продан или удалён.")
+            return
+        dialog = CarEditorDialog("Изменить автомобиль", car, parent=self)
+        if dialog.exec() and dialog.changes:
+            self.db_pool.run("update_car", car.id, **dialog.changes)
+
+    # Выбранные строки меняются одним запросом; таблица обновляет их одним событием
+    def edit_selected_cars(self):
+        car_ids = [self.my_cars_model.car_id(index.row())
+                   for index in self.my_cars_table.selectionModel().selectedRows()]
+        if not car_ids:
+            return
+        dialog = CarEditorDialog("Изменить выбранные автомобили", count=len(car_ids), parent=self)
+        if dialog.exec() and (dialog.changes or dialog.price_factor is not None):
+            self.db_pool.run("update_cars", car_ids, self.user_id, dialog.price_factor, **dialog.changes,
+                             on_result=lambda updated: self.main_window.statusBar().showMessage(
+                                 f"Изменено автомобилей: {len(updated)}"))
+
+    # Выгрузка идёт в фоне прямо из курсора базы, её можно отменить в окне прогресса
+    def export_cars(self, file_format, file_filter):
+        filename, _ = QFileDialog.getSaveFileName(None, "Сохранить как", "", file_filter)
+        if not filename:
+            return
+        cancelled = threading.Event()
+        progress_dialog = QProgressDialog("Экспорт автомобилей...", "Отмена", 0, 0, self)
+        progress_dialog.setWindowModality(Qt.WindowModality.WindowModal)
+        progress_dialog.setMinimumDuration(300)
+        progress_dialog.canceled.connect(cancelled.set)
+
+        def update_progress(done, total):
+            progress_dialog.setMaximum(total)
+            progress_dialog.setValue(done)
+
+        def finished(result):
+            progress_dialog.close()
             QMessageBox.information(None, "Успех", f"Данные экспортированы в {filename}.")
 
-    # def export_to_pdf(self, cars):
-    #     filename, _ = QFileDialog.getSaveFileName(None, "Сохранить как", "", "PDF Files (*.pdf)")
-    #     if filename:
-    #         c = canvas.Canvas(filename)
-    #         c.setFont("Times-Roman", 12)
-    #         y = 800
-    #         for car in cars:
-    #             c.drawString(50, y,
-    #                          f"Марка: {car[1]}, Модель: {car[2]}, Год: {car[3]}, Цена: {car[4]}, Описание: {car[5]}"
-    #                          )
-    #             y -= 20
-    #             if y < 50:
-    #                 c.showPage()
-    #                 y = 800
-
-    #         c.save()
-    #         QMessageBox.information(None, "Успех", f"Данные экспортированы в {filename}.")
+        def failed(error):
+            progress_dialog.close()
+            if not isinstance(error, ExportCancelled):
+                QMessageBox.warning(self, "Ошибка", f"Не удалось выполнить экспорт: {error}")
+
+        self.db_pool.run(export_user_cars, file_format, filename, self.user_id, cancelled,
+                         on_progress=update_progress, on_result=finished, on_error=failed)
+
+    # Импорт идёт в фоне одной транзакцией, таблица обновляется одним событием по окончании
+    def import_cars(self):
+        filename, _ = QFileDialog.getOpenFileName(self, "Импорт автомобилей", "", "Таблицы (*.csv *.xlsx)")
+        if not filename:
+            return
+        cancelled = threading.Event()
+        progress_dialog = QProgressDialog("Импорт автомобилей...", "Отмена", 0, 0, self)
+        progress_dialog.setWindowModality(Qt.WindowModality.WindowModal)
+        progress_dialog.setMinimumDuration(300)
+        progress_dialog.canceled.connect(cancelled.set)
+
+        def finished(result):
+            progress_dialog.close()
+            text = f"Импортировано автомобилей: {result.imported}"
+            if result.errors:
+                text += f"\nСтрок с ошибками: {len(result.errors)}\n" + "\n".join(
+                    f"Строка {line}: {error}" for line, error in result.errors[:20]
+                )
+            QMessageBox.information(self, "Импорт", text)
+
+        def failed(error):
+            progress_dialog.close()
+            if not isinstance(error, ImportCancelled):
+                QMessageBox.warning(self, "Ошибка", f"Не удалось выполнить импорт: {error}")
+
+        self.db_pool.run(import_cars, self.photo_store, filename, self.user_id, cancelled,
+                         on_progress=lambda done, total: progress_dialog.setLabelText(f"Обработано строк: {done}"),
+                         on_result=finished, on_error=failed)
 
     def add_seller_dashboard(self):
         export_layout = QHBoxLayout()
         export_excel_button = QPushButton("Экспорт в Excel")
-        export_excel_button.clicked.connect(lambda: self.export_to_excel(self.db.get_user_cars(self.user_id)))
+        export_excel_button.clicked.connect(lambda: self.export_cars("xlsx", "Excel Files (*.xlsx)"))
 
         export_word_button = QPushButton("Экспорт в Word")
-        export_word_button.clicked.connect(lambda: self.export_to_word(self.db.get_user_cars(self.user_id)))
+        export_word_button.clicked.connect(lambda: self.export_cars("docx", "Word Files (*.docx)"))
 
-        # export_pdf_button = QPushButton("Экспорт в PDF")
-        # export_pdf_button.clicked.connect(lambda: self.export_to_pdf(self.db.get_user_cars(self.user_id)))
+        export_pdf_button = QPushButton("Экспорт в PDF")
+        export_pdf_button.clicked.connect(lambda: self.export_cars("pdf", "PDF Files (*.pdf)"))
+
+        export_csv_button = QPushButton("Экспорт в CSV")
+        export_csv_button.clicked.connect(lambda: self.export_cars("csv", "CSV Files (*.csv)"))
 
         export_layout.addWidget(export_excel_button)
         export_layout.addWidget(export_word_button)
-        # export_layout.addWidget(export_pdf_button)
+        export_layout.addWidget(export_pdf_button)
+        export_layout.addWidget(export_csv_button)
         self.layout.addLayout(export_layout)
 
         add_car_button = QPushButton("Добавить автомобиль")
         add_car_button.clicked.connect(self.add_car)
         self.layout.addWidget(add_car_button)
 
-        self.my_cars_table = QTableWidget()
+        # Пакетное изменение: строки выбираются в таблице (Ctrl, Shift, Ctrl+A)
+        self.edit_selected_button = QPushButton("Изменить выбранные")
+        self.edit_selected_button.setEnabled(False)
+        self.edit_selected_button.clicked.connect(self.edit_selected_cars)
+        self.layout.addWidget(self.edit_selected_button)
+
+        import_button = QPushButton("Импорт из файла")
+        import_button.clicked.connect(self.import_cars)
+        self.layout.addWidget(import_button)
+
+        # Итоги продаж читаются из сводной таблицы, а не подсчётом по sales
+        stats_layout = QHBoxLayout()
+        self.sales_stats_label = QLabel("Продано: ...")
+        stats_button = QPushButton("Статистика продаж")
+        stats_button.clicked.connect(self.view_sales_stats)
+        stats_layout.addWidget(self.sales_stats_label)
+        stats_layout.addWidget(stats_button)
+        self.layout.addLayout(stats_layout)
+        self.update_sales_stats()
+
+        self.my_cars_model = CarTableModel(
+            self.db_pool,
+            [("Фото", "thumbnail"), ("Марка", "brand", "brand"), ("Модель", "model"), ("Год", "year", "year"),
+             ("Цена", "price", "price"), ("Описание", "description")],
+            ["Фотографии", "Добавление", "Удаление"],
+            photo_cache=self.photo_cache, thumbnail_column=0, parent=self
+        )
+        self.my_cars_table = self.create_table_view(self.my_cars_model, self.update_my_cars_table)
+        self.my_cars_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.my_cars_table.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        def update_edit_selected():
+            self.edit_selected_button.setEnabled(self.my_cars_table.selectionModel().hasSelection())
+
+        # Перезагрузка таблицы снимает выделение без сигнала selectionChanged
+        self.my_cars_table.selectionModel().selectionChanged.connect(update_edit_selected)
+        self.my_cars_model.modelReset.connect(update_edit_selected)
+        # Фотографии, редактирование и удаление: кнопки рисуются делегатами
+        photos_delegate = ButtonDelegate("Просмотреть", parent=self.my_cars_table)
+        photos_delegate.clicked.connect(lambda row: self.view_photos(self.my_cars_model.car_id(row)))
+        edit_delegate = ButtonDelegate("Изменить", parent=self.my_cars_table)
+        edit_delegate.clicked.connect(lambda row: self.edit_car(self.my_cars_model.car_id(row)))
+        delete_delegate = ButtonDelegate("Удалить", "#f44336", "#e53935", parent=self.my_cars_table)
+        delete_delegate.clicked.connect(lambda row: self.delete_car(self.my_cars_model.car_id(row)))
+        self.my_cars_table.setItemDelegateForColumn(6, photos_delegate)
+        self.my_cars_table.setItemDelegateForColumn(7, edit_delegate)
+        self.my_cars_table.setItemDelegateForColumn(8, delete_delegate)
+        header = self.my_cars_table.horizontalHeader()
+        header.setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        header.setSectionResizeMode(0, QHeaderView.ResizeMode.Fixed)
+        header.resizeSection(0, 64)
+        for column in (6, 7, 8):
+            header.setSectionResizeMode(column, QHeaderView.ResizeMode.ResizeToContents)
         self.update_my_cars_table()
         self.layout.addWidget(self.my_cars_table)
 
 
     def delete_car(self, car_id):
-        self.db.delete_car(car_id)
-        self.update_my_cars_table()
+        self.db_pool.run("delete_car", car_id)
 
     def buy_car(self, car_id):
-        self.db.buy_car(car_id, self.user_id)
-        self.update_available_cars_table()
+        def failed(error):
+            if isinstance(error, PurchaseError):
+                # Автомобиль купили из другого окна или с другого компьютера: убираем его из списка
+                self.cars_model.apply_change(CarChange("sold", (car_id,)))
+                QMessageBox.warning(self, "Покупка не удалась", str(error))
+            else:
+                QMessageBox.critical(self, "Ошибка", f"Не удалось купить автомобиль: {error}")
+
+        self.db_pool.run("buy_car", car_id, self.user_id, on_error=failed)
 
     def view_purchase_history(self):
-         history = self.db.conn.execute("""
-             SELECT cars.brand, cars.model, cars.year, sales.car_id
-             FROM sales
-            LEFT JOIN cars ON sales.car_id = cars.id
-             WHERE sales.buyer_id = ?
-         """, (self.user_id,)).fetchall()
-
-         if not history:
-             QMessageBox.information(self, "История покупок", "Вы еще ничего не купили.")
-             return
-
-         history_text = "\n".join([
-             f"ID: {car_id}, {brand} {model} ({year})"
-             for brand, model, year, car_id in history
-         ])
-         QMessageBox.information(self, "История покупок", history_text)
+        PurchaseHistoryDialog(self.db_pool, self.user_id, self).exec()
+
+    def update_sales_stats(self):
+        def show(stats):
+            if self.role != "Продавец":
+                return
+            count, revenue, average = stats
+            self.sales_stats_label.setText(
+                f"Продано: {count}, выручка: {format_money(revenue)}, средняя цена: {format_money(average)}"
+            )
+
+        self.db_pool.run("get_seller_stats", self.user_id, on_result=show)
+
+    def view_sales_stats(self):
+        SalesStatsDialog(self.db_pool, self.user_id, self).exec()
 
     def toggle_theme(self):
-        if self.theme == "light":
-            QApplication.instance().setStyleSheet("QWidget { background-color: #121212; color: #ffffff; }")
-            self.theme = "dark"
-        else:
-            QApplication.instance().setStyleSheet("")
-            self.theme = "light"
+        self.main_window.set_theme(themes.next_theme(self.main_window.theme))
 
     def logout(self):
         self.main_window.show_login()
 
 
-if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    main_window = MainWindow()
+def build_parser():
+    parser = argparse.ArgumentParser(description="Продажа автомобилей")
+    parser.add_argument("--instrument", action="store_true",
+                        help="замерять запросы и работу интерфейса (сводка по Ctrl+Shift+P)")
+    parser.add_argument("--perf-log", default="performance.log", help="журнал замеров в формате JSON")
+    parser.add_argument("--slow-ms", type=float, default=50.0, help="порог медленного запроса, мс")
+    parser.add_argument("--stall-ms", type=float, default=200.0, help="порог зависания интерфейса, мс")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="замерить время запуска до окна входа по модулям и этапам")
+    parser.add_argument("--startup-budget-ms", type=float, default=1000.0, help="допустимое время запуска, мс")
+    parser.add_argument("--startup-probe", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--password-cost", choices=sorted(HASH_PRESETS), default=DEFAULT_PRESET,
+                        help="стоимость хэширования паролей")
+    parser.add_argument("--server", help="адрес сервера хранилища (main.py serve) вместо локального файла базы")
+    parser.add_argument("--cache-mb", type=int, default=64, help="память под кэш выборок, МБ; 0 — без кэша")
+    parser.add_argument("--sync", metavar="PEER",
+                        help="фоновая синхронизация с другой репликой: файл базы или адрес сервера хранилища")
+    commands = parser.add_subparsers(dest="command")
+    import_parser = commands.add_parser("import", help="импорт автомобилей из CSV/XLSX без интерфейса")
+    import_parser.add_argument("file", help="файл .csv или .xlsx")
+    import_parser.add_argument("--owner", required=True, help="имя пользователя-продавца")
+    import_parser.add_argument("--db", default="cars.db", help="файл базы данных")
+    serve_parser = commands.add_parser("serve", help="сервер хранилища для нескольких рабочих мест")
+    serve_parser.add_argument("--db", default="cars.db", help="файл базы данных")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument("--pool", type=int, default=4, help="число соединений с базой")
+    sync_parser = commands.add_parser("sync", help="однократный обмен изменениями с другой репликой")
+    sync_parser.add_argument("peer", help="файл базы другой реплики или адрес сервера хранилища")
+    sync_parser.add_argument("--db", default="cars.db", help="файл базы данных")
+    maintain_parser = commands.add_parser("maintain", help="статистика, сжатие и резервная копия базы")
+    maintain_parser.add_argument("--db", default="cars.db", help="файл базы данных")
+    maintain_parser.add_argument("--backup-dir", help="папка резервных копий; по умолчанию backups рядом с базой")
+    maintain_parser.add_argument("--vacuum", action="store_true",
+                                 help="пересобрать файл и включить постепенное сжатие (блокирует запись)")
+    return parser
+
+
+def run_import(args):
+    db = Database(args.db)
+    user = db.get_user(args.owner)
+    if user is None:
+        print(f"Пользователь {args.owner} не найден", file=sys.stderr)
+        return 1
+    try:
+        result = import_cars(db, PhotoStore.for_database(args.db), args.file, user.id,
+                             progress=lambda done, total: print(f"Обработано строк: {done}", file=sys.stderr))
+    except (OSError, ValueError) as error:
+        print(f"Ошибка импорта: {error}", file=sys.stderr)
+        return 1
+    for line, error in result.errors:
+        print(f"Строка {line}: {error}", file=sys.stderr)
+    print(f"Импортировано автомобилей: {result.imported}, строк с ошибками: {len(result.errors)}")
+    return 0 if not result.errors else 2
+
+
+def run_serve(args):
+    from server import StorageServer
+
+    server = StorageServer((args.host, args.port), lambda: open_database(args.db), args.pool)
+    print(f"Сервер хранилища {os.path.abspath(args.db)}: http://{args.host}:{server.server_port}", flush=True)
+    threading.Thread(target=maintenance_loop, args=(args.db,), daemon=True).start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+# Обслуживание базы сервера хранилища в своём потоке и со своим соединением
+def maintenance_loop(db_name):
+    from maintenance import run_maintenance
+
+    while True:
+        db = open_database(db_name)
+        try:
+            run_maintenance(db)
+        except (OSError, sqlite3.Error) as error:
+            print(f"Ошибка обслуживания базы: {error}", file=sys.stderr)
+        finally:
+            db.conn.close()
+        time.sleep(MAINTENANCE_MS / 1000)
+
+
+def run_maintain(args):
+    import maintenance
+
+    db = open_database(args.db)
+    try:
+        if args.vacuum:
+            started = time.perf_counter()
+            maintenance.vacuum(db.conn)
+            print(f"Файл пересобран за {time.perf_counter() - started:.2f} с")
+        result = maintenance.run_maintenance(db, args.backup_dir, backup_interval=0)
+    except (OSError, sqlite3.Error) as error:
+        print(f"Ошибка обслуживания базы: {error}", file=sys.stderr)
+        return 1
+    finally:
+        db.conn.close()
+    print(f"Освобождено страниц: {result['freed_pages']}, резервная копия: {result['backup']}, "
+          f"{result['seconds']:.2f} с")
+    return 0
+
+
+def run_sync(args):
+    from replication import Replica, connect_peer
+
+    db = open_database(args.db)
+    peer = connect_peer(args.peer, open_database)
+    replica = Replica(db.conn)
+    try:
+        stats = replica.sync(peer)
+    except (OSError, StorageError) as error:
+        print(f"Ошибка синхронизации: {error}", file=sys.stderr)
+        return 1
+    finally:
+        peer.close()
+    print(f"Отправлено записей: {stats['sent']}, получено: {stats['received']}, применено: {stats['applied']}, "
+          f"пачек: {stats['batches']}, {stats['seconds']:.2f} с")
+    for car_id, kept, lost, resolved_at in replica.conflicts(stats["conflicts"]):
+        print(f"{resolved_at} автомобиль {car_id}: продажа {lost['buyer']} ({lost['site']}) отменена, "
+              f"остаётся продажа {kept['buyer']} ({kept['site']})", file=sys.stderr)
+    return 0
+
+
+# Замеры методов базы, загрузки таблиц, фотографий и выгрузок; включаются до создания окон
+def enable_instrumentation(args):
+    instrumentation.enable(args.perf_log, args.slow_ms)
+    instrumentation.instrument_methods(Database, prefix="db.")
+    instrumentation.instrument_methods(RemoteDatabase, prefix="remote.")
+    instrumentation.instrument_methods(Dashboard, [
+        "update_my_cars_table", "update_available_cars_table", "view_photos", "show_photos",
+        "export_cars", "import_cars", "apply_car_change",
+    ], prefix="ui.")
+    instrumentation.instrument_methods(CarTableModel, ["fetchMore", "_append", "apply_change", "_merge"],
+                                       prefix="table.")
+    instrumentation.instrument_methods(PhotoCache, ["_store"], prefix="photo.")
+    photos.render_image = instrumentation.timed("photo.render_image", photos.render_image)
+
+
+def main(argv):
+    args, qt_args = build_parser().parse_known_args(argv[1:])
+    Database.password_preset = args.password_cost
+    if args.instrument:
+        enable_instrumentation(args)
+    if args.command == "import":
+        return run_import(args)
+    if args.command == "serve":
+        return run_serve(args)
+    if args.command == "sync":
+        return run_sync(args)
+    if args.command == "maintain":
+        return run_maintain(args)
+    if args.sync and args.server:
+        print("--sync синхронизирует локальный файл базы и не совместим с --server", file=sys.stderr)
+        return 2
+    if args.profile_startup:
+        return startup.profile_startup(os.path.abspath(argv[0]), args.startup_budget_ms, qt_args)
+    app = QApplication(argv[:1] + qt_args)
+    startup.mark("QApplication")
+    if args.instrument:
+        watchdog = instrumentation.Watchdog(args.stall_ms, app)
+        watchdog.start()
+    main_window = MainWindow(server=args.server, cache_mb=args.cache_mb, sync=args.sync)
     main_window.show()
-    sys.exit(app.exec())
+    if args.startup_probe:
+        # Замер для --profile-startup: выход после первой отрисовки окна
+        def first_frame():
+            startup.mark("Первый кадр")
+            startup.print_marks()
+            main_window.close()
+            app.quit()
+
+        QTimer.singleShot(0, first_frame)
+    result = app.exec()
+    if args.instrument:
+        instrumentation.log("summary", metrics=instrumentation.snapshot(),
+                            query_cache=main_window.query_cache.stats() if main_window.query_cache else None)
+    return result
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
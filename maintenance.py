@@ -0,0 +1,99 @@
+import glob
+import os
+import sqlite3
+import time
+
+# Обслуживание файла базы: статистика планировщика запросов, возврат свободных страниц и
+# резервные копии. Выполняется в фоне — в пуле MainWindow по таймеру и в потоке сервера
+# хранилища, — или командой main.py maintain. Каждый шаг держит блокировку записи недолго.
+
+# Строк на индекс, которые просматривает ANALYZE: статистики хватает планировщику, а большая
+# таблица не анализируется целиком
+ANALYSIS_LIMIT = 1000
+# Свободных страниц, после которых файл ужимается, и страниц за один проход: проход держит
+# блокировку записи десятки миллисекунд, между проходами успевают записи других соединений
+VACUUM_MIN_PAGES = 1024
+VACUUM_STEP_PAGES = 1024
+# Резервная копия раз в сутки, хранятся последние BACKUP_KEEP
+BACKUP_INTERVAL = 24 * 60 * 60
+BACKUP_KEEP = 7
+
+
+# Первый раз — ANALYZE всех таблиц, дальше PRAGMA optimize пересчитывает только устаревшую статистику
+def analyze(conn):
+    conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone() is None:
+        conn.execute("ANALYZE")
+    else:
+        conn.execute("PRAGMA optimize")
+
+
+# Возвращает страницы из списка свободных в файловую систему; только для баз с auto_vacuum = INCREMENTAL.
+# Возвращает число освобождённых страниц.
+def incremental_vacuum(conn, min_pages=VACUUM_MIN_PAGES, step=VACUUM_STEP_PAGES):
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return 0
+    freed = 0
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    while free >= min_pages:
+        # Прагма освобождает по странице за шаг выполнения; execute делает один шаг, executescript — все
+        conn.executescript(f"PRAGMA incremental_vacuum({step})")
+        left = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if left >= free:
+            break
+        freed += free - left
+        free = left
+    return freed
+
+
+# Переводит существующую базу в auto_vacuum = INCREMENTAL и пересобирает файл. VACUUM держит
+# блокировку записи всё время работы, поэтому вызывается только из main.py maintain --vacuum.
+def vacuum(conn):
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+
+
+def backup_directory(db_name):
+    return os.path.join(os.path.dirname(os.path.abspath(db_name)), "backups")
+
+
+# Копии базы в directory, от старых к новым
+def list_backups(db_name, directory):
+    stem = os.path.splitext(os.path.basename(db_name))[0]
+    return sorted(glob.glob(os.path.join(glob.escape(directory), f"{stem}-*.db")))
+
+
+# Копия через sqlite3 backup API. В режиме WAL копирование одним шагом читает снимок базы
+# и не мешает записи из других соединений. Файл появляется под своим именем только целиком.
+def backup(conn, path):
+    partial = path + ".part"
+    target = sqlite3.connect(partial)
+    try:
+        conn.backup(target)
+    finally:
+        target.close()
+    os.replace(partial, path)
+    return path
+
+
+# Копия, если последней больше interval секунд; старые сверх keep удаляются. Возвращает путь или None.
+def backup_if_due(conn, db_name, directory=None, interval=BACKUP_INTERVAL, keep=BACKUP_KEEP):
+    directory = directory or backup_directory(db_name)
+    existing = list_backups(db_name, directory)
+    if existing and time.time() - os.path.getmtime(existing[-1]) < interval:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(db_name))[0]
+    path = backup(conn, os.path.join(directory, f"{stem}-{time.strftime('%Y%m%d-%H%M%S')}.db"))
+    for old in list_backups(db_name, directory)[:-keep]:
+        os.remove(old)
+    return path
+
+
+# Задача для DatabasePool и потока сервера: db — Database своего потока. Возвращает сводку.
+def run_maintenance(db, backup_dir=None, backup_interval=BACKUP_INTERVAL):
+    started = time.perf_counter()
+    analyze(db.conn)
+    freed = incremental_vacuum(db.conn)
+    path = backup_if_due(db.conn, db.db_name, backup_dir, backup_interval)
+    return {"freed_pages": freed, "backup": path, "seconds": time.perf_counter() - started}
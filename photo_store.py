@@ -0,0 +1,95 @@
+import hashlib
+import os
+import shutil
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+StoredPhoto = namedtuple("StoredPhoto", "filepath digest width height")
+
+
+# Хранилище фотографий с адресацией по содержимому: файл лежит по пути из SHA-256,
+# поэтому одинаковые снимки разных объявлений хранятся один раз
+class PhotoStore:
+    def __init__(self, root, hardlink=False):
+        self.root = root
+        # Жёсткая ссылка экономит место, но изменение исходного файла изменит и копию в хранилище
+        self.hardlink = hardlink
+
+    @classmethod
+    def for_database(cls, db_name):
+        return cls(os.path.join(os.path.dirname(os.path.abspath(db_name)), "photos"))
+
+    @staticmethod
+    def relative_path(digest, extension):
+        return f"{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+    # Старые записи хранят абсолютный путь к исходному файлу, новые — путь внутри хранилища
+    def resolve(self, filepath):
+        if not filepath or os.path.isabs(filepath):
+            return filepath
+        return os.path.join(self.root, filepath)
+
+    @staticmethod
+    def file_digest(path):
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def ingest(self, source):
+        from PIL import Image
+
+        with Image.open(source) as image:
+            width, height = image.size
+        digest = self.file_digest(source)
+        extension = os.path.splitext(source)[1].lower()
+        filepath = self.relative_path(digest, extension)
+        target = self.resolve(filepath)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            temp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+            if self.hardlink:
+                try:
+                    os.link(source, temp_path)
+                except OSError:
+                    # Другой диск или файловая система без жёстких ссылок
+                    shutil.copyfile(source, temp_path)
+            else:
+                shutil.copyfile(source, temp_path)
+            os.replace(temp_path, target)
+        return StoredPhoto(filepath, digest, width, height)
+
+    # Файлы хэшируются и копируются параллельно; возвращает сохранённые фото и ошибки (путь, текст)
+    def ingest_many(self, sources, progress=None, max_workers=4):
+        stored, errors = self.ingest_paths(sources, progress, max_workers)
+        return list(stored.values()), errors
+
+    # То же, но сохранённые фото — словарь {исходный путь: StoredPhoto}; повторы путей читаются один раз
+    def ingest_paths(self, sources, progress=None, max_workers=4):
+        from PIL import Image
+
+        sources = list(dict.fromkeys(sources))
+        stored = {}
+        errors = []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self.ingest, source) for source in sources]
+            for done, (source, future) in enumerate(zip(sources, futures), 1):
+                try:
+                    stored[source] = future.result()
+                # UnidentifiedImageError из Pillow — подкласс OSError, а слишком большой снимок
+                # (DecompressionBombError) — нет: пропускается только он, а не вся загрузка
+                except (OSError, Image.DecompressionBombError) as error:
+                    errors.append((source, str(error)))
+                if progress is not None:
+                    progress(done, len(sources))
+        return stored, errors
+
+
+# Задача для DatabasePool: сохранить файлы в хранилище и добавить их к автомобилю одной вставкой
+def store_car_photos(db, store, car_id, sources, progress=None):
+    stored, errors = store.ingest_many(sources, progress)
+    unique = list({photo.digest: photo for photo in stored}.values())
+    db.add_photos(car_id, unique)
+    return errors
@@ -0,0 +1,245 @@
+import hashlib
+import os
+from collections import OrderedDict
+
+from PyQt6.QtCore import Qt, QObject, QRunnable, QStandardPaths, QThreadPool, pyqtSignal
+from PyQt6.QtGui import QImage, QPixmap
+from PyQt6.QtWidgets import QDialog, QHBoxLayout, QLabel, QPushButton, QVBoxLayout
+
+THUMBNAIL_SIZE = (48, 32)
+PREVIEW_SIZE = (400, 400)
+# Кэш на диске: предел по байтам, до какой доли предела он ужимается при переполнении
+# и через сколько подготовленных изображений проверяется снова
+DISK_CACHE_BYTES = 256 * 1024 * 1024
+DISK_TRIM_RATIO = 0.8
+DISK_TRIM_EVERY = 1000
+
+
+def default_cache_dir():
+    location = QStandardPaths.writableLocation(QStandardPaths.StandardLocation.CacheLocation)
+    return os.path.join(location or os.path.expanduser("~/.cache/sells_auto"), "thumbnails")
+
+
+# Ключ кэша зависит от пути, времени изменения и размера файла, поэтому изменённый файл пересчитывается
+def cache_key(path, size):
+    stat = os.stat(path)
+    raw = f"{os.path.abspath(path)}|{stat.st_mtime_ns}|{stat.st_size}|{size[0]}x{size[1]}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+# Pillow импортируется при первом уменьшении, а не при запуске приложения
+def render_image(path, size, cache_dir):
+    from PIL import Image, ImageOps
+
+    cache_path = os.path.join(cache_dir, cache_key(path, size) + ".png")
+    if os.path.exists(cache_path):
+        image = QImage(cache_path)
+        # Время изменения — время последнего чтения: по нему trim_disk_cache удаляет давно не нужные.
+        # Файл, удалённый между проверкой и чтением, готовится заново.
+        if not image.isNull():
+            try:
+                os.utime(cache_path)
+            except OSError:
+                pass
+            return image
+    with Image.open(path) as image:
+        # draft позволяет декодеру JPEG сразу уменьшить картинку, не раскодируя её целиком
+        image.draft("RGB", size)
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(size, Image.Resampling.LANCZOS)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_path = f"{cache_path}.{os.getpid()}.tmp"
+        image.save(temp_path, "PNG")
+        os.replace(temp_path, cache_path)
+    return QImage(cache_path)
+
+
+# Удаляет из кэша на диске файлы, которые дольше всех не читались, пока кэш больше
+# DISK_TRIM_RATIO от max_bytes. Возвращает число удалённых файлов.
+def trim_disk_cache(cache_dir, max_bytes):
+    files = []
+    try:
+        with os.scandir(cache_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith(".png") and entry.is_file():
+                    stat = entry.stat()
+                    files.append((stat.st_mtime_ns, stat.st_size, entry.path))
+    except FileNotFoundError:
+        return 0
+    total = sum(size for _, size, _ in files)
+    if total <= max_bytes:
+        return 0
+    removed = 0
+    for _, size, path in sorted(files):
+        if total <= max_bytes * DISK_TRIM_RATIO:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
+
+
+class _RenderSignals(QObject):
+    finished = pyqtSignal(str, tuple, QImage)
+    failed = pyqtSignal(str, tuple)
+
+
+class _RenderTask(QRunnable):
+    def __init__(self, path, source, size, cache_dir, signals):
+        super().__init__()
+        self.path = path
+        self.source = source
+        self.size = size
+        self.cache_dir = cache_dir
+        self.signals = signals
+
+    def run(self):
+        from PIL import Image
+
+        try:
+            image = render_image(self.source, self.size, self.cache_dir)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            self.signals.failed.emit(self.path, self.size)
+            return
+        if image.isNull():
+            self.signals.failed.emit(self.path, self.size)
+        else:
+            self.signals.finished.emit(self.path, self.size, image)
+
+
+# Кэш уменьшенных изображений: LRU в памяти и кэш на диске, оба с ограничением по байтам.
+# Уменьшение выполняется в пуле потоков, готовое изображение объявляется сигналом ready.
+# Кэш на диске ужимается в том же пуле при запуске и через каждые DISK_TRIM_EVERY изображений.
+class PhotoCache(QObject):
+    ready = pyqtSignal(str, tuple)
+
+    def __init__(self, cache_dir=None, max_bytes=64 * 1024 * 1024, resolve_path=None, parent=None,
+                 max_disk_bytes=DISK_CACHE_BYTES):
+        super().__init__(parent)
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_disk_bytes = max_disk_bytes
+        self._rendered = 0
+        # Преобразует значение photos.filepath в путь к файлу (см. PhotoStore.resolve)
+        self.resolve_path = resolve_path or (lambda path: path)
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self._pixmaps = OrderedDict()
+        self._pending = set()
+        self._failed = set()
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(max(2, min(4, os.cpu_count() or 2)))
+        self._signals = _RenderSignals()
+        self._signals.finished.connect(self._store)
+        self._signals.failed.connect(self._mark_failed)
+        self._trim_disk()
+
+    def get(self, path, size):
+        key = (path, size)
+        pixmap = self._pixmaps.get(key)
+        if pixmap is not None:
+            self._pixmaps.move_to_end(key)
+        return pixmap
+
+    # Возвращает готовое изображение или None, запуская его подготовку в фоне
+    def request(self, path, size):
+        pixmap = self.get(path, size)
+        if pixmap is None:
+            self.prefetch(path, size)
+        return pixmap
+
+    def prefetch(self, path, size):
+        key = (path, size)
+        if not path or key in self._pixmaps or key in self._pending or key in self._failed:
+            return
+        self._pending.add(key)
+        self._pool.start(_RenderTask(path, self.resolve_path(path), size, self.cache_dir, self._signals))
+
+    def _trim_disk(self):
+        cache_dir, max_bytes = self.cache_dir, self.max_disk_bytes
+        self._pool.start(lambda: trim_disk_cache(cache_dir, max_bytes))
+
+    def is_failed(self, path, size):
+        return (path, size) in self._failed
+
+    def _store(self, path, size, image):
+        key = (path, size)
+        self._pending.discard(key)
+        self._rendered += 1
+        if self._rendered % DISK_TRIM_EVERY == 0:
+            self._trim_disk()
+        pixmap = QPixmap.fromImage(image)
+        self._pixmaps[key] = pixmap
+        self.used_bytes += self._pixmap_bytes(pixmap)
+        while self.used_bytes > self.max_bytes and len(self._pixmaps) > 1:
+            _, evicted = self._pixmaps.popitem(last=False)
+            self.used_bytes -= self._pixmap_bytes(evicted)
+        self.ready.emit(path, size)
+
+    def _mark_failed(self, path, size):
+        key = (path, size)
+        self._pending.discard(key)
+        self._failed.add(key)
+        self.ready.emit(path, size)
+
+    @staticmethod
+    def _pixmap_bytes(pixmap):
+        return pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
+
+    def shutdown(self):
+        self._pool.clear()
+        self._pool.waitForDone()
+
+
+# Просмотр фотографий автомобиля: текущий снимок и соседние готовятся заранее
+class PhotoViewer(QDialog):
+    def __init__(self, photo_cache, paths, parent=None):
+        super().__init__(parent)
+        self.photo_cache = photo_cache
+        self.paths = paths
+        self.index = 0
+        self.setWindowTitle("Фотографии автомобиля")
+
+        layout = QVBoxLayout()
+        self.photo_label = QLabel()
+        self.photo_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.photo_label.setMinimumSize(*PREVIEW_SIZE)
+        layout.addWidget(self.photo_label)
+
+        prev_button = QPushButton("Назад")
+        next_button = QPushButton("Вперед")
+        prev_button.clicked.connect(lambda: self.show_photo(self.index - 1))
+        next_button.clicked.connect(lambda: self.show_photo(self.index + 1))
+        button_layout = QHBoxLayout()
+        button_layout.addWidget(prev_button)
+        button_layout.addWidget(next_button)
+        layout.addLayout(button_layout)
+        self.setLayout(layout)
+
+        self.photo_cache.ready.connect(self._photo_ready)
+        self.show_photo(0)
+
+    def show_photo(self, index):
+        self.index = index % len(self.paths)
+        path = self.paths[self.index]
+        pixmap = self.photo_cache.request(path, PREVIEW_SIZE)
+        if pixmap is not None:
+            self.photo_label.setPixmap(pixmap)
+        elif self.photo_cache.is_failed(path, PREVIEW_SIZE):
+            self.photo_label.setText("Не удалось открыть фотографию")
+        else:
+            self.photo_label.setText("Загрузка...")
+        for offset in (1, -1):
+            self.photo_cache.prefetch(self.paths[(self.index + offset) % len(self.paths)], PREVIEW_SIZE)
+
+    def _photo_ready(self, path, size):
+        if size == PREVIEW_SIZE and path == self.paths[self.index]:
+            self.show_photo(self.index)
+
+    def done(self, result):
+        self.photo_cache.ready.disconnect(self._photo_ready)
+        super().done(result)
@@ -0,0 +1,248 @@
+import contextlib
+import functools
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import instrumentation
+from storage import READ_TABLES, WRITE_TABLES, RowCursor
+
+# Размер результата оценивается по первым строкам и умножается на их число
+SIZE_SAMPLE_ROWS = 64
+# Выгрузка большего числа строк читает курсор порциями мимо кэша, чтобы не держать выборку в памяти
+CACHED_CURSOR_ROWS = 50_000
+
+# Выборки, которые читаются один раз целиком (загрузка каталога) и только вытеснили бы остальные
+UNCACHED = {"list_catalog"}
+
+# Таблицы, которые затрагивает изменение автомобилей, пришедшее извне (журнал сервера)
+CHANGE_TABLES = {
+    "inserted": ("cars", "photos"),
+    "updated": ("cars", "photos"),
+    # sales.car_id удалённого автомобиля обнуляется внешним ключом ON DELETE SET NULL
+    "deleted": ("cars", "photos", "sales"),
+    "sold": ("cars", "sales"),
+    "reset": ("cars", "photos", "sales", "users"),
+}
+
+
+def estimate_size(value):
+    if not isinstance(value, (list, tuple)):
+        return sys.getsizeof(value)
+    size = sys.getsizeof(value)
+    if not value:
+        return size
+    sample = value[:SIZE_SAMPLE_ROWS]
+    sampled = 0
+    for row in sample:
+        sampled += sys.getsizeof(row)
+        if isinstance(row, (list, tuple)):
+            sampled += sum(sys.getsizeof(field) for field in row)
+    return size + sampled * len(value) // len(sample)
+
+
+# Общий для всех потоков кэш результатов методов чтения: LRU с ограничением по памяти.
+# У каждой таблицы есть версия; запись увеличивает версии своих таблиц (storage.WRITE_TABLES),
+# а запись кэша хранит версии на момент запроса и при расхождении считается устаревшей.
+class QueryCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.versions = {table: 0 for tables in (*READ_TABLES.values(), *WRITE_TABLES.values())
+                         for table in tables}
+        # Сколько записей прошло через кэш и сколько идёт сейчас: отличает свои изменения базы
+        # от чужих (см. CachedDatabase)
+        self.writes = 0
+        self.active_writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def version(self, tables):
+        with self._lock:
+            return tuple(self.versions[table] for table in tables)
+
+    def get(self, key, tables):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] == tuple(self.versions[table] for table in tables):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, entry[1]
+                self._drop(key)
+                self.invalidations += 1
+            self.misses += 1
+            return False, None
+
+    # versions — версии таблиц, взятые до запроса: запись, завершённая во время чтения, их сменит
+    def put(self, key, versions, result):
+        size = estimate_size(result)
+        # Одна выборка не вытесняет весь кэш
+        if size > self.max_bytes // 4:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (versions, result, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key):
+        self.bytes -= self._entries.pop(key)[2]
+
+    def bump(self, tables):
+        with self._lock:
+            for table in tables:
+                self.versions[table] += 1
+
+    # Своя запись: пока она идёт, фиксации других соединений пула не считаются чужими.
+    # Счётчики меняются под одной блокировкой, чтобы между концом записи и сменой версий
+    # не было момента, когда её фиксация выглядит чужой.
+    @contextlib.contextmanager
+    def writing(self, tables=()):
+        with self._lock:
+            self.active_writes += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.active_writes -= 1
+                for table in tables:
+                    self.versions[table] += 1
+                self.writes += 1
+
+    def write_state(self):
+        with self._lock:
+            return self.writes, self.active_writes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / requests if requests else 0.0,
+                "invalidations": self.invalidations,
+                "evictions": self.evictions,
+            }
+
+
+# Хранилище с кэшем методов чтения перед Database или RemoteDatabase. Остальные атрибуты
+# (conn, listeners, ...) берутся у исходного объекта. Результаты из кэша общие для всех
+# вызывающих: списки строк отдаются копией, сами строки не изменяются.
+class CachedDatabase:
+    def __init__(self, db, cache):
+        self.db = db
+        self.cache = cache
+        # Изменения, о которых узнал исходный объект (в том числе с других рабочих мест), сбрасывают кэш
+        db.listeners.append(self._changed)
+        # data_version соединения меняется после фиксации другим соединением: пул, импорт из командной
+        # строки. Если при этом своих записей не было и нет (методы записи, writing_task) — изменение
+        # чужое: слушатели получают "reset" (кэш сбрасывается в _changed, таблицы и каталог перечитываются).
+        self._data_version = self._read_data_version()
+        self._writes = cache.writes
+
+    def __getattr__(self, name):
+        return getattr(self.db, name)
+
+    def _read_data_version(self):
+        conn = getattr(self.db, "conn", None)
+        return None if conn is None else conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _check_foreign_writes(self):
+        if self._data_version is None:
+            return
+        # Сначала версия базы, потом счётчики: своя фиксация, уже видная в версии, видна и в счётчиках
+        data_version = self._read_data_version()
+        writes, active = self.cache.write_state()
+        if data_version != self._data_version and writes == self._writes and not active:
+            self.db.notify("reset", ())
+        self._data_version = data_version
+        self._writes = writes
+
+    def _changed(self, change):
+        self.cache.bump(CHANGE_TABLES.get(change.kind, ()))
+
+    @staticmethod
+    def _key(name, args, kwargs):
+        return name, repr(tuple(args)), repr(sorted(kwargs.items()))
+
+    def _read(self, name, args, kwargs):
+        tables = READ_TABLES[name]
+        self._check_foreign_writes()
+        key = self._key(name, args, kwargs)
+        started = time.perf_counter()
+        found, result = self.cache.get(key, tables)
+        if found:
+            if instrumentation.enabled:
+                instrumentation.record("cache.hit." + name, time.perf_counter() - started)
+            return list(result) if isinstance(result, list) else result
+        versions = self.cache.version(tables)
+        result = getattr(self.db, name)(*args, **kwargs)
+        self.cache.put(key, versions, result)
+        if instrumentation.enabled:
+            instrumentation.record("cache.miss." + name, time.perf_counter() - started)
+        return list(result) if isinstance(result, list) else result
+
+    def _write(self, name, args, kwargs):
+        try:
+            with self.cache.writing(WRITE_TABLES[name]):
+                return getattr(self.db, name)(*args, **kwargs)
+        finally:
+            self._writes = self.cache.writes
+
+    # Задача fn(db, ...), которая пишет мимо методов хранилища; изменения данных она сообщает
+    # через notify, а кэш только учитывает её фиксации как свои
+    def run_writing(self, fn, *args, **kwargs):
+        try:
+            with self.cache.writing():
+                return fn(self, *args, **kwargs)
+        finally:
+            self._writes = self.cache.writes
+
+    # Выгрузка читает курсор порциями: небольшая выборка читается целиком через кэш и отдаётся
+    # тем же интерфейсом, а большая идёт курсором базы, чтобы не держать её в памяти
+    def iter_user_cars(self, owner_id):
+        if self.count_user_cars(owner_id) > CACHED_CURSOR_ROWS:
+            return self.db.iter_user_cars(owner_id)
+        return RowCursor(self.get_user_cars(owner_id))
+
+
+def _cached_method(name, write):
+    def method(self, *args, **kwargs):
+        return (self._write if write else self._read)(name, args, kwargs)
+
+    method.__name__ = method.__qualname__ = name
+    return method
+
+
+for _name in READ_TABLES.keys() - UNCACHED:
+    setattr(CachedDatabase, _name, _cached_method(_name, False))
+for _name in WRITE_TABLES:
+    setattr(CachedDatabase, _name, _cached_method(_name, True))
+
+
+# Задача пула, которая пишет в базу мимо методов хранилища: синхронизация реплики, обслуживание.
+# С кэшем её фиксации не принимаются другими соединениями пула за чужие и не сбрасывают выборки.
+def writing_task(fn):
+    @functools.wraps(fn)
+    def task(db, *args, **kwargs):
+        if isinstance(db, CachedDatabase):
+            return db.run_writing(fn, *args, **kwargs)
+        return fn(db, *args, **kwargs)
+
+    return task
@@ -0,0 +1,31 @@
+import functools
+from collections import namedtuple
+
+# Строки выборок Database с именованными полями. Записи — namedtuple (__slots__ = ()): памяти
+# столько же, сколько у кортежа, и прежний доступ по индексу (row[4], row[1:6]) работает.
+
+# Автомобиль в списках, выгрузке и каталоге; thumbnail — путь к первой фотографии
+Car = namedtuple("Car", "id brand model year price description owner_id thumbnail")
+Photo = namedtuple("Photo", "filepath")
+# Покупка из истории: снимок автомобиля на момент продажи
+Sale = namedtuple("Sale", "id brand model year price sold_at car_id")
+User = namedtuple("User", "id role")
+
+# Поля автомобиля, которые читает каждый экран; непрочитанные приходят как None.
+# Покупатель не видит описания — длинная строка не читается и не хранится в таблице.
+CAR_FIELDS = Car._fields
+BUYER_CAR_FIELDS = tuple(field for field in Car._fields if field != "description")
+
+_new = tuple.__new__
+
+
+# row_factory курсора: запись собирается из кортежа строки без вызова конструктора namedtuple
+@functools.lru_cache(maxsize=None)
+def row_factory(record):
+    return lambda cursor, row: _new(record, row)
+
+
+# Курсор, который отдаёт строки записями record
+def records(cursor, record):
+    cursor.row_factory = row_factory(record)
+    return cursor
@@ -0,0 +1,503 @@
+import json
+import os
+import threading
+import time
+import uuid
+import zlib
+from urllib.parse import urlsplit
+
+from storage import StorageError
+
+# Записей журнала в одном обмене с узлом: и отправляемых, и получаемых
+SYNC_BATCH = 500
+# Сжатие тела обмена по HTTP: записи журнала — однотипный JSON и сжимаются в несколько раз
+COMPRESS_LEVEL = 6
+
+# Реплика — обычный файл базы, в котором каждая запись в cars, photos и sales попадает
+# в журнал replica_log с логическим временем (часы Лэмпорта). Узлы обмениваются хвостами
+# журналов пачками; чужие записи применяются к своей базе и дописываются в свой журнал,
+# поэтому изменения доходят и до узлов, которые напрямую друг с другом не связаны.
+#
+# У строк разных узлов свои id, поэтому в журнале строка называется парой (узел, id на узле),
+# а replica_rows сопоставляет её с локальным id и хранит отметку последней записи (часы, узел).
+# Пользователи не реплицируются: владелец, покупатель и продавец передаются по имени,
+# незнакомое имя заводится без пароля (войти под ним на этом узле нельзя).
+#
+# Конфликты: изменения автомобиля (update_car) — побеждает более поздняя запись по отметке,
+# см. Replica.merge_car_update; продажи одного автомобиля на разных узлах — побеждает первая,
+# проигравшая продажа удаляется и остаётся в replica_conflicts для разбора.
+
+_SITE = "(SELECT site FROM replica_state)"
+_CLOCK = "(SELECT clock FROM replica_state)"
+# Триггеры пишут в журнал только свои изменения; применение чужих записей ставит applying = 1
+_LOCAL = "(SELECT applying FROM replica_state) = 0"
+
+_LOG_COLUMNS = "site, clock, tbl, op, row_site, row_id, data"
+
+_install_lock = threading.Lock()
+
+
+def _car_json(row, with_owner=True):
+    fields = [f"'{name}', {row}.{name}" for name in ("brand", "model", "year", "price", "description")]
+    if with_owner:
+        fields += [f"'owner', (SELECT username FROM users WHERE id = {row}.owner_id)",
+                   f"'status', {row}.status", f"'sold_at', {row}.sold_at"]
+    return f"json_object({', '.join(fields)})"
+
+
+def _photo_json(row):
+    return (f"json_object('car_site', cars_key.site, 'car_id', cars_key.site_row_id, 'filepath', {row}.filepath, "
+            f"'digest', {row}.digest, 'width', {row}.width, 'height', {row}.height)")
+
+
+def _sale_json(row, car_site, car_id):
+    return f"""json_object(
+        'car_site', {car_site}, 'car_id', {car_id},
+        'buyer', (SELECT username FROM users WHERE id = {row}.buyer_id),
+        'seller', (SELECT username FROM users WHERE id = {row}.seller_id),
+        'price', {row}.price, 'sold_at', {row}.sold_at,
+        'brand', {row}.brand, 'model', {row}.model, 'year', {row}.year
+    )"""
+
+
+# Создаёт таблицы и триггеры репликации; в базе, где их ещё не было, все имеющиеся автомобили,
+# фотографии и продажи записываются в журнал, чтобы другой узел получил их при первом обмене
+def install(conn):
+    with _install_lock:
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'replica_state'").fetchone():
+            _create(conn)
+
+
+def _create(conn):
+    with conn:
+        conn.execute("CREATE TABLE replica_state (site TEXT NOT NULL, clock INTEGER NOT NULL, applying INTEGER NOT NULL)")
+        conn.execute("""
+            CREATE TABLE replica_log (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                site TEXT NOT NULL,
+                clock INTEGER NOT NULL,
+                tbl TEXT NOT NULL,
+                op TEXT NOT NULL,
+                row_site TEXT NOT NULL,
+                row_id INTEGER NOT NULL,
+                data TEXT
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE replica_rows (
+                tbl TEXT NOT NULL,
+                row_id INTEGER NOT NULL,
+                site TEXT NOT NULL,
+                site_row_id INTEGER NOT NULL,
+                clock INTEGER NOT NULL,
+                writer TEXT NOT NULL,
+                PRIMARY KEY (tbl, row_id)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("CREATE UNIQUE INDEX idx_replica_rows_key ON replica_rows (tbl, site, site_row_id)")
+        # Последнее применённое время каждого узла: записи журнала приходят по порядку, повтор отбрасывается
+        conn.execute("CREATE TABLE replica_seen (site TEXT PRIMARY KEY, clock INTEGER NOT NULL)")
+        # Докуда получен журнал узла (pulled, его seq), докуда ему отправлен свой (pushed, свой seq)
+        # и его время узлов из последнего ответа (seen, JSON)
+        conn.execute("""
+            CREATE TABLE replica_peers (
+                peer TEXT PRIMARY KEY,
+                site TEXT,
+                seen TEXT,
+                pulled INTEGER NOT NULL DEFAULT 0,
+                pushed INTEGER NOT NULL DEFAULT 0,
+                synced_at TEXT
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE replica_conflicts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                car_id INTEGER,
+                kind TEXT NOT NULL,
+                kept TEXT,
+                lost TEXT,
+                resolved_at TEXT NOT NULL DEFAULT (datetime('now'))
+            )
+        """)
+        site = uuid.uuid4().hex[:12]
+        conn.execute("INSERT INTO replica_state (site, clock, applying) VALUES (?, 0, 0)", (site,))
+
+        # Имеющиеся строки: сначала автомобили, затем ссылающиеся на них фотографии и продажи.
+        # Время записи — её seq, отметка в replica_rows — 0: любое последующее изменение новее.
+        for table in ("cars", "photos", "sales"):
+            conn.execute(f"INSERT INTO replica_rows SELECT '{table}', id, ?, id, 0, ? FROM {table}", (site, site))
+        conn.execute(f"""
+            INSERT INTO replica_log ({_LOG_COLUMNS})
+            SELECT ?, 0, 'cars', 'insert', ?, id, {_car_json('cars')} FROM cars ORDER BY id
+        """, (site, site))
+        conn.execute(f"""
+            INSERT INTO replica_log ({_LOG_COLUMNS})
+            SELECT ?, 0, 'photos', 'insert', ?, photos.id, {_photo_json('photos')}
+            FROM photos JOIN replica_rows cars_key ON cars_key.tbl = 'cars' AND cars_key.row_id = photos.car_id
+            ORDER BY photos.id
+        """, (site, site))
+        conn.execute(f"""
+            INSERT INTO replica_log ({_LOG_COLUMNS})
+            SELECT ?, 0, 'sales', 'insert', ?, id, {_sale_json('sales', '?', 'sales.car_id')} FROM sales ORDER BY id
+        """, (site, site, site))
+        conn.execute("UPDATE replica_log SET clock = seq")
+        conn.execute("UPDATE replica_state SET clock = COALESCE((SELECT MAX(seq) FROM replica_log), 0)")
+
+        conn.execute(f"""
+            CREATE TRIGGER replica_cars_insert AFTER INSERT ON cars WHEN {_LOCAL} BEGIN
+                UPDATE replica_state SET clock = clock + 1;
+                INSERT INTO replica_rows VALUES ('cars', new.id, {_SITE}, new.id, {_CLOCK}, {_SITE});
+                INSERT INTO replica_log ({_LOG_COLUMNS})
+                VALUES ({_SITE}, {_CLOCK}, 'cars', 'insert', {_SITE}, new.id, {_car_json('new')});
+            END
+        """)
+        # Продажа меняет только status и sold_at и приходит в журнал строкой sales
+        conn.execute(f"""
+            CREATE TRIGGER replica_cars_update AFTER UPDATE OF brand, model, year, price, description ON cars
+            WHEN {_LOCAL} BEGIN
+                UPDATE replica_state SET clock = clock + 1;
+                UPDATE replica_rows SET clock = {_CLOCK}, writer = {_SITE} WHERE tbl = 'cars' AND row_id = new.id;
+                INSERT INTO replica_log ({_LOG_COLUMNS})
+                SELECT {_SITE}, {_CLOCK}, 'cars', 'update', site, site_row_id, {_car_json('new', with_owner=False)}
+                FROM replica_rows WHERE tbl = 'cars' AND row_id = new.id;
+            END
+        """)
+        # Удаление пишется в журнал только своё, а сопоставление id убирается всегда
+        conn.execute(f"""
+            CREATE TRIGGER replica_cars_delete AFTER DELETE ON cars BEGIN
+                UPDATE replica_state SET clock = clock + 1 WHERE applying = 0;
+                INSERT INTO replica_log ({_LOG_COLUMNS})
+                SELECT {_SITE}, {_CLOCK}, 'cars', 'delete', site, site_row_id, NULL
+                FROM replica_rows WHERE tbl = 'cars' AND row_id = old.id AND {_LOCAL};
+                DELETE FROM replica_rows WHERE tbl = 'cars' AND row_id = old.id;
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER replica_photos_insert AFTER INSERT ON photos WHEN {_LOCAL} BEGIN
+                UPDATE replica_state SET clock = clock + 1;
+                INSERT INTO replica_rows VALUES ('photos', new.id, {_SITE}, new.id, {_CLOCK}, {_SITE});
+                INSERT INTO replica_log ({_LOG_COLUMNS})
+                SELECT {_SITE}, {_CLOCK}, 'photos', 'insert', {_SITE}, new.id, {_photo_json('new')}
+                FROM replica_rows cars_key WHERE cars_key.tbl = 'cars' AND cars_key.row_id = new.car_id;
+            END
+        """)
+        # Фотографии удаляются только вместе с автомобилем, их удаление в журнал не пишется
+        conn.execute("""
+            CREATE TRIGGER replica_photos_delete AFTER DELETE ON photos BEGIN
+                DELETE FROM replica_rows WHERE tbl = 'photos' AND row_id = old.id;
+            END
+        """)
+        car_key = "(SELECT {} FROM replica_rows WHERE tbl = 'cars' AND row_id = new.car_id)"
+        conn.execute(f"""
+            CREATE TRIGGER replica_sales_insert AFTER INSERT ON sales WHEN {_LOCAL} BEGIN
+                UPDATE replica_state SET clock = clock + 1;
+                INSERT INTO replica_rows VALUES ('sales', new.id, {_SITE}, new.id, {_CLOCK}, {_SITE});
+                INSERT INTO replica_log ({_LOG_COLUMNS})
+                VALUES ({_SITE}, {_CLOCK}, 'sales', 'insert', {_SITE}, new.id,
+                        {_sale_json('new', car_key.format('site'), car_key.format('site_row_id'))});
+            END
+        """)
+        conn.execute("""
+            CREATE TRIGGER replica_sales_delete AFTER DELETE ON sales BEGIN
+                DELETE FROM replica_rows WHERE tbl = 'sales' AND row_id = old.id;
+            END
+        """)
+
+
+# Журнал и применение чужих записей для одной базы. notify — Database.notify: после применения
+# интерфейс получает CarChange, как после собственных изменений.
+class Replica:
+    def __init__(self, conn, notify=None):
+        self.conn = conn
+        self.notify = notify
+        install(conn)
+        self.site = conn.execute("SELECT site FROM replica_state").fetchone()[0]
+        self._handlers = {
+            ("cars", "insert"): self._insert_car,
+            ("cars", "update"): self._update_car,
+            ("cars", "delete"): self._delete_car,
+            ("photos", "insert"): self._insert_photo,
+            ("sales", "insert"): self._insert_sale,
+        }
+
+    # Записи журнала после seq, кроме уже известных узлу по его seen (время узлов, см. vector);
+    # отметка сдвигается и за пропущенные. Возвращает (записи, последний просмотренный seq, есть ли ещё).
+    def entries(self, after, limit=SYNC_BATCH, seen=None):
+        rows = self.conn.execute(
+            f"SELECT seq, {_LOG_COLUMNS} FROM replica_log WHERE seq > ? ORDER BY seq LIMIT ?", (after, limit)
+        ).fetchall()
+        last = rows[-1][0] if rows else after
+        seen = seen or {}
+        return [row for row in rows if row[2] > seen.get(row[1], 0)], last, len(rows) == limit
+
+    # Последнее время записей каждого узла, которые есть в этой базе, включая свои
+    def vector(self):
+        seen = dict(self.conn.execute("SELECT site, clock FROM replica_seen"))
+        seen[self.site] = self.conn.execute("SELECT clock FROM replica_state").fetchone()[0]
+        return seen
+
+    # Одна пачка обмена на стороне узла: применить присланное, отдать свои записи после after
+    def exchange(self, entries, after, limit=SYNC_BATCH, seen=None):
+        applied = self.apply(entries)
+        outgoing, last, more = self.entries(after, limit, seen)
+        return {"site": self.site, "seen": self.vector(), "applied": applied, "entries": outgoing, "last": last,
+                "more": more}
+
+    # Обмен с узлом (FilePeer или HttpPeer) до полного совпадения журналов
+    def sync(self, peer):
+        started = time.perf_counter()
+        state = self.conn.execute("SELECT site, seen, pulled, pushed FROM replica_peers WHERE peer = ?",
+                                  (peer.name,)).fetchone()
+        peer_site, peer_seen, pulled, pushed = state or (None, None, 0, 0)
+        # До первого ответа время узла неизвестно: пачка уходит целиком, узел сам отбросит известное
+        peer_seen = json.loads(peer_seen) if peer_seen else {}
+        stored = (peer_site, peer_seen, pulled, pushed) if state else None
+        conflicts = self._last_conflict()
+        stats = {"sent": 0, "received": 0, "applied": 0, "batches": 0}
+        while True:
+            outgoing, sent_last, more_outgoing = self.entries(pushed, SYNC_BATCH, peer_seen)
+            response = peer.exchange(outgoing, pulled, SYNC_BATCH, self.vector())
+            peer_site, peer_seen = response["site"], response["seen"]
+            stats["applied"] += self.apply(response["entries"])
+            pushed, pulled = sent_last, response["last"]
+            stats["sent"] += len(outgoing)
+            stats["received"] += len(response["entries"])
+            stats["batches"] += 1
+            # Обмен, после которого отметки не сдвинулись, в базу не пишется: иначе каждая проверка
+            # узла без изменений фиксировала бы транзакцию
+            if (peer_site, peer_seen, pulled, pushed) != stored:
+                stored = (peer_site, peer_seen, pulled, pushed)
+                with self.conn:
+                    self.conn.execute("""
+                        INSERT INTO replica_peers (peer, site, seen, pulled, pushed, synced_at)
+                        VALUES (?, ?, ?, ?, ?, datetime('now'))
+                        ON CONFLICT (peer) DO UPDATE SET
+                            site = excluded.site, seen = excluded.seen, pulled = excluded.pulled,
+                            pushed = excluded.pushed, synced_at = excluded.synced_at
+                    """, (peer.name, peer_site, json.dumps(peer_seen), pulled, pushed))
+            if not more_outgoing and not response["more"]:
+                break
+        stats["conflicts"] = self._last_conflict() - conflicts
+        stats["seconds"] = time.perf_counter() - started
+        return stats
+
+    def _last_conflict(self):
+        return self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM replica_conflicts").fetchone()[0]
+
+    # Применяет записи чужого журнала одной транзакцией; возвращает число применённых
+    def apply(self, entries):
+        if not entries:
+            return 0
+        changes = {"inserted": [], "updated": [], "deleted": [], "sold": []}
+        applied = []
+        with self.conn:
+            # Время узлов читается уже под блокировкой записи: два потока не применят одну запись дважды
+            self.conn.execute("UPDATE replica_state SET applying = 1")
+            seen = dict(self.conn.execute("SELECT site, clock FROM replica_seen"))
+            clock = self.conn.execute("SELECT clock FROM replica_state").fetchone()[0]
+            for seq, site, entry_clock, table, op, row_site, row_id, data in entries:
+                if site == self.site or entry_clock <= seen.get(site, 0):
+                    continue
+                seen[site] = entry_clock
+                clock = max(clock, entry_clock)
+                handler = self._handlers.get((table, op))
+                if handler is not None:
+                    change = handler((entry_clock, site), row_site, row_id, json.loads(data) if data else None)
+                    if change is not None:
+                        changes[change[0]].append(change[1])
+                applied.append((site, entry_clock, table, op, row_site, row_id, data))
+            # Чужие записи остаются в своём журнале с исходным временем и уходят дальше другим узлам
+            self.conn.executemany(f"INSERT INTO replica_log ({_LOG_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)", applied)
+            self.conn.executemany("""
+                INSERT INTO replica_seen (site, clock) VALUES (?, ?)
+                ON CONFLICT (site) DO UPDATE SET clock = excluded.clock
+            """, seen.items())
+            self.conn.execute("UPDATE replica_state SET clock = ?, applying = 0", (clock,))
+        if self.notify is not None:
+            for kind, car_ids in changes.items():
+                if car_ids:
+                    self.notify(kind, list(dict.fromkeys(car_ids)))
+        return len(applied)
+
+    def _local_id(self, table, site, row_id):
+        row = self.conn.execute("SELECT row_id FROM replica_rows WHERE tbl = ? AND site = ? AND site_row_id = ?",
+                                (table, site, row_id)).fetchone()
+        return row[0] if row else None
+
+    def _map(self, table, local_id, row_site, row_id, stamp):
+        self.conn.execute("INSERT INTO replica_rows VALUES (?, ?, ?, ?, ?, ?)",
+                          (table, local_id, row_site, row_id, stamp[0], stamp[1]))
+
+    def _user(self, username, role):
+        if username is None:
+            return None
+        row = self.conn.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()
+        if row is not None:
+            return row[0]
+        return self.conn.execute("INSERT INTO users (username, password, role) VALUES (?, NULL, ?)",
+                                 (username, role)).lastrowid
+
+    def _insert_car(self, stamp, row_site, row_id, data):
+        if self._local_id("cars", row_site, row_id) is not None:
+            return None
+        car_id = self.conn.execute("""
+            INSERT INTO cars (brand, model, year, price, description, owner_id, status, sold_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (data["brand"], data["model"], data["year"], data["price"], data["description"],
+              self._user(data["owner"], "Продавец"), data["status"] or "available", data["sold_at"])).lastrowid
+        self._map("cars", car_id, row_site, row_id, stamp)
+        return "inserted", car_id
+
+    # Слияние изменения автомобиля: поля, которые нужно записать, или None, если своя версия остаётся.
+    # По умолчанию побеждает более поздняя запись; stamp — (часы Лэмпорта, узел), узел разрешает ничью.
+    def merge_car_update(self, car_id, local_stamp, remote_stamp, data):
+        return data if remote_stamp > local_stamp else None
+
+    def _update_car(self, stamp, row_site, row_id, data):
+        row = self.conn.execute(
+            "SELECT row_id, clock, writer FROM replica_rows WHERE tbl = 'cars' AND site = ? AND site_row_id = ?",
+            (row_site, row_id)
+        ).fetchone()
+        # Автомобиль уже удалён на этом узле
+        if row is None:
+            return None
+        car_id, local_stamp = row[0], (row[1], row[2])
+        values = self.merge_car_update(car_id, local_stamp, stamp, data)
+        if values is None:
+            return None
+        self.conn.execute("UPDATE cars SET brand = ?, model = ?, year = ?, price = ?, description = ? WHERE id = ?",
+                          (values["brand"], values["model"], values["year"], values["price"],
+                           values["description"], car_id))
+        self.conn.execute("UPDATE replica_rows SET clock = ?, writer = ? WHERE tbl = 'cars' AND row_id = ?",
+                          (*max(stamp, local_stamp), car_id))
+        return "updated", car_id
+
+    def _delete_car(self, stamp, row_site, row_id, data):
+        car_id = self._local_id("cars", row_site, row_id)
+        if car_id is None:
+            return None
+        self.conn.execute("DELETE FROM cars WHERE id = ?", (car_id,))
+        return "deleted", car_id
+
+    def _insert_photo(self, stamp, row_site, row_id, data):
+        car_id = self._local_id("cars", data["car_site"], data["car_id"])
+        if car_id is None or self._local_id("photos", row_site, row_id) is not None:
+            return None
+        photo_id = self.conn.execute(
+            "INSERT INTO photos (car_id, filepath, digest, width, height) VALUES (?, ?, ?, ?, ?)",
+            (car_id, data["filepath"], data["digest"], data["width"], data["height"])
+        ).lastrowid
+        self._map("photos", photo_id, row_site, row_id, stamp)
+        return "updated", car_id
+
+    # Продажа одного автомобиля на двух узлах: остаётся продажа с меньшей отметкой, на всех узлах одна и та же
+    def _insert_sale(self, stamp, row_site, row_id, data):
+        if self._local_id("sales", row_site, row_id) is not None:
+            return None
+        car_id = None
+        if data["car_id"] is not None:
+            car_id = self._local_id("cars", data["car_site"], data["car_id"])
+        if car_id is not None:
+            existing = self.conn.execute("""
+                SELECT sales.id, COALESCE(replica_rows.clock, 0), COALESCE(replica_rows.writer, ''),
+                       users.username, sales.price, sales.sold_at
+                FROM sales
+                LEFT JOIN replica_rows ON replica_rows.tbl = 'sales' AND replica_rows.row_id = sales.id
+                LEFT JOIN users ON users.id = sales.buyer_id
+                WHERE sales.car_id = ?
+            """, (car_id,)).fetchone()
+            if existing is not None:
+                local = {"site": existing[2], "buyer": existing[3], "price": existing[4], "sold_at": existing[5]}
+                remote = {"site": stamp[1], "buyer": data["buyer"], "price": data["price"], "sold_at": data["sold_at"]}
+                if (existing[1], existing[2]) < stamp:
+                    self._conflict(car_id, local, remote)
+                    return None
+                self._conflict(car_id, remote, local)
+                self.conn.execute("DELETE FROM sales WHERE id = ?", (existing[0],))
+            self.conn.execute("UPDATE cars SET status = 'sold', sold_at = ? WHERE id = ?", (data["sold_at"], car_id))
+        sale_id = self.conn.execute("""
+            INSERT INTO sales (car_id, buyer_id, seller_id, price, sold_at, brand, model, year)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (car_id, self._user(data["buyer"], "Покупатель"), self._user(data["seller"], "Продавец"),
+              data["price"], data["sold_at"], data["brand"], data["model"], data["year"])).lastrowid
+        self._map("sales", sale_id, row_site, row_id, stamp)
+        return ("sold", car_id) if car_id is not None else None
+
+    def _conflict(self, car_id, kept, lost):
+        self.conn.execute("INSERT INTO replica_conflicts (car_id, kind, kept, lost) VALUES (?, 'sale', ?, ?)",
+                          (car_id, json.dumps(kept, ensure_ascii=False), json.dumps(lost, ensure_ascii=False)))
+
+    # Продажи, отменённые при слиянии: (автомобиль, оставшаяся продажа, отменённая, когда)
+    def conflicts(self, limit=100):
+        return [(car_id, json.loads(kept), json.loads(lost), resolved_at) for car_id, kept, lost, resolved_at in
+                self.conn.execute("""
+                    SELECT car_id, kept, lost, resolved_at FROM replica_conflicts ORDER BY id DESC LIMIT ?
+                """, (limit,))]
+
+
+# Узел — другой файл базы (общая папка, флешка). factory открывает Database на этом файле;
+# соединение открывается на каждую пачку, поэтому обмен можно вести из любого потока пула.
+class FilePeer:
+    def __init__(self, path, factory):
+        self.name = os.path.abspath(path)
+        self.factory = factory
+
+    def exchange(self, entries, after, limit, seen):
+        db = self.factory(self.name)
+        try:
+            return Replica(db.conn, db.notify).exchange(entries, after, limit, seen)
+        finally:
+            db.conn.close()
+
+    def close(self):
+        pass
+
+
+# Узел — сервер хранилища (main.py serve): POST /replication, тело в обе стороны сжато zlib
+class HttpPeer:
+    def __init__(self, url, timeout=60):
+        import http.client
+
+        parts = urlsplit(url)
+        self.name = url
+        self._connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=timeout)
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    # Повтор после обрыва безопасен: уже применённые записи узел отбросит по времени
+    def exchange(self, entries, after, limit, seen):
+        body = zlib.compress(json.dumps({"entries": entries, "after": after, "limit": limit, "seen": seen},
+                                        ensure_ascii=False).encode("utf-8"), COMPRESS_LEVEL)
+        headers = {"Content-Type": "application/json", "Content-Encoding": "deflate"}
+        for attempt in range(2):
+            try:
+                self._connection.request("POST", "/replication", body, headers)
+                response = self._connection.getresponse()
+                data = response.read()
+                break
+            except OSError:
+                self._connection.close()
+                if attempt:
+                    raise
+        if response.status >= 400:
+            raise StorageError(f"{response.status} {response.reason}: {data.decode('utf-8', 'replace')}")
+        self.bytes_sent += len(body)
+        self.bytes_received += len(data)
+        if response.getheader("Content-Encoding") == "deflate":
+            data = zlib.decompress(data)
+        return json.loads(data)
+
+    def close(self):
+        self._connection.close()
+
+
+# Адрес узла из командной строки: http://... — сервер хранилища, иначе путь к файлу базы
+def connect_peer(address, factory):
+    if address.startswith(("http://", "https://")):
+        return HttpPeer(address)
+    return FilePeer(address, factory)
+
+
+# Задача DatabasePool: обмен своей базы с узлом; db — Database потока (или её обёртка)
+def sync_replica(db, peer):
+    return Replica(db.conn, db.notify).sync(peer)
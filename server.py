@@ -0,0 +1,194 @@
+import json
+import threading
+import traceback
+import uuid
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from photo_store import StoredPhoto
+from storage import ERRORS, READ_TABLES, WRITE_TABLES
+
+# Сколько последних изменений автомобилей помнит сервер для опроса клиентами
+CHANGE_LOG_SIZE = 10_000
+
+# Аргументы, которые после JSON нужно вернуть к виду, ожидаемому Database
+ARGUMENT_DECODERS = {
+    "add_photos": lambda car_id, photos: (car_id, [StoredPhoto(*photo) for photo in photos]),
+}
+
+
+# Сервер хранилища: единственный процесс, работающий с файлом базы, для нескольких рабочих мест.
+# Запросы выполняет пул потоков со своим соединением у каждого, как DatabasePool в интерфейсе.
+#   POST /call    {"method", "args", "kwargs"} — один вызов; для чтения ETag и If-None-Match -> 304
+#   POST /batch   {"calls": [...]} — вызовы по порядку на одном соединении, у каждого свой "etag"
+#   GET /changes?since=N — изменения автомобилей после отметки N
+#   POST /replication — пачка обмена журналами реплик (replication.py), тело сжато zlib
+class StorageServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, factory, pool_size=4, change_log_size=CHANGE_LOG_SIZE):
+        super().__init__(address, StorageHandler)
+        self.factory = factory
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="storage",
+                                            initializer=self._init_thread)
+        # Версии таблиц для ETag; instance отличает их от версий до перезапуска сервера
+        self.instance = uuid.uuid4().hex[:8]
+        self.versions = {table: 0 for tables in (*READ_TABLES.values(), *WRITE_TABLES.values())
+                         for table in tables}
+        self.seq = 0
+        self.changes = deque(maxlen=change_log_size)
+        self._lock = threading.Lock()
+
+    def _init_thread(self):
+        self._local.db = self.factory()
+        self._local.db.listeners.append(self._record_change)
+        self._local.changes = []
+
+    def _record_change(self, change):
+        with self._lock:
+            self.seq += 1
+            self.changes.append((self.seq, change))
+        self._local.changes.append(change)
+
+    def etag(self, name):
+        tables = READ_TABLES.get(name)
+        if tables is None:
+            return None
+        return f'"{self.instance}-' + "-".join(str(self.versions[table]) for table in tables) + '"'
+
+    def _bump(self, tables):
+        with self._lock:
+            for table in tables:
+                self.versions[table] += 1
+
+    # calls — (имя, args, kwargs, etag клиента или None); возвращает ответы и изменения автомобилей
+    def execute(self, calls):
+        return self._executor.submit(self._execute, calls).result()
+
+    def _execute(self, calls):
+        db = self._local.db
+        self._local.changes = []
+        results = []
+        for name, args, kwargs, client_etag in calls:
+            # Версия берётся до запроса: запись, зафиксированная во время чтения, сменит ETag
+            etag = self.etag(name)
+            if etag is not None and etag == client_etag:
+                results.append({"not_modified": True})
+                continue
+            try:
+                if name in ARGUMENT_DECODERS:
+                    args = ARGUMENT_DECODERS[name](*args)
+                results.append({"result": getattr(db, name)(*args, **kwargs), "etag": etag})
+            except Exception as error:
+                if type(error).__name__ not in ERRORS:
+                    traceback.print_exception(error)
+                results.append({"error": type(error).__name__, "message": str(error)})
+            finally:
+                if name in WRITE_TABLES:
+                    self._bump(WRITE_TABLES[name])
+        return results, [list(change) for change in self._local.changes]
+
+    # Реплика подключается к базе при первом обмене; применённые записи меняют ETag, как запись клиента
+    def replicate(self, request):
+        return self._executor.submit(self._replicate, request).result()
+
+    def _replicate(self, request):
+        from replication import Replica
+
+        db = self._local.db
+        self._local.changes = []
+        response = Replica(db.conn, db.notify).exchange(request["entries"], request["after"], request["limit"],
+                                                        request["seen"])
+        if response["applied"]:
+            self._bump(("cars", "photos", "sales", "users"))
+        return response
+
+    # Отметка since — строка "экземпляр:номер"; отметка другого запуска сервера или забытые
+    # журналом изменения дают "reset", и клиент перечитывает выборки целиком
+    def changes_since(self, since):
+        with self._lock:
+            token = f"{self.instance}:{self.seq}"
+            if since is None:
+                return {"seq": token, "changes": []}
+            instance, _, number = since.partition(":")
+            number = int(number) if number.isdigit() else -1
+            oldest = self.changes[0][0] if self.changes else self.seq + 1
+            if instance != self.instance or number + 1 < oldest and number < self.seq:
+                return {"seq": token, "changes": [], "reset": True}
+            return {"seq": token, "changes": [list(change) for seq, change in self.changes if seq > number]}
+
+    def server_close(self):
+        super().server_close()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+class StorageHandler(BaseHTTPRequestHandler):
+    # keep-alive: клиент держит одно соединение на поток и не открывает новое на каждый запрос
+    protocol_version = "HTTP/1.1"
+    # Заголовки и тело ответа пишутся отдельно: без этого Nagle и отложенный ACK добавляют ~40 мс
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        try:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if self.headers.get("Content-Encoding") == "deflate":
+                body = zlib.decompress(body)
+            body = json.loads(body or b"{}")
+            if self.path == "/replication":
+                self.send_json(200, self.server.replicate(body), compress=True)
+                return
+            if self.path == "/call":
+                calls = [self.parse_call(body, self.headers.get("If-None-Match"))]
+            elif self.path == "/batch":
+                calls = [self.parse_call(call, call.get("etag")) for call in body["calls"]]
+            else:
+                self.send_json(404, {"error": "NotFound", "message": self.path})
+                return
+        except (ValueError, KeyError, TypeError, zlib.error) as error:
+            self.send_json(400, {"error": "BadRequest", "message": str(error)})
+            return
+        results, changes = self.server.execute(calls)
+        if self.path == "/call" and results[0].get("not_modified"):
+            self.send_json(304, None, etag=calls[0][3])
+            return
+        self.send_json(200, {"results": results, "changes": changes},
+                       etag=results[0].get("etag") if self.path == "/call" else None)
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        if parts.path != "/changes":
+            self.send_json(404, {"error": "NotFound", "message": self.path})
+            return
+        since = parse_qs(parts.query).get("since")
+        self.send_json(200, self.server.changes_since(since[0] if since else None))
+
+    @staticmethod
+    def parse_call(call, etag):
+        name = call["method"]
+        if name not in READ_TABLES and name not in WRITE_TABLES:
+            raise ValueError(f"неизвестный метод {name}")
+        return name, list(call.get("args", ())), dict(call.get("kwargs", {})), etag
+
+    def send_json(self, status, payload, etag=None, compress=False):
+        body = b"" if payload is None else json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        if compress:
+            body = zlib.compress(body)
+        self.send_response(status)
+        if etag:
+            self.send_header("ETag", etag)
+        if compress:
+            self.send_header("Content-Encoding", "deflate")
+        if status != 304:
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    # Каждый запрос в журнал не пишется, ошибки — пишутся
+    def log_request(self, code="-", size="-"):
+        pass
@@ -0,0 +1,67 @@
+import time
+
+# Отметки этапов запуска: (этап, секунд от загрузки этого модуля).
+# Модуль импортируется первым, поэтому остальные модули он подключает только внутри функций.
+STARTED = time.perf_counter()
+marks = []
+
+IMPORT_LINE = r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)"
+PROBE_PREFIX = "STARTUP_MARKS "
+
+
+def mark(name):
+    marks.append((name, time.perf_counter() - STARTED))
+
+
+def print_marks():
+    import json
+
+    print(PROBE_PREFIX + json.dumps(marks, ensure_ascii=False), flush=True)
+
+
+# Модули, импортированные напрямую скриптом, и их суммарное время с зависимостями, мс
+def import_times(stderr):
+    import re
+
+    totals = {}
+    for line in stderr.splitlines():
+        match = re.match(IMPORT_LINE, line)
+        if match and not match.group(3):
+            totals[match.group(4)] = int(match.group(2)) / 1000
+    return totals
+
+
+# Запускает приложение в отдельном процессе с -X importtime до первого кадра окна входа
+# и печатает время импорта по модулям и построения по этапам
+def profile_startup(script, budget_ms, qt_args=()):
+    import json
+    import os
+    import subprocess
+    import sys
+
+    command = [sys.executable, "-X", "importtime", script, "--startup-probe", *qt_args]
+    started = time.perf_counter()
+    probe = subprocess.run(command, capture_output=True, text=True, env=os.environ.copy())
+    total_ms = (time.perf_counter() - started) * 1000
+    probe_marks = []
+    for line in probe.stdout.splitlines():
+        if line.startswith(PROBE_PREFIX):
+            probe_marks = json.loads(line[len(PROBE_PREFIX):])
+    if probe.returncode != 0 or not probe_marks:
+        print(probe.stderr[-2000:], file=sys.stderr)
+        print("Не удалось запустить приложение для замера", file=sys.stderr)
+        return 1
+
+    imports = import_times(probe.stderr)
+    print("Импорт модулей, мс:")
+    for name, ms in sorted(imports.items(), key=lambda item: item[1], reverse=True)[:15]:
+        print(f"  {name:<32} {ms:>8.1f}")
+    print(f"  {'всего':<32} {sum(imports.values()):>8.1f}")
+    print("Этапы запуска, мс:")
+    previous = 0.0
+    for name, seconds in probe_marks:
+        print(f"  {name:<32} {(seconds - previous) * 1000:>8.1f}")
+        previous = seconds
+    verdict = "в пределах" if total_ms <= budget_ms else "ПРЕВЫШАЕТ"
+    print(f"До первого кадра окна входа с запуском интерпретатора: {total_ms:.0f} мс, {verdict} бюджет {budget_ms:.0f} мс")
+    return 0 if total_ms <= budget_ms else 1
@@ -0,0 +1,254 @@
+import json
+from collections import OrderedDict, namedtuple
+from urllib.parse import urlencode, urlsplit
+
+from records import Car, Photo, Sale, User
+
+# Хранилище автомобилей — локальная Database (main.py) или RemoteDatabase, клиент сервера
+# `main.py serve`, которому принадлежит файл базы. У обоих одни и те же методы, а интерфейс
+# вызывает их по имени через DatabasePool и не знает, где находится база.
+
+# Изменение строк таблицы cars: kind — "inserted", "updated", "deleted", "sold"
+# или "reset" (изменения пропущены, выборку нужно перечитать), car_ids — кортеж id
+CarChange = namedtuple("CarChange", "kind car_ids")
+
+# Таблицы, которые читает каждый метод чтения; по их версиям сервер строит ETag ответа
+READ_TABLES = {
+    "get_user": ("users",),
+    "get_car": ("cars",),
+    "get_cars": ("cars",),
+    "list_cars": ("cars", "photos"),
+    "search_cars": ("cars", "photos"),
+    "get_user_cars": ("cars",),
+    "count_user_cars": ("cars",),
+    "list_catalog": ("cars",),
+    "get_thumbnails": ("cars", "photos"),
+    "get_car_photos": ("photos",),
+    "get_purchase_history": ("sales",),
+    "count_purchases": ("sales",),
+    "get_seller_stats": ("sales",),
+    "get_seller_year_stats": ("sales",),
+    "get_brand_stats": ("sales",),
+}
+
+# Таблицы, которые меняет каждый метод записи; после вызова их версии увеличиваются.
+# Вход тоже пишет: устаревший хэш пароля заменяется новым.
+WRITE_TABLES = {
+    "register_user": ("users",),
+    "authenticate_user": ("users",),
+    "add_car": ("cars",),
+    "add_photo": ("photos",),
+    "add_photos": ("photos",),
+    "add_cars_batches": ("cars", "photos"),
+    "update_car": ("cars",),
+    "update_cars": ("cars",),
+    # Удаление обнуляет sales.car_id (ON DELETE SET NULL)
+    "delete_car": ("cars", "photos", "sales"),
+    "buy_car": ("cars", "sales"),
+}
+
+
+# Записи, в которые клиент собирает строки из JSON: списки строк и одиночные строки (или None)
+ROW_RECORDS = {
+    "get_cars": Car,
+    "list_cars": Car,
+    "search_cars": Car,
+    "get_user_cars": Car,
+    "get_car_photos": Photo,
+    "get_purchase_history": Sale,
+}
+RECORDS = {
+    "get_car": Car,
+    "get_user": User,
+    "authenticate_user": User,
+}
+
+
+def as_records(name, result):
+    if name in ROW_RECORDS and result is not None:
+        record = ROW_RECORDS[name]
+        return [record._make(row) for row in result]
+    if name in RECORDS and result is not None:
+        return RECORDS[name]._make(result)
+    return result
+
+
+class PurchaseError(Exception):
+    pass
+
+
+# Непредвиденная ошибка на сервере хранилища
+class StorageError(Exception):
+    pass
+
+
+# Ошибки, которые сервер передаёт по имени: клиент поднимает те же исключения, что и Database
+ERRORS = {"PurchaseError": PurchaseError}
+
+
+# Курсор поверх уже полученных строк: выгрузка читает iter_user_cars порциями, как курсор sqlite3
+class RowCursor:
+    def __init__(self, rows):
+        self._rows = rows
+        self._position = 0
+
+    def fetchmany(self, size):
+        rows = self._rows[self._position:self._position + size]
+        self._position += len(rows)
+        return rows
+
+    def fetchall(self):
+        return self.fetchmany(len(self._rows))
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+
+# Клиент сервера хранилища. Держит одно соединение keep-alive, поэтому в DatabasePool
+# у каждого потока свой экземпляр. Ответы методов чтения запоминаются вместе с ETag:
+# повторный запрос без изменений в базе сервер подтверждает ответом 304 без данных.
+class RemoteDatabase:
+    def __init__(self, url, timeout=30, cache_size=256):
+        import http.client
+
+        parts = urlsplit(url)
+        self.url = url
+        self._connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=timeout)
+        self.listeners = []
+        self.cache_size = cache_size
+        self._cached = OrderedDict()
+        self.not_modified = 0
+
+    def notify(self, kind, car_ids):
+        change = CarChange(kind, tuple(car_ids))
+        for listener in self.listeners:
+            listener(change)
+
+    def close(self):
+        self._connection.close()
+
+    # Повтор после обрыва соединения (перезапуск сервера) только для запросов без записи
+    def _request(self, method, path, payload=None, headers=None, retry=False):
+        body = None if payload is None else json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        headers = dict(headers or {}, **({"Content-Type": "application/json"} if body is not None else {}))
+        for attempt in range(2):
+            try:
+                self._connection.request(method, path, body, headers)
+                response = self._connection.getresponse()
+                data = response.read()
+                break
+            except OSError:
+                self._connection.close()
+                if not retry or attempt:
+                    raise
+        if response.status >= 400:
+            raise StorageError(f"{response.status} {response.reason}: {data.decode('utf-8', 'replace')}")
+        return response.status, response.getheader("ETag"), json.loads(data) if data else None
+
+    def _result(self, item):
+        if "error" in item:
+            error = ERRORS.get(item["error"])
+            if error is None:
+                raise StorageError(f"{item['error']}: {item['message']}")
+            raise error(item["message"])
+        return item["result"]
+
+    def _apply_changes(self, changes):
+        for kind, car_ids in changes:
+            self.notify(kind, car_ids)
+
+    def _remember(self, key, etag, result):
+        self._cached[key] = (etag, result)
+        self._cached.move_to_end(key)
+        while len(self._cached) > self.cache_size:
+            self._cached.popitem(last=False)
+
+    @staticmethod
+    def _key(name, args, kwargs):
+        if name not in READ_TABLES:
+            return None
+        return json.dumps([name, args, kwargs], sort_keys=True, ensure_ascii=False)
+
+    def call(self, name, *args, **kwargs):
+        key = self._key(name, args, kwargs)
+        cached = self._cached.get(key) if key is not None else None
+        headers = {"If-None-Match": cached[0]} if cached is not None else None
+        status, etag, response = self._request("POST", "/call", {"method": name, "args": args, "kwargs": kwargs},
+                                               headers, retry=key is not None)
+        if status == 304:
+            self.not_modified += 1
+            self._cached.move_to_end(key)
+            return cached[1]
+        self._apply_changes(response["changes"])
+        result = as_records(name, self._result(response["results"][0]))
+        if key is not None and etag:
+            self._remember(key, etag, result)
+        return result
+
+    # Несколько вызовов одним запросом и на одном соединении сервера; calls — (имя, args, kwargs).
+    # Возвращает результаты по порядку; ошибка первого неудачного вызова поднимается после всех.
+    def batch(self, calls):
+        calls = [(name, list(args), dict(kwargs)) for name, args, kwargs in calls]
+        keys = [self._key(*call) for call in calls]
+        payload = []
+        for (name, args, kwargs), key in zip(calls, keys):
+            call = {"method": name, "args": args, "kwargs": kwargs}
+            if key in self._cached:
+                call["etag"] = self._cached[key][0]
+            payload.append(call)
+        status, etag, response = self._request("POST", "/batch", {"calls": payload},
+                                               retry=all(key is not None for key in keys))
+        self._apply_changes(response["changes"])
+        results = []
+        error = None
+        for (name, args, kwargs), key, item in zip(calls, keys, response["results"]):
+            if item.get("not_modified"):
+                self.not_modified += 1
+                self._cached.move_to_end(key)
+                results.append(self._cached[key][1])
+                continue
+            try:
+                results.append(as_records(name, self._result(item)))
+            except Exception as failure:
+                error = error or failure
+                results.append(None)
+                continue
+            if key is not None and item.get("etag"):
+                self._remember(key, item["etag"], results[-1])
+        if error is not None:
+            raise error
+        return results
+
+    # Изменения автомобилей с других рабочих мест после отметки since; возвращает новую отметку.
+    # Без отметки только узнаёт текущую. Если журнал сервера уже забыл часть изменений — "reset".
+    def changes_since(self, since=None):
+        path = "/changes" if since is None else "/changes?" + urlencode({"since": since})
+        status, etag, response = self._request("GET", path, retry=True)
+        if since is not None:
+            if response.get("reset"):
+                self.notify("reset", ())
+            self._apply_changes(response["changes"])
+        return response["seq"]
+
+    # Пакеты импорта собираются целиком и уходят одним запросом: на сервере это одна транзакция
+    def add_cars_batches(self, batches, owner_id):
+        return self.call("add_cars_batches", [list(batch) for batch in batches], owner_id)
+
+    def iter_cars(self, exclude_owner=None):
+        return RowCursor(self.get_cars(exclude_owner))
+
+    def iter_user_cars(self, owner_id):
+        return RowCursor(self.get_user_cars(owner_id))
+
+
+def _remote_method(name):
+    def method(self, *args, **kwargs):
+        return self.call(name, *args, **kwargs)
+
+    method.__name__ = method.__qualname__ = name
+    return method
+
+
+for _name in (*READ_TABLES, *WRITE_TABLES):
+    if not hasattr(RemoteDatabase, _name):
+        setattr(RemoteDatabase, _name, _remote_method(_name))
@@ -0,0 +1,51 @@
+import functools
+import os
+
+from PyQt6.QtGui import QColor, QPalette
+
+# Темы оформления. Цвета окон, полей, текста и выделения задаёт палитра приложения, остальное —
+# таблица стилей themes/<тема>.qss. Обе ставятся один раз на всё приложение: у окон своих
+# стилей нет, а ячейки таблиц рисуют делегаты, поэтому смена темы обходит только виджеты окна.
+
+THEMES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "themes")
+THEMES = ("light", "dark")
+
+# Цвета ролей палитры по темам
+PALETTES = {
+    "light": {
+        "Window": "#f4f4f4", "WindowText": "#333333", "Base": "#ffffff", "AlternateBase": "#f9f9f9",
+        "Text": "#333333", "PlaceholderText": "#999999", "Button": "#f4f4f4", "ButtonText": "#333333",
+        "Highlight": "#4CAF50", "HighlightedText": "#ffffff", "ToolTipBase": "#ffffff", "ToolTipText": "#333333",
+    },
+    "dark": {
+        "Window": "#121212", "WindowText": "#ffffff", "Base": "#1e1e1e", "AlternateBase": "#262626",
+        "Text": "#ffffff", "PlaceholderText": "#8a8a8a", "Button": "#1e1e1e", "ButtonText": "#ffffff",
+        "Highlight": "#388e3c", "HighlightedText": "#ffffff", "ToolTipBase": "#1e1e1e", "ToolTipText": "#ffffff",
+    },
+}
+
+
+# Таблица стилей темы читается с диска один раз
+@functools.lru_cache(maxsize=None)
+def stylesheet(name):
+    with open(os.path.join(THEMES_DIR, f"{name}.qss"), encoding="utf-8") as f:
+        return f.read()
+
+
+@functools.lru_cache(maxsize=None)
+def palette(name):
+    result = QPalette()
+    for role, color in PALETTES[name].items():
+        result.setColor(getattr(QPalette.ColorRole, role), QColor(color))
+    return result
+
+
+def next_theme(name):
+    return THEMES[(THEMES.index(name) + 1) % len(THEMES)]
+
+
+# Цвета из таблицы стилей Qt вычисляет при оформлении виджета и за палитрой не следит,
+# поэтому при смене темы меняются обе
+def apply_theme(app, name):
+    app.setPalette(palette(name))
+    app.setStyleSheet(stylesheet(name))
@@ -0,0 +1,110 @@
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+import instrumentation
+
+
+# Передаёт вызовы из рабочих потоков в поток интерфейса через очередь событий Qt
+class _Dispatcher(QObject):
+    call = pyqtSignal(object, tuple)
+
+    def __init__(self):
+        super().__init__()
+        self.call.connect(self._run)
+
+    def _run(self, callback, args):
+        callback(*args)
+
+
+# Сигналы об изменениях базы из любого потока; подписчики получают их в потоке интерфейса
+class DatabaseEvents(QObject):
+    car_changed = pyqtSignal(object)
+
+
+def report_error(error):
+    traceback.print_exception(error)
+
+
+# Задача пула — функция fn(db, *args) или имя метода базы: "add_car" вызывает db.add_car(*args).
+# По имени вызываются методы, одинаковые у Database и RemoteDatabase.
+def call_task(fn, db, args, kwargs):
+    if isinstance(fn, str):
+        return getattr(db, fn)(*args, **kwargs)
+    return fn(db, *args, **kwargs)
+
+
+def task_name(fn):
+    return fn if isinstance(fn, str) else getattr(fn, "__qualname__", repr(fn))
+
+
+# Пул потоков для работы с базой: у каждого потока своё соединение.
+# Задача получает объект базы своего потока первым аргументом (см. call_task).
+class DatabasePool:
+    def __init__(self, factory, max_workers=4):
+        self.factory = factory
+        self._local = threading.local()
+        self._dispatcher = _Dispatcher()
+        self.events = DatabaseEvents()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="db", initializer=self._init_thread
+        )
+
+    def _init_thread(self):
+        self._local.db = self.factory()
+        self._local.db.listeners.append(self.events.car_changed.emit)
+
+    def _deliver(self, callback, *args):
+        self._dispatcher.call.emit(callback, args)
+
+    def run(self, fn, *args, on_result=None, on_error=None, on_progress=None, **kwargs):
+        if on_progress is not None:
+            kwargs["progress"] = lambda *values: self._deliver(on_progress, *values)
+
+        submitted = time.perf_counter()
+
+        def task():
+            started = time.perf_counter()
+            try:
+                result = call_task(fn, self._local.db, args, kwargs)
+            except Exception as error:
+                self._deliver(on_error or report_error, error)
+                raise
+            finally:
+                if instrumentation.enabled:
+                    instrumentation.record_task(task_name(fn), started - submitted, time.perf_counter() - started)
+            if on_result is not None:
+                self._deliver(on_result, result)
+            return result
+
+        return self._executor.submit(task)
+
+    # Соединения потоков закрываются вместе с завершением самих потоков
+    def shutdown(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+# Синхронная замена пула с тем же интерфейсом: задачи выполняются сразу в текущем потоке
+class ImmediateRunner:
+    def __init__(self, db):
+        self.db = db
+        self.events = DatabaseEvents()
+        db.listeners.append(self.events.car_changed.emit)
+
+    def run(self, fn, *args, on_result=None, on_error=None, on_progress=None, **kwargs):
+        if on_progress is not None:
+            kwargs["progress"] = on_progress
+        try:
+            result = call_task(fn, self.db, args, kwargs)
+        except Exception as error:
+            (on_error or report_error)(error)
+            return None
+        if on_result is not None:
+            on_result(result)
+        return None
+
+    def shutdown(self):
+        pass